@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.redis import get_async_redis, get_redis
+
+logger = logging.getLogger(__name__)
+
+POST = "post"
+CATEGORY = "category"
+
+IMPRESSIONS = "impressions"
+CLICKS = "clicks"
+# Clicks already written to the lifetime totals, only kept for the rollups
+CLICK_ROLLUPS = "click_rollups"
+# Raw views per bucket for live analytics (apps.blog.live), never synced, they just expire
+LIVE_VIEWS = "live_views"
+
+# Counters go into one hash per kind, counter and time bucket
+COUNTER_BUCKET_SECONDS = getattr(settings, "BLOG_COUNTER_BUCKET_SECONDS", 60)
+# View events are appended to one stream per kind and drained by sync_view_events_to_db.
+# The stream is capped (approximately) at this length, the oldest views are dropped first
+VIEW_STREAM_MAXLEN = getattr(settings, "BLOG_VIEW_STREAM_MAXLEN", 1_000_000)
+VIEW_STREAM_GROUP = "view_counters"
+
+# Events fired by async views, referenced until they finish so they are not collected
+_background_tasks = set()
+
+# Client timestamps older than this are counted as if they happened this long ago
+EVENT_MAX_AGE_SECONDS = getattr(settings, "BLOG_ANALYTICS_EVENT_MAX_AGE", 60 * 60)
+
+
+def current_bucket(now=None):
+    return int((now if now is not None else time.time()) // COUNTER_BUCKET_SECONDS)
+
+
+def parse_event_timestamp(value):
+    """
+    Return the epoch seconds of a client timestamp (ISO 8601, seconds or milliseconds).
+
+    Client clocks are not trusted: the result is clamped between
+    EVENT_MAX_AGE_SECONDS ago and now. Invalid values raise ValueError.
+    """
+    now = time.time()
+    if value is None:
+        return now
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        timestamp = value / 1000 if value > 1e11 else float(value)
+    elif isinstance(value, str):
+        moment = parse_datetime(value)
+        if moment is None:
+            raise ValueError(value)
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        timestamp = moment.timestamp()
+    else:
+        raise ValueError(value)
+    return min(now, max(now - EVENT_MAX_AGE_SECONDS, timestamp))
+
+
+def counter_key(kind, counter, bucket):
+    return f"{kind}:{counter}:{bucket}"
+
+
+def counter_buckets_key(kind, counter):
+    # Set of buckets that still hold counters waiting to be synced
+    return f"{kind}:{counter}_buckets"
+
+
+def view_stream_key(kind):
+    return f"{kind}:view_stream"
+
+
+def add_view(pipe, kind, object_id, ip_address):
+    # ``pipe`` may be a sync or an async pipeline. Views without a valid
+    # client address (see get_client_ip) can't be deduplicated, they only
+    # show up in the live counts
+    if ip_address:
+        pipe.xadd(
+            view_stream_key(kind),
+            {"id": str(object_id), "ip": ip_address},
+            maxlen=VIEW_STREAM_MAXLEN,
+            approximate=True,
+        )
+    live_key = counter_key(kind, LIVE_VIEWS, current_bucket())
+    pipe.hincrby(live_key, str(object_id), 1)
+    pipe.expire(live_key, COUNTER_BUCKET_SECONDS * 3)
+
+
+def queue_counters(pipe, counts):
+    """Queue HINCRBYs for ``{(kind, counter, bucket, object_id): count}`` on ``pipe``."""
+    buckets = set()
+    for (kind, counter, bucket, object_id), count in counts.items():
+        pipe.hincrby(counter_key(kind, counter, bucket), object_id, count)
+        buckets.add((kind, counter, bucket))
+    for kind, counter, bucket in buckets:
+        pipe.sadd(counter_buckets_key(kind, counter), bucket)
+
+
+def record_counters(kind, counter, object_ids):
+    """
+    Add one to ``counter`` for every object in ``object_ids``.
+
+    All counters go out in a single pipelined round trip (one HINCRBY per
+    distinct object into the current bucket), whatever the page size.
+    Analytics must never break a response, so Redis errors are only logged;
+    the return value tells whether the counters were recorded.
+    """
+    bucket = current_bucket()
+    counts = Counter((kind, counter, bucket, str(object_id)) for object_id in object_ids)
+    if not counts:
+        return True
+
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        queue_counters(pipe, counts)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Error recording {kind} {counter}: {e}")
+        return False
+    return True
+
+
+def record_events(counters=(), views=()):
+    """
+    Enqueue a batch of analytics events in a single pipelined round trip.
+
+    ``counters`` holds ``(kind, counter, object_id, timestamp)`` tuples, each
+    counted in the bucket of its timestamp; ``views`` holds
+    ``(kind, object_id, ip_address)`` tuples for the view stream.
+    """
+    counts = Counter(
+        (kind, counter, current_bucket(timestamp), str(object_id))
+        for kind, counter, object_id, timestamp in counters
+    )
+    if not counts and not views:
+        return
+
+    pipe = get_redis().pipeline(transaction=False)
+    queue_counters(pipe, counts)
+    for kind, object_id, ip_address in views:
+        add_view(pipe, kind, object_id, ip_address)
+    pipe.execute()
+
+
+def record_view(kind, object_id, ip_address):
+    """Append one view to the stream, a single round trip on the request path."""
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        add_view(pipe, kind, object_id, ip_address)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Error recording {kind} view: {e}")
+
+
+def fire_and_forget(coroutine):
+    """Run ``coroutine`` on the running event loop without waiting for it."""
+    task = asyncio.get_running_loop().create_task(coroutine)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+async def arecord_counters(kind, counter, object_ids):
+    """record_counters for async views, the same pipeline through redis.asyncio."""
+    bucket = current_bucket()
+    counts = Counter((kind, counter, bucket, str(object_id)) for object_id in object_ids)
+    if not counts:
+        return
+
+    try:
+        pipe = get_async_redis().pipeline(transaction=False)
+        queue_counters(pipe, counts)
+        await pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Error recording {kind} {counter}: {e}")
+
+
+async def arecord_view(kind, object_id, ip_address):
+    try:
+        pipe = get_async_redis().pipeline(transaction=False)
+        add_view(pipe, kind, object_id, ip_address)
+        await pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Error recording {kind} view: {e}")
+
+
+def record_post_impressions(post_ids):
+    record_counters(POST, IMPRESSIONS, post_ids)
+
+
+def record_category_impressions(category_ids):
+    record_counters(CATEGORY, IMPRESSIONS, category_ids)
+
+
+def record_post_clicks(post_ids):
+    return record_counters(POST, CLICKS, post_ids)
+
+
+def record_category_clicks(category_ids):
+    return record_counters(CATEGORY, CLICKS, category_ids)
@@ -0,0 +1,420 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import (
+    APIException,
+    AuthenticationFailed,
+    MethodNotAllowed,
+    NotAuthenticated,
+    NotFound,
+    Throttled,
+)
+from rest_framework.renderers import JSONRenderer
+from rest_framework.views import exception_handler
+from rest_framework_api.pagination import CustomPagination
+from rest_framework_api.serializers import APIResponseSerializer
+
+from core.ratelimit import acheck_rate_limit
+
+from .analytics import CATEGORY, IMPRESSIONS, POST, arecord_counters, arecord_view, fire_and_forget
+from .cache import (
+    CACHE_TIMEOUT,
+    CATEGORIES,
+    LIST_CACHE_TIMEOUT,
+    POST_DETAIL_TIMEOUT,
+    POST_LISTS,
+    VIEW_COUNTS,
+    aget,
+    aget_generations,
+    aget_many,
+    aget_post_fragments,
+    apost_fragment_keys,
+    aset_id_list,
+    aset_post_fragments,
+    category_list_key,
+    category_list_namespaces,
+    category_posts_key,
+    post_detail_key,
+    post_id_key,
+    post_list_key,
+    post_namespace,
+    post_toc_key,
+)
+from .compression import negotiate_encoding, render_variants, variant_response
+from .conditional import get_validators, set_validators
+from .models import Post
+from .pagination import PostCursorPagination, is_cursor_request
+from .queries import (
+    acategory_posts,
+    filter_categories,
+    filter_posts,
+    post_detail_queryset,
+    post_list_queryset,
+    sort_posts,
+)
+from .serializers import (
+    CategoryListSerializer,
+    PostListSerializer,
+    PostSerializer,
+    acategory_list_rows,
+    apost_list_rows,
+)
+from .utils import get_client_ip
+from .views import SLUG_LOOKUPS
+
+
+async def aserialize_posts(post_ids, *generations):
+    """serialize_posts for async views, same fragments and payloads."""
+    keys = await apost_fragment_keys(post_ids, *generations)
+    fragments = await aget_post_fragments(keys)
+    missing = [post_id for post_id in post_ids if post_id not in fragments]
+
+    if missing:
+        if getattr(settings, "BLOG_FAST_LIST_SERIALIZERS", True):
+            posts = await apost_list_rows(Post.postobjects.filter(id__in=missing))
+        else:
+            queryset = post_list_queryset().filter(id__in=missing)
+            posts = await sync_to_async(lambda: PostListSerializer(queryset, many=True).data)()
+        fresh = {str(post["id"]): dict(post) for post in posts}
+        await aset_post_fragments(fresh, keys)
+        fragments.update(fresh)
+
+    return [fragments[post_id] for post_id in post_ids if post_id in fragments]
+
+async def aresolve_ids(kind, slugs):
+    """resolve_ids for async views."""
+    manager, key_function = SLUG_LOOKUPS[kind]
+    keys = {key_function(slug): slug for slug in set(slugs)}
+    ids = {keys[key]: object_id for key, object_id in (await aget_many(keys.keys())).items()}
+
+    missing = [slug for slug in keys.values() if slug not in ids]
+    if missing:
+        found = {slug: str(pk) async for slug, pk in manager.filter(slug__in=missing).values_list("slug", "id")}
+        await cache.aset_many({key_function(slug): pk for slug, pk in found.items()}, timeout=CACHE_TIMEOUT)
+        ids.update(found)
+
+    return ids
+
+async def aget_category_id(slug):
+    category_id = (await aresolve_ids(CATEGORY, [slug])).get(slug)
+    if category_id is None:
+        raise NotFound(detail="The requested category does not exist")
+    return category_id
+
+class AsyncAPIView(View):
+    """
+    Async counterpart of StandardAPIView for the read endpoints under ASGI.
+
+    Same URLs, parameters, caches and payloads as the views in
+    apps.blog.views, but a cache hit never leaves the event loop: the API key
+    check is one async EVALSHA (see core.ratelimit), cache reads go through
+    redis.asyncio (see apps.blog.cache) and analytics are fired in the
+    background. Misses use the async ORM. Responses are always compact JSON,
+    the browsable API stays on the sync views.
+    """
+
+    rate_limit_scope = None
+    renderer = JSONRenderer()
+    validators = None
+
+    def get_rate_limit_scope(self, request):
+        return self.rate_limit_scope
+
+    async def dispatch(self, request, *args, **kwargs):
+        # The helpers shared with the DRF views read request.query_params
+        request.query_params = request.GET
+        try:
+            await self.check_api_key(request)
+            response = await super().dispatch(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(request, exc)
+
+        response.headers["Allow"] = ", ".join(self._allowed_methods())
+        patch_vary_headers(response, ("Accept",))
+        return set_validators(response, self.validators)
+
+    async def check_api_key(self, request):
+        # Same rules as core.permissions.HasValidAPIKey
+        api_key = request.headers.get("API-Key")
+        if api_key not in getattr(settings, "VALID_API_KEYS", []):
+            raise NotAuthenticated()
+
+        wait = await acheck_rate_limit(api_key, self.get_rate_limit_scope(request))
+        if wait:
+            raise Throttled(wait=wait)
+
+    def handle_exception(self, request, exc):
+        if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+            # No authenticator sends WWW-Authenticate, DRF answers with a 403 too
+            exc.status_code = status.HTTP_403_FORBIDDEN
+        response = exception_handler(exc, {"view": self, "request": request})
+        if response is None:
+            raise exc
+        headers = {name: value for name, value in response.headers.items() if name != "Content-Type"}
+        return self.render(response.data, response.status_code, headers)
+
+    async def http_method_not_allowed(self, request, *args, **kwargs):
+        raise MethodNotAllowed(request.method)
+
+    def not_modified(self, request, *generations, variant=""):
+        self.validators = get_validators(request, *generations, variant=variant)
+        etag, last_modified = self.validators
+        return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+    def render(self, data, status=status.HTTP_200_OK, headers=None):
+        return HttpResponse(self.renderer.render(data), status=status, headers=headers, content_type="application/json")
+
+    def response(self, data=None):
+        return self.render(APIResponseSerializer({"success": True, "status": status.HTTP_200_OK, "results": data}).data)
+
+    def error(self, error):
+        serializer = APIResponseSerializer({"success": False, "status": status.HTTP_400_BAD_REQUEST, "error": error})
+        return self.render(serializer.data, status.HTTP_400_BAD_REQUEST)
+
+    def paginate(self, request, data):
+        """StandardAPIView.paginate, returning the payload to render."""
+        try:
+            paginator = CustomPagination()
+            paginated_data = paginator.paginate_data(data, request)
+            serializer = APIResponseSerializer(
+                {
+                    "success": True,
+                    "status": status.HTTP_200_OK,
+                    "results": paginated_data,
+                    "count": paginator.count,
+                    "next": paginator.get_next_link(),
+                    "previous": paginator.get_previous_link(),
+                }
+            )
+        except Exception as e:
+            serializer = APIResponseSerializer(
+                {
+                    "success": False,
+                    "status": status.HTTP_400_BAD_REQUEST,
+                    "error": str(e),
+                }
+            )
+        return serializer.data
+
+class AsyncPostIDListView(AsyncAPIView):
+    """Paginates post IDs and only hydrates the requested page."""
+
+    async def hydrate_page(self, page_ids, generations):
+        serialized_posts = await aserialize_posts(page_ids, generations[CATEGORIES], generations[VIEW_COUNTS])
+        fire_and_forget(arecord_counters(POST, IMPRESSIONS, page_ids))
+        return serialized_posts
+
+    async def paginate_posts(self, request, post_ids, generations):
+        data = self.paginate(request, post_ids)
+        if data["success"]:
+            data["results"] = await self.hydrate_page(data["results"], generations)
+        return self.render(data, data["status"])
+
+    async def paginate_posts_by_cursor(self, request, posts, generations, sorting=None, ordering=None):
+        paginator = PostCursorPagination(sorting, ordering)
+        page_ids, next_cursor = await paginator.apaginate_queryset(posts, request)
+        serializer = APIResponseSerializer(
+            {
+                "success": True,
+                "status": status.HTTP_200_OK,
+                "results": await self.hydrate_page(page_ids, generations),
+                "next": paginator.get_next_link(request, next_cursor),
+                "previous": None,
+            }
+        )
+        return self.render(serializer.data)
+
+class AsyncPostListView(AsyncPostIDListView):
+
+    def get_rate_limit_scope(self, request):
+        return "search" if request.query_params.get("search", "").strip() else None
+
+    async def get(self, request):
+        try:
+            search = request.query_params.get("search", "").strip()
+            sorting = request.query_params.get("sorting", None)
+            ordering = request.query_params.get("ordering", None)
+            categories = request.query_params.getlist("categories", None)
+
+            generations = await aget_generations(POST_LISTS, CATEGORIES, VIEW_COUNTS)
+            not_modified = self.not_modified(request, *generations.values())
+            if not_modified:
+                return not_modified
+
+            if is_cursor_request(request):
+                posts = filter_posts(Post.postobjects.all(), search, categories)
+                return await self.paginate_posts_by_cursor(request, posts, generations, sorting, ordering)
+
+            cache_key = post_list_key(search, sorting, ordering, categories, generations[POST_LISTS], generations[VIEW_COUNTS])
+            post_ids = await aget(cache_key)
+            if post_ids is None:
+                posts = sort_posts(filter_posts(Post.postobjects.all(), search, categories), search, sorting, ordering)
+                post_ids = [post_id async for post_id in posts.values_list("id", flat=True)]
+
+                if not post_ids and not await Post.postobjects.aexists():
+                    raise NotFound(detail="No posts found")
+
+                post_ids = await aset_id_list(cache_key, post_ids)
+
+            return await self.paginate_posts(request, post_ids, generations)
+
+        except APIException:
+            raise
+        except Exception as e:
+            raise APIException(detail=str(e))
+
+class AsyncCategoryDetailView(AsyncPostIDListView):
+
+    async def get(self, request):
+        try:
+            slug = request.query_params.get("slug", None)
+
+            if not slug:
+                return self.error("Category slug is required")
+
+            include_descendants = request.query_params.get("include_descendants", "").lower() in ("1", "true", "yes")
+            generations = await aget_generations(POST_LISTS, CATEGORIES, VIEW_COUNTS)
+            not_modified = self.not_modified(request, *generations.values())
+            if not_modified:
+                return not_modified
+
+            if is_cursor_request(request):
+                posts = await acategory_posts(await aget_category_id(slug), include_descendants)
+                return await self.paginate_posts_by_cursor(
+                    request,
+                    posts,
+                    generations,
+                    request.query_params.get("sorting", None),
+                    request.query_params.get("ordering", None),
+                )
+
+            cache_key = category_posts_key(slug, generations[POST_LISTS], include_descendants)
+            post_ids = await aget(cache_key)
+            if post_ids is None:
+                posts = await acategory_posts(await aget_category_id(slug), include_descendants)
+                post_ids = [post_id async for post_id in posts.values_list("id", flat=True)]
+
+                if not post_ids:
+                    raise NotFound(detail="No posts found in this category")
+
+                post_ids = await aset_id_list(cache_key, post_ids)
+
+            return await self.paginate_posts(request, post_ids, generations)
+
+        except APIException:
+            raise
+        except Exception as e:
+            raise APIException(detail=str(e))
+
+class AsyncPostDetailView(AsyncAPIView):
+
+    async def get(self, request):
+        ip_address = get_client_ip(request)
+        slug = request.query_params.get("slug")
+
+        try:
+            post_generation = post_namespace(slug)
+            generations = await aget_generations(post_generation, CATEGORIES, VIEW_COUNTS)
+            encoding = negotiate_encoding(request)
+
+            # a revalidation still counts as a view, the ID comes from the cache
+            not_modified = self.not_modified(request, *generations.values(), variant=encoding)
+            if not_modified:
+                post_id = await aget(post_id_key(slug))
+                if post_id:
+                    fire_and_forget(arecord_view(POST, post_id, ip_address))
+                return not_modified
+
+            cache_key = post_detail_key(slug, generations[post_generation], generations[CATEGORIES], generations[VIEW_COUNTS])
+            cached_post = await aget(cache_key)
+            if not cached_post:
+                post = await post_detail_queryset().aget(slug=slug)
+                serializer = APIResponseSerializer(
+                    {"success": True, "status": status.HTTP_200_OK, "results": PostSerializer(post).data}
+                )
+                cached_post = {"id": str(post.id), **render_variants(serializer.data)}
+                await cache.aset_many(
+                    {cache_key: cached_post, post_id_key(slug): str(post.id)},
+                    timeout=POST_DETAIL_TIMEOUT,
+                )
+
+            fire_and_forget(arecord_view(POST, cached_post["id"], ip_address))
+
+        except Post.DoesNotExist:
+            raise NotFound(
+                detail="The requested article is not available or does not exist"
+            )
+        except Exception as e:
+            raise APIException(detail=str(e))
+
+        return variant_response(cached_post, encoding)
+
+class AsyncPostHeadingsView(AsyncAPIView):
+
+    async def get(self, request):
+        post_slug = request.query_params.get("slug")
+
+        post_generation = post_namespace(post_slug)
+        generation = (await aget_generations(post_generation))[post_generation]
+        not_modified = self.not_modified(request, generation)
+        if not_modified:
+            return not_modified
+
+        cache_key = post_toc_key(post_slug, generation)
+        toc = await aget(cache_key)
+        if toc is None:
+            toc = await Post.objects.filter(slug=post_slug).values_list("toc", flat=True).afirst() or []
+            await cache.aset(cache_key, toc, timeout=CACHE_TIMEOUT)
+
+        return self.response(toc)
+
+class AsyncCategoryListView(AsyncAPIView):
+
+    def get_rate_limit_scope(self, request):
+        return "search" if request.query_params.get("search", "").strip() else None
+
+    async def get(self, request):
+        try:
+            parent_slug = request.query_params.get("parent_slug", None)
+            search = request.query_params.get("search", "").strip()
+            sorting = request.query_params.get("sorting", None)
+            ordering = request.query_params.get("ordering", None)
+
+            generations = await aget_generations(*category_list_namespaces(sorting))
+            not_modified = self.not_modified(request, *generations.values())
+            if not_modified:
+                return not_modified
+
+            cache_key = category_list_key(search, sorting, ordering, parent_slug, *generations.values())
+            serialized_categories = await aget(cache_key)
+
+            if serialized_categories is None:
+                categories, all_categories = filter_categories(
+                    parent_slug, search, sorting, ordering, CategoryListSerializer.Meta.fields
+                )
+
+                if getattr(settings, "BLOG_FAST_LIST_SERIALIZERS", True):
+                    serialized_categories = await acategory_list_rows(categories)
+                else:
+                    serialized_categories = await sync_to_async(
+                        lambda: [dict(category) for category in CategoryListSerializer(categories, many=True).data]
+                    )()
+
+                if not serialized_categories and (search == "" or not await all_categories.aexists()):
+                    raise NotFound(detail="No categories found")
+
+                await cache.aset(cache_key, serialized_categories, timeout=LIST_CACHE_TIMEOUT)
+
+            data = self.paginate(request, serialized_categories)
+            if data["success"]:
+                fire_and_forget(arecord_counters(CATEGORY, IMPRESSIONS, [category["id"] for category in data["results"]]))
+            return self.render(data, data["status"])
+
+        except NotFound:
+            raise
+        except Exception as e:
+            raise APIException(detail=str(e))
@@ -0,0 +1,288 @@
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django_redis.client import DefaultClient
+
+from core.redis import get_async_redis
+
+# Keys are invalidated through generation counters, so they can live for hours
+CACHE_TIMEOUT = getattr(settings, "BLOG_CACHE_TIMEOUT", 60 * 60 * 6)
+LIST_CACHE_TIMEOUT = CACHE_TIMEOUT
+POST_FRAGMENT_TIMEOUT = CACHE_TIMEOUT
+POST_DETAIL_TIMEOUT = CACHE_TIMEOUT
+# The view stream drain bumps VIEW_COUNTS at most this often, so view counts
+# and most_viewed orderings lag by up to this much (plus a drain)
+VIEW_COUNT_MAX_AGE = getattr(settings, "BLOG_VIEW_COUNT_MAX_AGE", 60 * 5)
+
+# Generation namespaces
+POST_LISTS = "post_lists"  # post_list:* and category_post:* (membership and order)
+CATEGORIES = "categories"  # category_list:* and anything embedding a category
+# category_list:* and category_tree also depend on POST_LISTS through the post counters
+VIEW_COUNTS = "view_counts"  # view_count in post fragments and details, most_viewed orderings
+
+
+def post_namespace(slug):
+    # post_detail_response:{slug} and other per-post payloads
+    return f"post:{slug}"
+
+
+def post_fragment_namespace(post_id):
+    # post_fragment:{id}. Bumped rather than deleted on edits: a miss that read
+    # the row before the commit can then only write an orphaned key
+    return f"post_fragment:{post_id}"
+
+
+def generation_key(namespace):
+    return f"generation:{namespace}"
+
+
+def get_generations(*namespaces):
+    """
+    Return the current generation of each namespace, in a single round trip.
+
+    Missing counters are seeded from the clock rather than 1, so a counter
+    that gets evicted can never come back at a value old keys were built with.
+    """
+    keys = [generation_key(namespace) for namespace in namespaces]
+    generations = cache.get_many(keys)
+
+    missing = [key for key in keys if key not in generations]
+    if missing:
+        for key in missing:
+            cache.add(key, time.time_ns(), timeout=None)
+        generations.update(cache.get_many(missing))
+
+    return {namespace: generations[key] for namespace, key in zip(namespaces, keys)}
+
+
+async def aget_generations(*namespaces):
+    """get_generations for async views, seeding missing counters is left to the sync version."""
+    keys = [generation_key(namespace) for namespace in namespaces]
+    generations = await aget_many(keys)
+    if len(generations) < len(keys):
+        return await sync_to_async(get_generations)(*namespaces)
+    return {namespace: generations[key] for namespace, key in zip(namespaces, keys)}
+
+
+def bump_generation(*namespaces):
+    """
+    Orphan every key built on ``namespaces`` by moving them to a new generation.
+
+    The new generation is the time of the change in nanoseconds (never lower
+    than the previous one plus one), so it doubles as a Last-Modified date.
+    """
+    now = time.time_ns()
+    keys = [generation_key(namespace) for namespace in namespaces]
+    current = cache.get_many(keys)
+    cache.set_many({key: max(now, current.get(key, 0) + 1) for key in keys}, timeout=None)
+
+
+def touch_view_counts(changed=True):
+    """
+    Note that view counts changed and bump VIEW_COUNTS, unless it was
+    bumped less than VIEW_COUNT_MAX_AGE ago. Changes skipped that way stay
+    pending and are published by the next call after that, changed or not.
+    """
+    if changed:
+        cache.set("view_counts:pending", 1, timeout=None)
+    elif not cache.get("view_counts:pending"):
+        return False
+    if not cache.add("view_counts:bumped", 1, timeout=VIEW_COUNT_MAX_AGE):
+        return False
+    cache.delete("view_counts:pending")
+    bump_generation(VIEW_COUNTS)
+    return True
+
+
+def versioned(key, *generations):
+    return f"{key}:g{'.'.join(str(generation) for generation in generations)}"
+
+
+def _digest(*parts):
+    raw = "|".join(str(part) for part in parts)
+    return hashlib.md5(raw.encode("utf-8")).hexdigest()
+
+
+def normalize_search(search):
+    # "Django  ORM" and "django orm" share the same cached result
+    return " ".join(search.split()).lower()
+
+
+def post_list_key(search, sorting, ordering, categories, generation, views_generation):
+    categories = ",".join(sorted(set(categories or [])))
+    # only most_viewed is ordered by the view counts
+    generations = (generation, views_generation) if sorting == "most_viewed" else (generation,)
+    return versioned(
+        f"post_list:{_digest(normalize_search(search), sorting, ordering, categories)}",
+        *generations,
+    )
+
+
+def category_posts_key(slug, generation, include_descendants=False):
+    scope = ":tree" if include_descendants else ""
+    return versioned(f"category_post:{slug}{scope}", generation)
+
+
+def category_tree_key(*generations):
+    return versioned("category_tree", *generations)
+
+
+def category_list_namespaces(sorting):
+    # post counts change with every publish, so lists follow POST_LISTS too,
+    # and the most_viewed ordering follows the view counts
+    if sorting == "most_viewed":
+        return CATEGORIES, POST_LISTS, VIEW_COUNTS
+    return CATEGORIES, POST_LISTS
+
+
+def category_list_key(search, sorting, ordering, parent_slug, *generations):
+    return versioned(
+        f"category_list:{_digest(normalize_search(search), sorting, ordering, parent_slug)}",
+        *generations,
+    )
+
+
+def post_detail_key(slug, post_generation, categories_generation, views_generation):
+    # Rendered response bodies, see apps.blog.compression
+    return versioned(f"post_detail_response:{slug}", post_generation, categories_generation, views_generation)
+
+
+def post_toc_key(slug, post_generation):
+    return versioned(f"post_toc:{slug}", post_generation)
+
+
+def post_fragment_key(post_id, post_generation, *generations):
+    return versioned(f"post_fragment:{post_id}", post_generation, *generations)
+
+
+def post_id_key(slug):
+    # slug -> id lookups used to buffer analytics without touching the database
+    return f"post_id:{slug}"
+
+
+def category_id_key(slug):
+    return f"category_id:{slug}"
+
+
+def get_id_list(key):
+    """Return the cached ordered list of IDs for ``key`` or None on a miss."""
+    return cache.get(key)
+
+
+def set_id_list(key, ids):
+    ids = [str(pk) for pk in ids]
+    cache.set(key, ids, timeout=LIST_CACHE_TIMEOUT)
+    return ids
+
+
+def fragment_keys(post_ids, post_generations, generations):
+    return {
+        str(pk): post_fragment_key(pk, post_generations[post_fragment_namespace(pk)], *generations)
+        for pk in post_ids
+    }
+
+
+def post_fragment_keys(post_ids, *generations):
+    """
+    Return ``{post_id: key}`` of the current fragment of every post, built
+    on its own generation and the shared ``generations`` (see PostIDListAPIView).
+
+    The generations of all the posts are read in one round trip, and must
+    be read before the rows so a miss never stores an old row under a new key.
+    """
+    post_generations = get_generations(*(post_fragment_namespace(pk) for pk in post_ids))
+    return fragment_keys(post_ids, post_generations, generations)
+
+
+def get_post_fragments(keys):
+    """Fetch serialized posts in a single round trip, keyed by post ID."""
+    cached = cache.get_many(keys.values())
+    return {pk: cached[key] for pk, key in keys.items() if key in cached}
+
+
+def set_post_fragments(fragments, keys):
+    cache.set_many(
+        {keys[pk]: fragment for pk, fragment in fragments.items()},
+        timeout=POST_FRAGMENT_TIMEOUT,
+    )
+
+
+def invalidate_post(post_id, *slugs):
+    """Called when a post changes: orphan its fragment and dependent keys."""
+    slugs = set(slug for slug in slugs if slug)
+    cache.delete_many([post_id_key(slug) for slug in slugs])
+    bump_generation(POST_LISTS, post_fragment_namespace(post_id), *(post_namespace(slug) for slug in slugs))
+
+
+def invalidate_posts(posts):
+    """invalidate_post for many ``(slug, post_id)`` pairs, in a few round trips."""
+    posts = list(posts)
+    cache.delete_many([post_id_key(slug) for slug, post_id in posts])
+    bump_generation(
+        POST_LISTS,
+        *(post_fragment_namespace(post_id) for slug, post_id in posts),
+        *(post_namespace(slug) for slug, post_id in posts),
+    )
+
+
+def invalidate_category(slug=None):
+    # Category data is embedded in post fragments and details, and its slug
+    # drives category_post:* lookups
+    if slug:
+        cache.delete(category_id_key(slug))
+    bump_generation(CATEGORIES, POST_LISTS)
+
+
+# Async reads. django-redis has no async API (Django's default runs every call
+# in a thread), so with its default client the MGET goes through redis.asyncio
+# with the same keys and serializer. Writes only happen on misses and go
+# through Django's async API.
+
+def cache_redis_url():
+    # The first (write) server of the default cache, as django-redis parses LOCATION
+    location = settings.CACHES["default"]["LOCATION"]
+    if isinstance(location, str):
+        location = location.split(",")
+    return location[0].strip()
+
+
+async def aget_many(keys):
+    keys = list(keys)
+    client = getattr(cache, "client", None)
+    if type(client) is not DefaultClient:
+        return await cache.aget_many(keys)
+    if not keys:
+        return {}
+
+    values = await get_async_redis(cache_redis_url()).mget([client.make_key(key) for key in keys])
+    return {key: client.decode(value) for key, value in zip(keys, values) if value is not None}
+
+
+async def aget(key, default=None):
+    return (await aget_many([key])).get(key, default)
+
+
+async def apost_fragment_keys(post_ids, *generations):
+    post_generations = await aget_generations(*(post_fragment_namespace(pk) for pk in post_ids))
+    return fragment_keys(post_ids, post_generations, generations)
+
+
+async def aget_post_fragments(keys):
+    cached = await aget_many(keys.values())
+    return {pk: cached[key] for pk, key in keys.items() if key in cached}
+
+
+async def aset_post_fragments(fragments, keys):
+    await cache.aset_many(
+        {keys[pk]: fragment for pk, fragment in fragments.items()},
+        timeout=POST_FRAGMENT_TIMEOUT,
+    )
+
+
+async def aset_id_list(key, ids):
+    ids = [str(pk) for pk in ids]
+    await cache.aset(key, ids, timeout=LIST_CACHE_TIMEOUT)
+    return ids
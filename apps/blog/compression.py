@@ -0,0 +1,80 @@
+import gzip
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only without it
+    brotli = None
+
+IDENTITY = "identity"
+GZIP = "gzip"
+BROTLI = "br"
+
+# Smaller payloads are not worth compressing (nor the extra cache space)
+MIN_COMPRESS_SIZE = getattr(settings, "BLOG_MIN_COMPRESS_SIZE", 512)
+
+
+def available_encodings():
+    # Preferred first
+    return (BROTLI, GZIP) if brotli is not None else (GZIP,)
+
+
+def render_variants(data):
+    """
+    Render ``data`` to JSON once, plus every compressed variant.
+
+    The compression levels favour size over speed: this only runs when the
+    cache is filled, every hit then serves the stored bytes as they are.
+    """
+    body = JSONRenderer().render(data)
+    variants = {IDENTITY: body}
+    if len(body) >= MIN_COMPRESS_SIZE:
+        # mtime=0 keeps the gzip bytes, and so the ETag, deterministic
+        variants[GZIP] = gzip.compress(body, compresslevel=9, mtime=0)
+        if brotli is not None:
+            variants[BROTLI] = brotli.compress(body, quality=9)
+    return variants
+
+
+def accepted_encodings(request):
+    accepted = set()
+    for item in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        coding, _, params = item.strip().partition(";")
+        try:
+            quality = float(params.strip()[2:]) if params.strip().startswith("q=") else 1.0
+        except ValueError:
+            quality = 1.0
+        if coding and quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def negotiate_encoding(request, variants=None):
+    """Pick the best encoding the client accepts (and that ``variants`` has)."""
+    accepted = accepted_encodings(request)
+    for encoding in available_encodings():
+        if (encoding in accepted or "*" in accepted) and (variants is None or encoding in variants):
+            return encoding
+    return IDENTITY
+
+
+def wants_plain_json(request):
+    # The stored bytes are compact JSON, other renderers (browsable API,
+    # indented JSON) go through the regular Response
+    renderer = getattr(request, "accepted_renderer", None)
+    media_type = getattr(request, "accepted_media_type", "") or ""
+    return isinstance(renderer, JSONRenderer) and "indent" not in media_type
+
+
+def variant_response(variants, encoding):
+    encoding = encoding if encoding in variants else IDENTITY
+    response = HttpResponse(variants[encoding], content_type="application/json")
+    if encoding != IDENTITY:
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Content-Length"] = str(len(variants[encoding]))
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
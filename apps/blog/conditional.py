@@ -0,0 +1,49 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def get_validators(request, *generations, variant=""):
+    """
+    Return the ``(etag, last_modified)`` of the representation at the request URL.
+
+    ``variant`` tells apart representations of the same URL, such as the
+    compressed bodies of apps.blog.compression.
+    """
+    digest = hashlib.md5(
+        "|".join([request.get_host(), request.get_full_path(), variant, *map(str, generations)]).encode("utf-8")
+    ).hexdigest()
+    return quote_etag(digest), max(int(generation) for generation in generations) // 1_000_000_000
+
+
+def set_validators(response, validators):
+    if validators and response.status_code == 200:
+        etag, last_modified = validators
+        response.headers["ETag"] = etag
+        response.headers["Last-Modified"] = http_date(last_modified)
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified support for read views backed by cache generations.
+
+    Every cached representation is addressed by the request URL and the
+    generations it was built from, so those alone identify it: a
+    revalidation is answered with a 304 before the view touches the
+    database, the cache entries or a serializer. Generations are bumped to
+    the time of the change (see apps.blog.cache), which gives Last-Modified.
+    """
+
+    validators = None
+
+    def not_modified(self, request, *generations, variant=""):
+        """Return a 304 response if the client's copy is current, else None."""
+        self.validators = get_validators(request, *generations, variant=variant)
+        etag, last_modified = self.validators
+        return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        return set_validators(response, self.validators)
@@ -0,0 +1,80 @@
+import uuid
+from urllib.parse import parse_qs
+
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
+
+from core.ratelimit import acheck_rate_limit
+
+from .analytics import CATEGORY, POST
+from .async_views import aresolve_ids
+from .live import get_hub
+
+MAX_SUBSCRIPTIONS = getattr(settings, "BLOG_LIVE_ANALYTICS_MAX_SUBSCRIPTIONS", 50)
+
+
+class LiveAnalyticsConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Live view, click and impression deltas of posts and categories.
+
+    Connect with the API key in the ``api_key`` query parameter (or the
+    API-Key header) and send ``{"action": "subscribe"|"unsubscribe",
+    "type": "post"|"category", "id" or "slug"}``. Every subscription then
+    gets at most one ``{"type", "id", "views", "clicks", "impressions"}``
+    message per interval, only when something changed (see apps.blog.live).
+    """
+
+    kinds = (POST, CATEGORY)
+    # The hub pushes to the sockets of its own process, no channel layer involved
+    channel_layer_alias = None
+
+    async def connect(self):
+        api_key = parse_qs(self.scope["query_string"].decode("latin-1")).get("api_key", [None])[0]
+        api_key = api_key or dict(self.scope["headers"]).get(b"api-key", b"").decode("latin-1")
+        if api_key not in getattr(settings, "VALID_API_KEYS", []):
+            await self.close(code=4003)
+            return
+        if await acheck_rate_limit(api_key, "analytics"):
+            await self.close(code=4029)
+            return
+
+        self.subscriptions = set()
+        self.hub = get_hub()
+        await self.accept()
+
+    async def disconnect(self, code):
+        for group in getattr(self, "subscriptions", ()):
+            self.hub.unsubscribe(self, group)
+
+    async def receive_json(self, content, **kwargs):
+        action = content.get("action") if isinstance(content, dict) else None
+        if action not in ("subscribe", "unsubscribe"):
+            return await self.send_json({"error": "Action must be 'subscribe' or 'unsubscribe'"})
+        if content.get("type") not in self.kinds:
+            return await self.send_json({"error": "Type must be 'post' or 'category'"})
+
+        kind = content["type"]
+        object_id = await self.resolve(kind, content.get("id"), content.get("slug"))
+        if object_id is None:
+            return await self.send_json({"error": f"The requested {kind} does not exist"})
+
+        group = (kind, object_id)
+        if action == "subscribe":
+            if group not in self.subscriptions and len(self.subscriptions) >= MAX_SUBSCRIPTIONS:
+                return await self.send_json({"error": f"At most {MAX_SUBSCRIPTIONS} subscriptions per connection"})
+            self.subscriptions.add(group)
+            self.hub.subscribe(self, group)
+        else:
+            self.subscriptions.discard(group)
+            self.hub.unsubscribe(self, group)
+        await self.send_json({"action": f"{action}d", "type": kind, "id": object_id})
+
+    async def resolve(self, kind, object_id, slug):
+        if object_id is not None:
+            try:
+                return str(uuid.UUID(str(object_id)))
+            except ValueError:
+                return None
+        if not isinstance(slug, str) or not slug:
+            return None
+        return (await aresolve_ids(kind, [slug])).get(slug)
@@ -0,0 +1,214 @@
+import hashlib
+import logging
+import math
+from abc import ABC, abstractmethod
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import IntegrityError, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from core.redis import get_redis, pipelined
+
+logger = logging.getLogger(__name__)
+
+VIEW_DEDUP_BACKENDS = {
+    "exact": "apps.blog.dedup.ExactViewDedup",
+    "hyperloglog": "apps.blog.dedup.HyperLogLogViewDedup",
+    "bloom": "apps.blog.dedup.BloomViewDedup",
+}
+
+
+@lru_cache(maxsize=None)
+def get_view_dedup_backend():
+    """Return the backend named by BLOG_VIEW_DEDUP_BACKEND (an alias or a dotted path)."""
+    backend = getattr(settings, "BLOG_VIEW_DEDUP_BACKEND", "exact")
+    return import_string(VIEW_DEDUP_BACKENDS.get(backend, backend))()
+
+
+@receiver(setting_changed)
+def reset_view_dedup_backend(setting, **kwargs):
+    # The backend is built once from BLOG_VIEW_DEDUP_BACKEND and the Bloom sizing
+    if setting.startswith("BLOG_VIEW_"):
+        get_view_dedup_backend.cache_clear()
+
+
+class ViewDedup(ABC):
+    """
+    Tells which views are new: the first of their viewer on a target that day.
+
+    Backends that keep raw views write a PostView/CategoryView row per new
+    viewer and unique views are rolled up from those rows (rollup_views).
+    The others keep nothing in the database, the view stream drain adds
+    the new views it gets back to the unique view rollups itself.
+    """
+
+    keeps_raw_views = False
+
+    @abstractmethod
+    def record_view(self, view_model, target, ip_address):
+        """Record one view of ``target`` (``{field: object_id}``) and return whether it was new."""
+
+    @abstractmethod
+    def record_views(self, view_model, field, views):
+        """Record ``(object_id, ip_address)`` pairs and return the ones that were new."""
+
+
+class ExactViewDedup(ViewDedup):
+    """
+    Exact unique views, one raw row per viewer and day.
+
+    The insert itself is the check: the unique (target, ip_address, date)
+    constraint rejects repeats, so there is no exists() query. Kept for
+    audits, the table is what makes it exact.
+    """
+
+    keeps_raw_views = True
+
+    def record_view(self, view_model, target, ip_address):
+        try:
+            with transaction.atomic():
+                view_model.objects.create(ip_address=ip_address, **target)
+        except IntegrityError:
+            return False
+        return True
+
+    def record_views(self, view_model, field, views):
+        """
+        Bulk version of record_view for ``(object_id, ip_address)`` pairs.
+
+        One query finds today's known viewers and one INSERT adds the rest,
+        returning the pairs that were new.
+        """
+        views = set(views)
+        if not views:
+            return []
+
+        existing = set(
+            (str(object_id), ip_address)
+            for object_id, ip_address in view_model.objects.filter(
+                date=timezone.localdate(),
+                ip_address__in={ip_address for object_id, ip_address in views},
+                **{f"{field}__in": {object_id for object_id, ip_address in views}},
+            ).values_list(field, "ip_address")
+        )
+        new_views = [view for view in views if view not in existing]
+        create_views(view_model, field, new_views)
+        return new_views
+
+
+def create_views(view_model, field, views):
+    # Rows that lose a race against a concurrent insert are skipped by the constraint
+    view_model.objects.bulk_create(
+        [view_model(ip_address=ip_address, **{field: object_id}) for object_id, ip_address in views],
+        ignore_conflicts=True,
+    )
+
+
+class RedisViewDedup(ViewDedup):
+    """
+    Approximate unique views per viewer and day, answered by Redis.
+
+    Memory is bounded per target and day, whatever the traffic: nothing is
+    written to the raw view tables and the Redis keys expire once their day
+    is over. If Redis is unavailable the exact backend is used instead.
+    """
+
+    key_prefix = None
+    timeout = 60 * 60 * 48
+
+    def get_key(self, view_model, target):
+        object_id = next(iter(target.values()))
+        return f"{view_model._meta.model_name}:{self.key_prefix}:{object_id}:{timezone.localdate().isoformat()}"
+
+    @abstractmethod
+    def queue_add(self, pipe, key, ip_address):
+        """Queue the commands that add ``ip_address`` to ``key`` and return how many there are."""
+
+    @abstractmethod
+    def was_added(self, results):
+        """Whether the replies of queue_add's commands say the viewer was new."""
+
+    def add(self, key, ip_address):
+        pipe = get_redis().pipeline(transaction=False)
+        self.queue_add(pipe, key, ip_address)
+        return self.was_added(pipe.execute())
+
+    def record_views(self, view_model, field, views):
+        """Check a whole batch of ``(object_id, ip_address)`` pairs in pipelined round trips."""
+        views = list(dict.fromkeys(views))
+        try:
+            results = pipelined(
+                get_redis(),
+                views,
+                lambda pipe, view: self.queue_add(pipe, self.get_key(view_model, {field: view[0]}), view[1]),
+            )
+        except redis.RedisError as e:
+            logger.warning(f"View dedup unavailable, falling back to exact: {e}")
+            return ExactViewDedup().record_views(view_model, field, views)
+
+        return [view for view, result in zip(views, results) if self.was_added(result)]
+
+    def record_view(self, view_model, target, ip_address):
+        try:
+            return self.add(self.get_key(view_model, target), ip_address)
+        except redis.RedisError as e:
+            logger.warning(f"View dedup unavailable, falling back to exact: {e}")
+            return ExactViewDedup().record_view(view_model, target, ip_address)
+
+
+class HyperLogLogViewDedup(RedisViewDedup):
+    """
+    PFADD into a HyperLogLog per target and day (12KB at most).
+
+    PFADD only reports a change for unseen viewers, so repeats are never
+    counted twice; a small share of new viewers can be missed.
+    """
+
+    key_prefix = "viewers_hll"
+
+    def queue_add(self, pipe, key, ip_address):
+        pipe.pfadd(key, ip_address)
+        pipe.expire(key, self.timeout)
+        return 2
+
+    def was_added(self, results):
+        return bool(results[0])
+
+
+class BloomViewDedup(RedisViewDedup):
+    """
+    Bloom filter over a Redis bitmap per target and day.
+
+    Sized from BLOG_VIEW_BLOOM_CAPACITY and BLOG_VIEW_BLOOM_ERROR_RATE; false
+    positives make it undercount, it never counts a repeat viewer.
+    """
+
+    key_prefix = "viewers_bloom"
+
+    def __init__(self):
+        capacity = getattr(settings, "BLOG_VIEW_BLOOM_CAPACITY", 10000)
+        error_rate = getattr(settings, "BLOG_VIEW_BLOOM_ERROR_RATE", 0.01)
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+
+    def get_offsets(self, value):
+        # Double hashing: k offsets out of two 64 bit halves of one digest
+        digest = hashlib.sha256(value.encode("utf-8")).digest()
+        first = int.from_bytes(digest[:8], "big")
+        second = int.from_bytes(digest[8:16], "big") | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def queue_add(self, pipe, key, ip_address):
+        for offset in self.get_offsets(ip_address):
+            pipe.setbit(key, offset, 1)
+        pipe.expire(key, self.timeout)
+        return self.hashes + 1
+
+    def was_added(self, results):
+        previous_bits = results[:-1]
+        return not all(previous_bits)
@@ -0,0 +1,50 @@
+import hashlib
+import html
+import re
+
+from django.utils.text import slugify
+
+HEADING_PATTERN = re.compile(r"<h([1-6])(\s[^>]*)?>(.*?)</h\1\s*>", re.IGNORECASE | re.DOTALL)
+ID_PATTERN = re.compile(r"""\sid\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""", re.IGNORECASE)
+TAG_PATTERN = re.compile(r"<[^>]+>")
+
+
+def content_hash(content):
+    return hashlib.sha256((content or "").encode("utf-8")).hexdigest()
+
+
+def heading_text(inner_html):
+    return " ".join(html.unescape(TAG_PATTERN.sub(" ", inner_html)).split())
+
+
+def extract_headings(content):
+    """
+    Return ``(content, toc)`` for the CKEditor HTML in ``content``.
+
+    Every h1-h6 gets an ``id`` anchor and a TOC entry with the same fields
+    as HeadingSerializer. An id that is already there is kept as the slug,
+    so anchors stay stable when a heading is reworded; new ones are
+    slugified from the text and suffixed when they repeat.
+    """
+    toc = []
+    used = set()
+
+    def anchor(match):
+        level, attributes, inner_html = int(match.group(1)), match.group(2) or "", match.group(3)
+        title = heading_text(inner_html)
+        if not title:
+            return match.group(0)
+
+        existing = ID_PATTERN.search(attributes)
+        base = slugify(next(filter(None, existing.groups()), "")) if existing else ""
+        base = (base or slugify(title) or "section")[:240]
+        slug, suffix = base, 2
+        while slug in used:
+            slug, suffix = f"{base}-{suffix}", suffix + 1
+        used.add(slug)
+
+        toc.append({"slug": slug, "title": title[:255], "level": level, "order": len(toc)})
+        attributes = ID_PATTERN.sub("", attributes)
+        return f'<h{level} id="{slug}"{attributes}>{inner_html}</h{level}>'
+
+    return HEADING_PATTERN.sub(anchor, content or ""), toc
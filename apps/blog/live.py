@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import weakref
+from collections import defaultdict
+
+import redis
+from django.conf import settings
+
+from core.redis import get_async_redis
+
+from .analytics import CLICK_ROLLUPS, CLICKS, IMPRESSIONS, LIVE_VIEWS, counter_key, current_bucket
+
+logger = logging.getLogger(__name__)
+
+# Every subscribed post or category gets at most one message per interval
+LIVE_INTERVAL_SECONDS = getattr(settings, "BLOG_LIVE_ANALYTICS_INTERVAL_MS", 1000) / 1000
+
+# message field -> Redis counters that add up to it
+LIVE_FIELDS = {
+    "views": (LIVE_VIEWS,),
+    "clicks": (CLICKS, CLICK_ROLLUPS),
+    "impressions": (IMPRESSIONS,),
+}
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+class CounterWatch:
+    """
+    Turns the bucketed counters of one object into deltas.
+
+    Only the current and the previous bucket are read. The first reading of
+    a bucket is taken as a baseline, unless the bucket opened after the
+    watch started. A missing hash reads as zero: buckets claimed by the sync
+    tasks never give negative deltas and late increments that recreate them
+    still count.
+    """
+
+    def __init__(self, bucket):
+        self.since = bucket
+        self.seen = {}
+
+    def delta(self, counter, bucket, value):
+        value = int(value or 0)
+        previous = self.seen.get((counter, bucket), 0 if bucket > self.since else value)
+        self.seen[(counter, bucket)] = value
+        return max(0, value - previous)
+
+    def forget_before(self, bucket):
+        self.seen = {key: value for key, value in self.seen.items() if key[1] >= bucket}
+
+
+class LiveAnalyticsHub:
+    """
+    WebSocket subscribers of one event loop, grouped by ``(kind, object_id)``.
+
+    While anyone is subscribed a single pump reads the counters of every
+    watched object in one pipeline per interval and sends each group at
+    most one message with what changed. Redis work follows the number of
+    watched objects and messages the number of subscribers, page views only
+    change the numbers in them.
+    """
+
+    def __init__(self):
+        self.groups = defaultdict(set)
+        self.watches = {}
+        self.task = None
+
+    def subscribe(self, consumer, group):
+        self.groups[group].add(consumer)
+        self.watches.setdefault(group, CounterWatch(current_bucket()))
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    def unsubscribe(self, consumer, group):
+        members = self.groups.get(group)
+        if members is None:
+            return
+        members.discard(consumer)
+        if not members:
+            del self.groups[group]
+            del self.watches[group]
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while self.groups:
+            started = loop.time()
+            try:
+                await self.publish()
+            except redis.RedisError as e:
+                logger.warning(f"Live analytics unavailable: {e}")
+            await asyncio.sleep(max(0, LIVE_INTERVAL_SECONDS - (loop.time() - started)))
+
+    async def read_deltas(self):
+        """Return ``{group: {field: delta}}`` for the groups whose counters moved."""
+        bucket = current_bucket()
+        buckets = (bucket - 1, bucket)
+        ids = defaultdict(list)
+        for kind, object_id in self.watches:
+            ids[kind].append(object_id)
+
+        pipe = get_async_redis().pipeline(transaction=False)
+        reads = []
+        for kind, object_ids in ids.items():
+            for field, counters in LIVE_FIELDS.items():
+                for counter in counters:
+                    for counter_bucket in buckets:
+                        pipe.hmget(counter_key(kind, counter, counter_bucket), object_ids)
+                        reads.append((kind, object_ids, field, counter, counter_bucket))
+        results = await pipe.execute()
+
+        deltas = defaultdict(lambda: dict.fromkeys(LIVE_FIELDS, 0))
+        for (kind, object_ids, field, counter, counter_bucket), values in zip(reads, results):
+            for object_id, value in zip(object_ids, values):
+                watch = self.watches.get((kind, object_id))
+                if watch is not None:
+                    change = watch.delta(counter, counter_bucket, value)
+                    if change:
+                        deltas[(kind, object_id)][field] += change
+
+        for watch in self.watches.values():
+            watch.forget_before(buckets[0])
+        return deltas
+
+    async def publish(self):
+        for (kind, object_id), delta in (await self.read_deltas()).items():
+            message = {"type": kind, "id": object_id, **delta}
+            consumers = list(self.groups.get((kind, object_id), ()))
+            # A socket that closed meanwhile must not stop the others
+            await asyncio.gather(*(consumer.send_json(message) for consumer in consumers), return_exceptions=True)
+
+
+def get_hub():
+    """Return the hub of the running event loop."""
+    loop = asyncio.get_running_loop()
+    if loop not in _hubs:
+        _hubs[loop] = LiveAnalyticsHub()
+    return _hubs[loop]
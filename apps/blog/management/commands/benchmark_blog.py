@@ -0,0 +1,312 @@
+import datetime
+import json
+import platform
+import random
+import statistics
+import time
+from contextlib import ExitStack
+
+import django
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.blog.models import Category, CategoryAnalytics, CategoryAnalyticsRollup, Post, PostAnalytics, PostAnalyticsRollup
+from apps.blog.rollups import truncate
+from core.redis import get_command_stats, get_redis
+
+API_KEY = "benchmark"
+
+WORDS = (
+    "django rest api cache query index redis python async stream serializer pagination cursor "
+    "latency throughput database postgres view model field request response header search "
+    "category post heading content thumbnail analytics event counter bucket pipeline worker"
+).split()
+
+SCENARIOS = ("cold", "warm")
+
+
+def sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def post_content(rng, paragraphs):
+    # Rich text as the editor saves it: a heading every few paragraphs, h3 now and then
+    parts = []
+    for i in range(paragraphs):
+        if i % 4 == 0:
+            parts.append(f"<h2>{sentence(rng, rng.randint(2, 6))}</h2>")
+        elif i % 4 == 2 and rng.random() < 0.5:
+            parts.append(f"<h3>{sentence(rng, rng.randint(2, 6))}</h3>")
+        parts.append(f"<p>{sentence(rng, rng.randint(40, 120))}.</p>")
+    return "\n".join(parts)
+
+
+def percentile(quantiles, value):
+    return round(quantiles[value - 1], 3)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic blog in a throwaway test database and measure every endpoint of apps/blog/urls.py "
+        "in-process, with a cold and a warm cache. Results are written as JSON so runs can be compared."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=500)
+        parser.add_argument("--breadth", type=int, default=4, help="Categories per level of the tree")
+        parser.add_argument("--depth", type=int, default=3, help="Levels of the category tree")
+        parser.add_argument("--paragraphs", type=int, default=24, help="Paragraphs per post, about 500 bytes each")
+        parser.add_argument("--days", type=int, default=30, help="Days of daily view history per post and category")
+        parser.add_argument("--iterations", type=int, default=200, help="Measured requests per endpoint and scenario")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--endpoint", action="append", help="Only this benchmark or URL name, can be repeated")
+        parser.add_argument("--fake-redis", action="store_true", help="Use fakeredis even if a Redis server answers")
+        parser.add_argument("--output", help="Write the results to this JSON file")
+        parser.add_argument("--compare", help="A previous --output file to compare the latencies with")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                baseline = json.load(f)
+
+        with ExitStack() as stack:
+            redis_backend = self.use_redis(stack, options["fake_redis"])
+            stack.enter_context(override_settings(VALID_API_KEYS=[API_KEY], API_RATE_LIMITS={}, API_KEY_QUOTAS={}))
+
+            # Never seed the real database
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                started = time.perf_counter()
+                dataset = self.seed(options)
+                dataset["seed_seconds"] = round(time.perf_counter() - started, 3)
+                results = self.run(dataset.pop("targets"), options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = {
+            "created_at": timezone.now().isoformat(),
+            "environment": {
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+                "redis": redis_backend,
+                "async_views": getattr(settings, "BLOG_ASYNC_VIEWS", False),
+                "fast_list_serializers": getattr(settings, "BLOG_FAST_LIST_SERIALIZERS", True),
+            },
+            "options": {name: options[name] for name in ("posts", "breadth", "depth", "paragraphs", "days", "iterations", "seed")},
+            "dataset": dataset,
+            "results": results,
+        }
+        for result in results:
+            self.stdout.write(json.dumps(result))
+        if baseline:
+            self.compare(baseline, results)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+
+    def use_redis(self, stack, fake):
+        """Point the app clients and the cache at a Redis that is safe to flush."""
+        if not fake:
+            try:
+                get_redis().ping()
+            except redis.RedisError:
+                fake = True
+        if not fake:
+            # Own key prefix, so the cold runs only drop the benchmark's cache entries
+            caches = {"default": {**settings.CACHES["default"], "KEY_PREFIX": "benchmark"}}
+            stack.enter_context(override_settings(CACHES=caches))
+            return "server"
+
+        try:
+            import fakeredis
+        except ImportError:
+            raise CommandError("No Redis server answers and fakeredis is not installed")
+
+        pool_kwargs = {"connection_class": fakeredis.FakeConnection, "server": fakeredis.FakeServer()}
+        caches = {
+            "default": {
+                "BACKEND": "django_redis.cache.RedisCache",
+                "LOCATION": "redis://benchmark:6379/1",
+                "OPTIONS": {
+                    "CLIENT_CLASS": "django_redis.client.DefaultClient",
+                    "REDIS_CLIENT_CLASS": "core.redis.Redis",
+                    "CONNECTION_POOL_KWARGS": pool_kwargs,
+                },
+            }
+        }
+        stack.enter_context(override_settings(CACHES=caches, REDIS_CONNECTION_POOL_KWARGS=pool_kwargs))
+        return "fakeredis"
+
+    def seed(self, options):
+        rng = random.Random(options["seed"])
+        now = timezone.now()
+
+        categories, level = [], [None]
+        for depth in range(options["depth"]):
+            level = [
+                Category.objects.create(name=f"Category {depth}.{i}", slug=f"category-{depth}-{i}", parent=parent)
+                for i, parent in enumerate(parent for parent in level for _ in range(options["breadth"]))
+            ]
+            categories += level
+
+        posts = []
+        for i in range(options["posts"]):
+            posts.append(Post.objects.create(
+                title=sentence(rng, rng.randint(3, 8))[:128],
+                description=sentence(rng, rng.randint(10, 30))[:256],
+                content=post_content(rng, options["paragraphs"]),
+                keywords=" ".join(rng.sample(WORDS, 4)),
+                slug=f"post-{i}",
+                status="published" if rng.random() < 0.9 else "draft",
+                author="benchmark",
+                category=rng.choice(categories),
+                created_at=now - datetime.timedelta(minutes=rng.randint(0, options["days"] * 24 * 60)),
+            ))
+
+        # Daily view history, what the analytics endpoints read
+        days = [truncate("day", now - datetime.timedelta(days=day)) for day in range(options["days"])]
+        for model, rollup_model, field, objects in (
+            (PostAnalytics, PostAnalyticsRollup, "post", posts),
+            (CategoryAnalytics, CategoryAnalyticsRollup, "category", categories),
+        ):
+            rollups = []
+            for target in objects:
+                history = [
+                    rollup_model(**{field: target}, period="day", bucket=day, views=rng.randint(0, 500), impressions=rng.randint(0, 2000), clicks=rng.randint(0, 100))
+                    for day in days
+                ]
+                for rollup in history:
+                    rollup.unique_views = rollup.views // 2
+                rollups += history
+                # The analytics row itself is created by the post_save receivers
+                model.objects.filter(**{field: target}).update(
+                    views=sum(rollup.views for rollup in history),
+                    impressions=sum(rollup.impressions for rollup in history),
+                    clicks=sum(rollup.clicks for rollup in history),
+                )
+            rollup_model.objects.bulk_create(rollups, batch_size=1000)
+
+        published = [post for post in posts if post.status == "published"]
+        return {
+            "categories": len(categories),
+            "posts": len(posts),
+            "published_posts": len(published),
+            "content_bytes_avg": round(statistics.mean(len(post.content) for post in posts)) if posts else 0,
+            "rollups": len(days) * (len(posts) + len(categories)),
+            "targets": {
+                "posts": [post.slug for post in published],
+                "categories": [category.slug for category in categories],
+                "roots": [category.slug for category in categories if category.parent_id is None],
+                "post_ids": [str(post.id) for post in published],
+            },
+        }
+
+    def endpoints(self, targets):
+        """``(name, url name, method, build(rng) -> data)`` for every benchmarked request."""
+        posts, categories, roots = targets["posts"], targets["categories"], targets["roots"]
+        return [
+            ("post-list", "post-list", "get", lambda rng: {"p": rng.randint(1, 5)}),
+            ("post-list-search", "post-list", "get", lambda rng: {"search": rng.choice(WORDS)}),
+            ("post-detail", "post-detail", "get", lambda rng: {"slug": rng.choice(posts)}),
+            ("post-headings", "post-headings", "get", lambda rng: {"slug": rng.choice(posts)}),
+            ("increment-post-click", "increment-post-click", "post", lambda rng: {"slug": rng.choice(posts)}),
+            ("category-list", "category-list", "get", lambda rng: {"parent_slug": rng.choice(roots)}),
+            ("category-tree", "category-tree", "get", lambda rng: {}),
+            ("increment-category-click", "increment-category-click", "post", lambda rng: {"slug": rng.choice(categories)}),
+            ("category-posts", "category-posts", "get", lambda rng: {"slug": rng.choice(categories)}),
+            ("category-posts-descendants", "category-posts", "get", lambda rng: {"slug": rng.choice(roots), "include_descendants": "true"}),
+            ("post-analytics", "post-analytics", "get", lambda rng: {"slug": rng.choice(posts), "period": "day"}),
+            ("category-analytics", "category-analytics", "get", lambda rng: {"slug": rng.choice(categories), "period": "day"}),
+            ("analytics-events", "analytics-events", "post", lambda rng: {"events": [
+                {"type": "post", "event": rng.choice(("view", "impression", "click")), "id": rng.choice(targets["post_ids"])}
+                for _ in range(20)
+            ]}),
+        ]
+
+    def run(self, targets, options):
+        if not targets["posts"]:
+            raise CommandError("The dataset has no published posts, use a larger --posts")
+        client = APIClient(HTTP_API_KEY=API_KEY)
+        results = []
+        for name, url_name, method, build in self.endpoints(targets):
+            if options["endpoint"] and name not in options["endpoint"] and url_name not in options["endpoint"]:
+                continue
+            path = reverse(url_name)
+            # Every scenario replays the same requests
+            rng = random.Random(f"{options['seed']}:{name}")
+            requests = [build(rng) for _ in range(options["iterations"])]
+            # Lazy imports and first-call setup are not part of any scenario
+            self.request(client, path, method, requests[0])
+            for scenario in SCENARIOS:
+                results.append(self.measure(client, name, path, method, scenario, requests))
+        return results
+
+    def request(self, client, path, method, data):
+        if method == "get":
+            return client.get(path, data)
+        return client.post(path, data, format="json")
+
+    def clear_cache(self):
+        if hasattr(cache, "delete_pattern"):
+            cache.delete_pattern("*")
+        else:
+            cache.clear()
+
+    def measure(self, client, name, path, method, scenario, requests):
+        self.clear_cache()
+        if scenario == "warm":
+            for data in requests:
+                self.request(client, path, method, data)
+
+        timings, queries, redis_commands, errors = [], 0, 0, 0
+        for data in requests:
+            if scenario == "cold":
+                self.clear_cache()
+            # Only the request's own commands count, not the cache clearing
+            get_command_stats(reset=True)
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = self.request(client, path, method, data)
+                timings.append(time.perf_counter() - started)
+            queries += len(context.captured_queries)
+            redis_commands += sum(stats["calls"] for stats in get_command_stats(reset=True).values())
+            errors += response.status_code >= 400
+
+        milliseconds = [timing * 1000 for timing in timings]
+        quantiles = statistics.quantiles(milliseconds, n=100, method="inclusive")
+        return {
+            "endpoint": name,
+            "path": path,
+            "method": method.upper(),
+            "scenario": scenario,
+            "requests": len(timings),
+            "errors": errors,
+            "p50_ms": percentile(quantiles, 50),
+            "p95_ms": percentile(quantiles, 95),
+            "p99_ms": percentile(quantiles, 99),
+            "mean_ms": round(statistics.mean(milliseconds), 3),
+            "throughput_rps": round(len(timings) / sum(timings), 1),
+            "queries_per_request": round(queries / len(timings), 2),
+            "redis_commands_per_request": round(redis_commands / len(timings), 2),
+        }
+
+    def compare(self, baseline, results):
+        before = {(result["endpoint"], result["scenario"]): result for result in baseline.get("results", [])}
+        for result in results:
+            previous = before.get((result["endpoint"], result["scenario"]))
+            if previous is None:
+                continue
+            changes = {
+                metric: f"{(result[metric] - previous[metric]) / previous[metric] * 100:+.1f}%" if previous[metric] else None
+                for metric in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps")
+            }
+            self.stdout.write(json.dumps({"endpoint": result["endpoint"], "scenario": result["scenario"], "change": changes}))
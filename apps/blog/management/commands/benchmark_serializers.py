@@ -0,0 +1,65 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from apps.blog.models import Category, Post
+from apps.blog.queries import post_list_queryset
+from apps.blog.serializers import CategoryListSerializer, PostListSerializer, category_list_rows, post_list_rows
+
+
+class Command(BaseCommand):
+    help = "Compare DRF list serializers with the values()-based fast path on existing posts and categories."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--page-size", type=int, default=100, help="Objects serialized per iteration")
+        parser.add_argument("--iterations", type=int, default=50)
+
+    def handle(self, *args, **options):
+        page_size, iterations = options["page_size"], options["iterations"]
+        post_ids = list(Post.postobjects.values_list("id", flat=True)[:page_size])
+        category_ids = list(Category.objects.values_list("id", flat=True)[:page_size])
+        if not post_ids:
+            raise CommandError("There are no published posts to serialize")
+
+        self.compare(
+            "posts",
+            len(post_ids),
+            iterations,
+            lambda: [dict(post) for post in PostListSerializer(post_list_queryset().filter(id__in=post_ids), many=True).data],
+            lambda: post_list_rows(Post.postobjects.filter(id__in=post_ids)),
+        )
+        if category_ids:
+            categories = Category.objects.filter(id__in=category_ids).order_by("id")
+            self.compare(
+                "categories",
+                len(category_ids),
+                iterations,
+                lambda: [dict(category) for category in CategoryListSerializer(categories.only(*CategoryListSerializer.Meta.fields), many=True).data],
+                lambda: category_list_rows(categories),
+            )
+
+    def compare(self, name, count, iterations, serializer, fast):
+        # Both paths must render the same bytes, otherwise the timings are meaningless
+        renderer = JSONRenderer()
+        expected = renderer.render(sorted(serializer(), key=lambda item: item["id"]))
+        actual = renderer.render(sorted(fast(), key=lambda item: item["id"]))
+        if expected != actual:
+            raise CommandError(f"Fast {name} output differs from the serializer:\n{expected!r}\n{actual!r}")
+
+        timings = {}
+        for label, function in (("serializer", serializer), ("fast", fast)):
+            started = time.perf_counter()
+            for _ in range(iterations):
+                renderer.render(function())
+            timings[label] = (time.perf_counter() - started) / iterations * 1000
+
+        self.stdout.write(json.dumps({
+            "objects": name,
+            "count": count,
+            "iterations": iterations,
+            "serializer_ms": round(timings["serializer"], 3),
+            "fast_ms": round(timings["fast"], 3),
+            "speedup": round(timings["serializer"] / timings["fast"], 2) if timings["fast"] else None,
+        }))
@@ -0,0 +1,26 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from apps.blog.transfer import TRANSFER_CHUNK_SIZE, export_ndjson
+
+
+class Command(BaseCommand):
+    help = "Stream every category, post and heading as NDJSON, for import_posts."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", help="File to write, stdout by default")
+        parser.add_argument("--chunk-size", type=int, default=TRANSFER_CHUNK_SIZE, help="Posts read per query")
+
+    def handle(self, *args, **options):
+        lines = export_ndjson(options["chunk_size"])
+        if not options["output"]:
+            sys.stdout.writelines(lines)
+            return
+
+        count = 0
+        with open(options["output"], "w", encoding="utf-8") as output:
+            for line in lines:
+                output.write(line)
+                count += 1
+        self.stderr.write(f"Exported {count} records to {options['output']}")
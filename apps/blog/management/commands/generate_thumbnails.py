@@ -0,0 +1,60 @@
+import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from apps.blog.thumbnails import update_thumbnail_variants
+
+MODELS = {"post": "blog.Post", "category": "blog.Category"}
+
+
+def generate(model_label, pk, force):
+    # Runs in the worker processes, each opens its own database connection
+    variants = update_thumbnail_variants(apps.get_model(model_label), pk, force)
+    return len((variants or {}).get("variants", []))
+
+
+class Command(BaseCommand):
+    help = "Build the responsive thumbnail variants of posts and categories. Existing variants are kept unless --force."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", choices=sorted(MODELS), action="append", help="Only this model, can be repeated")
+        parser.add_argument("--force", action="store_true", help="Render every variant again")
+        parser.add_argument("--processes", type=int, default=1, help="Resize in this many processes")
+
+    def handle(self, *args, **options):
+        force, processes = options["force"], max(1, options["processes"])
+        jobs = []
+        for name in options["model"] or sorted(MODELS):
+            model = apps.get_model(MODELS[name])
+            for pk, thumbnail, current in model.objects.values_list("pk", "thumbnail", "thumbnail_variants"):
+                # Up to date rows are skipped by update_thumbnail_variants too, this only saves the round trips
+                if force or (thumbnail or "") != (current or {}).get("source", ""):
+                    jobs.append((MODELS[name], str(pk)))
+
+        done, variants, failed = 0, 0, []
+        if processes == 1:
+            for model_label, pk in jobs:
+                try:
+                    variants += generate(model_label, pk, force)
+                    done += 1
+                except Exception as e:
+                    failed.append((model_label, pk, str(e)))
+        else:
+            # Forked workers must not share the parent's connections
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=processes, initializer=django.setup) as executor:
+                futures = {executor.submit(generate, model_label, pk, force): (model_label, pk) for model_label, pk in jobs}
+                for future in as_completed(futures):
+                    try:
+                        variants += future.result()
+                        done += 1
+                    except Exception as e:
+                        failed.append((*futures[future], str(e)))
+
+        for model_label, pk, error in failed:
+            self.stderr.write(f"{model_label} {pk}: {error}")
+        self.stdout.write(json.dumps({"objects": done, "variants": variants, "failed": len(failed)}))
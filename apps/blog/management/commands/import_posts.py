@@ -0,0 +1,25 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+
+from apps.blog.transfer import TRANSFER_CHUNK_SIZE, PostImporter
+
+
+class Command(BaseCommand):
+    help = "Import categories, posts and headings from an export_posts NDJSON file, updating existing slugs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="NDJSON file, - for stdin")
+        parser.add_argument("--batch-size", type=int, default=TRANSFER_CHUNK_SIZE, help="Posts written per transaction")
+
+    def handle(self, *args, **options):
+        importer = PostImporter(options["batch_size"])
+        if options["path"] == "-":
+            stats = importer.run(sys.stdin)
+        else:
+            with open(options["path"], encoding="utf-8") as lines:
+                stats = importer.run(lines)
+        self.stdout.write(json.dumps(stats))
+        if stats["thumbnails"]:
+            self.stdout.write("Run generate_thumbnails to build the variants of the imported thumbnails.")
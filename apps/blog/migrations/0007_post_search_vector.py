@@ -0,0 +1,47 @@
+# Generated by Django 4.2.16 on 2026-10-17 06:20
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class AddPostgresIndex(migrations.AddIndex):
+    # GIN indexes only exist on Postgres; keep the state change everywhere
+    # so SQLite test databases can still migrate.
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+def populate_search_vector(apps, schema_editor):
+    from apps.blog.search import post_search_vector
+
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Post = apps.get_model('blog', 'Post')
+    Post.objects.using(schema_editor.connection.alias).update(search_vector=post_search_vector())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_categoryview_categoryanalytics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        AddPostgresIndex(
+            model_name='post',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='blog_post_search_gin'),
+        ),
+        migrations.RunPython(populate_search_vector, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.16 on 2026-10-17 06:23
+
+from django.db import migrations, models
+import django.db.models.functions.comparison
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0007_post_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='blog_post_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['status', 'updated_at', 'id'], name='blog_post_status_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(models.F('status'), django.db.models.functions.comparison.Coalesce('title', models.Value('')), models.F('id'), name='blog_post_status_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['category', 'status', 'created_at', 'id'], name='blog_post_cat_created_idx'),
+        ),
+    ]
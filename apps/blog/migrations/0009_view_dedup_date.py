@@ -0,0 +1,61 @@
+# Generated by Django 4.2.16 on 2026-10-17 06:28
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+from django.db.models.functions import TruncDate
+import django.utils.timezone
+
+
+def populate_view_dates(apps, schema_editor):
+    # Date existing views by their timestamp and drop duplicates left by the
+    # old exists()/create() race, so the unique constraints can be added
+    for model_name, target in (('PostView', 'post'), ('CategoryView', 'category')):
+        View = apps.get_model('blog', model_name)
+        views = View.objects.using(schema_editor.connection.alias)
+        views.update(date=TruncDate('timestamp'))
+
+        duplicates = (
+            views.values(target, 'ip_address', 'date')
+            .annotate(total=Count('id'), first=Min('timestamp'))
+            .filter(total__gt=1)
+        )
+        for duplicate in duplicates:
+            keep = views.filter(
+                **{target: duplicate[target]},
+                ip_address=duplicate['ip_address'],
+                date=duplicate['date'],
+            ).order_by('timestamp').values_list('id', flat=True).first()
+            views.filter(
+                **{target: duplicate[target]},
+                ip_address=duplicate['ip_address'],
+                date=duplicate['date'],
+            ).exclude(id=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0008_post_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='categoryview',
+            name='date',
+            field=models.DateField(default=django.utils.timezone.localdate, editable=False),
+        ),
+        migrations.AddField(
+            model_name='postview',
+            name='date',
+            field=models.DateField(default=django.utils.timezone.localdate, editable=False),
+        ),
+        migrations.RunPython(populate_view_dates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='categoryview',
+            constraint=models.UniqueConstraint(fields=('category', 'ip_address', 'date'), name='blog_unique_category_view'),
+        ),
+        migrations.AddConstraint(
+            model_name='postview',
+            constraint=models.UniqueConstraint(fields=('post', 'ip_address', 'date'), name='blog_unique_post_view'),
+        ),
+    ]
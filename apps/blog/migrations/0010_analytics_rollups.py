@@ -0,0 +1,55 @@
+# Generated by Django 4.2.16 on 2026-10-17 06:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_view_dedup_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostAnalyticsRollup',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('unique_views', models.PositiveIntegerField(default=0)),
+                ('impressions', models.PositiveIntegerField(default=0)),
+                ('clicks', models.PositiveIntegerField(default=0)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='analytics_rollups', to='blog.post')),
+            ],
+            options={
+                'ordering': ['bucket'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CategoryAnalyticsRollup',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('unique_views', models.PositiveIntegerField(default=0)),
+                ('impressions', models.PositiveIntegerField(default=0)),
+                ('clicks', models.PositiveIntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='analytics_rollups', to='blog.category')),
+            ],
+            options={
+                'ordering': ['bucket'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='postanalyticsrollup',
+            constraint=models.UniqueConstraint(fields=('post', 'period', 'bucket'), name='blog_unique_post_rollup'),
+        ),
+        migrations.AddConstraint(
+            model_name='categoryanalyticsrollup',
+            constraint=models.UniqueConstraint(fields=('category', 'period', 'bucket'), name='blog_unique_category_rollup'),
+        ),
+    ]
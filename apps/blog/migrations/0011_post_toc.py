@@ -0,0 +1,36 @@
+# Generated by Django 4.2.16 on 2026-10-17 06:34
+
+from django.db import migrations, models
+
+
+def populate_toc(apps, schema_editor):
+    from apps.blog.headings import content_hash, extract_headings
+
+    Post = apps.get_model('blog', 'Post')
+    Heading = apps.get_model('blog', 'Heading')
+    for post in Post.objects.only('id', 'content').iterator(chunk_size=500):
+        content, toc = extract_headings(post.content)
+        Post.objects.filter(pk=post.pk).update(content=content, toc=toc, content_hash=content_hash(content))
+        Heading.objects.filter(post_id=post.pk).delete()
+        Heading.objects.bulk_create([Heading(post_id=post.pk, **entry) for entry in toc])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_analytics_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='toc',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.RunPython(populate_toc, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.16 on 2026-10-17 06:37
+
+from django.db import migrations, models
+
+
+def populate_category_paths(apps, schema_editor):
+    Category = apps.get_model('blog', 'Category')
+
+    # Walk the tree one level at a time, parents always have their path first
+    level = list(Category.objects.filter(parent__isnull=True))
+    paths, depth = {}, 0
+    while level:
+        for category in level:
+            category.path = paths.get(category.parent_id, '') + f"{category.id.hex}/"
+            category.depth = depth
+            paths[category.id] = category.path
+        Category.objects.bulk_update(level, ['path', 'depth'], batch_size=500)
+        level = list(Category.objects.filter(parent_id__in=[category.id for category in level]))
+        depth += 1
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0011_post_toc'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=1024),
+        ),
+        migrations.RunPython(populate_category_paths, migrations.RunPython.noop),
+    ]
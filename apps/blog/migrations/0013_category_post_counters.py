@@ -0,0 +1,60 @@
+# Generated by Django 4.2.16 on 2026-10-17 06:39
+
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def populate_category_counters(apps, schema_editor):
+    Category = apps.get_model('blog', 'Category')
+    Post = apps.get_model('blog', 'Post')
+
+    published = {
+        row['category_id']: row
+        for row in Post.objects.filter(status='published').order_by().values('category_id').annotate(
+            count=Count('id'), latest=Max('created_at')
+        )
+    }
+    categories = list(Category.objects.all())
+
+    subtree = Counter()
+    for category in categories:
+        count = published.get(category.id, {}).get('count', 0)
+        for segment in filter(None, category.path.split('/')):
+            subtree[segment] += count
+
+    for category in categories:
+        row = published.get(category.id, {})
+        category.published_post_count = row.get('count', 0)
+        category.latest_post_at = row.get('latest')
+        category.subtree_post_count = subtree[category.id.hex]
+    Category.objects.bulk_update(
+        categories, ['published_post_count', 'subtree_post_count', 'latest_post_at'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0012_category_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='latest_post_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='published_post_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='subtree_post_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_category_counters, migrations.RunPython.noop),
+    ]
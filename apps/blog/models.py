@@ -1,10 +1,36 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.core.exceptions import ValidationError
 from django.db import models
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models import Case, F, FloatField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Cast, Coalesce, Concat, Greatest, Substr
+from django.db.models.lookups import GreaterThan
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.utils import timezone
 import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
 from django.utils.text import slugify
 from ckeditor.fields import RichTextField
+from .cache import bump_generation, invalidate_category, invalidate_post, post_namespace
+from .dedup import get_view_dedup_backend
+from .headings import content_hash, extract_headings
+from .search import SEARCH_FIELDS, update_search_vector
+from .thumbnails import needs_variants
+
+# Set while headings are replaced by a caller that invalidates their posts itself
+_replacing_headings = ContextVar('replacing_headings', default=False)
+
+@contextmanager
+def replacing_headings():
+    """Skip the per-heading cache invalidation of the deletes made inside the block."""
+    token = _replacing_headings.set(True)
+    try:
+        yield
+    finally:
+        _replacing_headings.reset(token)
 
 def blog_thumbnail_directory(instance, filename):
     # File will be uploaded to MEDIA_ROOT/blog_posts/<filename>
@@ -14,6 +40,66 @@ def category_thumbnail_directory(instance, filename):
     # File will be uploaded to MEDIA_ROOT/categories/<filename>
     return "blog_categories/{0}/{1}".format(instance.name, filename)
 
+def click_through_rate_expression(clicks=None, impressions=None):
+    # SQL counterpart of _update_click_through_rate, for single-statement updates
+    clicks = F('clicks') if clicks is None else clicks
+    impressions = F('impressions') if impressions is None else impressions
+    return Case(
+        When(GreaterThan(impressions, 0), then=Cast(clicks, FloatField()) * Value(100.0) / impressions),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+def category_path_segment(category_id):
+    return f"{uuid.UUID(str(category_id)).hex}/"
+
+def path_ancestors(path):
+    # Category IDs in a materialized path, root first and the category itself last
+    return [uuid.UUID(segment) for segment in path.split('/') if segment]
+
+def add_subtree_posts(category_ids, delta):
+    if category_ids and delta:
+        Category.objects.filter(pk__in=category_ids).update(
+            subtree_post_count=Greatest(F('subtree_post_count') + delta, Value(0))
+        )
+
+def update_category_posts(category_id, delta):
+    """
+    Add ``delta`` published posts to a category and its ancestors' subtree
+    totals, and refresh its latest post, in two UPDATEs.
+    """
+    path = Category.objects.filter(pk=category_id).values_list('path', flat=True).first()
+    if path is None:
+        return
+    latest_post = Post.postobjects.filter(category=OuterRef('pk')).order_by('-created_at').values('created_at')[:1]
+    Category.objects.filter(pk=category_id).update(
+        published_post_count=Greatest(F('published_post_count') + delta, Value(0)),
+        latest_post_at=Subquery(latest_post),
+    )
+    add_subtree_posts(path_ancestors(path), delta)
+
+def increment_counters(queryset, clicks=0, impressions=0, returning=None):
+    """
+    Add to the counters of ``queryset`` and refresh its CTR in a single UPDATE.
+
+    Returns the number of updated rows, or with ``returning`` the values of
+    those fields on every updated row. They are read back in the same
+    transaction, the UPDATE's row locks keep them as written.
+    """
+    new_clicks = F('clicks') + clicks
+    new_impressions = F('impressions') + impressions
+    values = {
+        'clicks': new_clicks,
+        'impressions': new_impressions,
+        'click_through_rate': click_through_rate_expression(new_clicks, new_impressions),
+    }
+    if not returning:
+        return queryset.update(**values)
+    with transaction.atomic(using=queryset.db):
+        if not queryset.update(**values):
+            return []
+        return list(queryset.select_for_update(of=('self',)).values_list(*returning))
+
 class Category(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     parent = models.ForeignKey('self', related_name='children', on_delete=models.CASCADE, blank=True, null=True)
@@ -21,16 +107,81 @@ class Category(models.Model):
     title = models.CharField(max_length=255, blank=True, null=True)
     description = models.TextField(blank=True, null=True)
     thumbnail = models.ImageField(upload_to=category_thumbnail_directory, blank=True, null=True)
+    # Resized copies of the thumbnail, see apps.blog.thumbnails
+    thumbnail_variants = models.JSONField(default=dict, blank=True, editable=False)
     slug = models.CharField(max_length=128)
 
+    # Materialized path: the id of every ancestor and of the category itself,
+    # e.g. "<root id>/<child id>/". Maintained on save, moves rewrite the subtree
+    path = models.CharField(max_length=1024, blank=True, editable=False, db_index=True)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    # Denormalized from published posts by the Post receivers below,
+    # reconcile_category_counters corrects any drift
+    published_post_count = models.PositiveIntegerField(default=0, editable=False)
+    subtree_post_count = models.PositiveIntegerField(default=0, editable=False)
+    latest_post_at = models.DateTimeField(blank=True, null=True, editable=False)
+
     def __str__(self):
         return self.name
 
+    def clean(self):
+        super().clean()
+        self.build_path()
+
+    def build_path(self):
+        """Return ``(path, depth)`` under the current parent, refusing cycles."""
+        if self.parent_id is None:
+            return category_path_segment(self.id), 0
+
+        parent_path, parent_depth = Category.objects.filter(pk=self.parent_id).values_list('path', 'depth').get()
+        if category_path_segment(self.id) in parent_path:
+            raise ValidationError({'parent': "A category can't be moved under itself or its subcategories."})
+        return parent_path + category_path_segment(self.id), parent_depth + 1
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'parent' not in update_fields:
+            return super().save(*args, **kwargs)
+
+        stored = None
+        if not self._state.adding:
+            stored = Category.objects.filter(pk=self.pk).values_list('path', 'depth').first()
+        self.path, self.depth = self.build_path()
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'path', 'depth'}
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if stored and stored[0] and stored[0] != self.path:
+                # Moved: rewrite every descendant in a single UPDATE
+                old_path, old_depth = stored
+                Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                    path=Concat(Value(self.path), Substr('path', len(old_path) + 1)),
+                    depth=F('depth') + (self.depth - old_depth),
+                )
+                # The subtree's posts leave the old ancestors and join the new ones
+                subtree_posts = Category.objects.filter(pk=self.pk).values_list('subtree_post_count', flat=True).get()
+                add_subtree_posts(path_ancestors(old_path)[:-1], -subtree_posts)
+                add_subtree_posts(path_ancestors(self.path)[:-1], subtree_posts)
+
+    def get_descendants(self, include_self=True):
+        """The whole subtree in one indexed prefix query."""
+        descendants = Category.objects.filter(path__startswith=self.path)
+        return descendants if include_self else descendants.exclude(pk=self.pk)
+
 class CategoryView(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     category = models.ForeignKey(Category, related_name='category_view', on_delete=models.CASCADE)
     ip_address = models.GenericIPAddressField()
     timestamp = models.DateTimeField(auto_now_add=True)
+    date = models.DateField(default=timezone.localdate, editable=False)
+
+    class Meta:
+        constraints = [
+            # Unique views are counted per viewer and day, see apps.blog.dedup
+            models.UniqueConstraint(fields=['category', 'ip_address', 'date'], name='blog_unique_category_view'),
+        ]
 
     def __str__(self):
         return f"View of {self.category.name} from {self.ip_address} at {self.timestamp}"
@@ -54,22 +205,17 @@ class CategoryAnalytics(models.Model):
         self.save()
 
     def increment_click(self):
-        self.clicks += 1
-        self.save()
-        self._update_click_through_rate()
-    
+        increment_counters(type(self).objects.filter(pk=self.pk), clicks=1)
+        self.refresh_from_db(fields=['clicks', 'impressions', 'click_through_rate'])
 
     def increment_impression(self):
-        self.impressions += 1
-        self.save()
-        self._update_click_through_rate()
+        increment_counters(type(self).objects.filter(pk=self.pk), impressions=1)
+        self.refresh_from_db(fields=['clicks', 'impressions', 'click_through_rate'])
 
     def increment_view(self, ip_address):
-        if not CategoryView.objects.filter(category=self.category, ip_address=ip_address).exists():
-            CategoryView.objects.create(category=self.category, ip_address=ip_address)
-
+        if get_view_dedup_backend().record_view(CategoryView, {'category_id': self.category_id}, ip_address):
+            CategoryAnalytics.objects.filter(pk=self.pk).update(views=F('views') + 1)
             self.views += 1
-            self.save()
 
 class Post(models.Model):
 
@@ -88,6 +234,8 @@ class Post(models.Model):
     description = models.CharField(max_length=256, blank=True, null=True)
     content = RichTextField()
     thumbnail = models.ImageField(upload_to=blog_thumbnail_directory, blank=True, null=True)
+    # Resized copies of the thumbnail, see apps.blog.thumbnails
+    thumbnail_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     keywords = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
@@ -97,6 +245,13 @@ class Post(models.Model):
 
     status = models.CharField(max_length=10, choices=status_options, default='draft')
 
+    # Weighted full-text vector, kept up to date by update_post_search_vector
+    search_vector = SearchVectorField(blank=True, null=True, editable=False)
+
+    # Table of contents parsed from content on save, see apps.blog.headings
+    toc = models.JSONField(default=list, blank=True, editable=False)
+    content_hash = models.CharField(max_length=64, blank=True, editable=False)
+
     objects = models.Manager()  # The default manager.
     postobjects = PostObjects()  # Custom manager.
 
@@ -106,15 +261,46 @@ class Post(models.Model):
     class Meta:
         # Ordering posts by published date descending
         ordering = ['status', '-created_at']
+        indexes = [
+            GinIndex(fields=['search_vector'], name='blog_post_search_gin'),
+            # Keyset pagination indexes, see apps.blog.pagination
+            models.Index(fields=['status', 'created_at', 'id'], name='blog_post_status_created_idx'),
+            models.Index(fields=['status', 'updated_at', 'id'], name='blog_post_status_updated_idx'),
+            models.Index(F('status'), Coalesce('title', Value('')), F('id'), name='blog_post_status_title_idx'),
+            models.Index(fields=['category', 'status', 'created_at', 'id'], name='blog_post_cat_created_idx'),
+        ]
 
     def __str__(self):
         return self.title
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'content' in update_fields:
+            if self.refresh_toc() and update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'content', 'toc', 'content_hash'}
+        super().save(*args, **kwargs)
+
+    def refresh_toc(self):
+        # Unchanged content (same hash as the last parse) is not parsed again
+        if self.content_hash and self.content_hash == content_hash(self.content):
+            return False
+        self.content, self.toc = extract_headings(self.content)
+        self.content_hash = content_hash(self.content)
+        self._toc_changed = True
+        return True
     
 class PostView(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     post = models.ForeignKey(Post, related_name='post_views', on_delete=models.CASCADE)
     ip_address = models.GenericIPAddressField()
     timestamp = models.DateTimeField(auto_now_add=True)
+    date = models.DateField(default=timezone.localdate, editable=False)
+
+    class Meta:
+        constraints = [
+            # Unique views are counted per viewer and day, see apps.blog.dedup
+            models.UniqueConstraint(fields=['post', 'ip_address', 'date'], name='blog_unique_post_view'),
+        ]
 
     def __str__(self):
         return f"View of {self.post.title} from {self.ip_address} at {self.timestamp}"
@@ -138,22 +324,64 @@ class PostAnalytics(models.Model):
         self.save()
 
     def increment_click(self):
-        self.clicks += 1
-        self.save()
-        self._update_click_through_rate()
-    
+        increment_counters(type(self).objects.filter(pk=self.pk), clicks=1)
+        self.refresh_from_db(fields=['clicks', 'impressions', 'click_through_rate'])
 
     def increment_impression(self):
-        self.impressions += 1
-        self.save()
-        self._update_click_through_rate()
+        increment_counters(type(self).objects.filter(pk=self.pk), impressions=1)
+        self.refresh_from_db(fields=['clicks', 'impressions', 'click_through_rate'])
 
     def increment_view(self, ip_address):
-        if not PostView.objects.filter(post=self.post, ip_address=ip_address).exists():
-            PostView.objects.create(post=self.post, ip_address=ip_address)
-            
+        if get_view_dedup_backend().record_view(PostView, {'post_id': self.post_id}, ip_address):
+            PostAnalytics.objects.filter(pk=self.pk).update(views=F('views') + 1)
             self.views += 1
-            self.save()
+
+rollup_period_options = (
+    ('hour', 'Hour'),
+    ('day', 'Day'),
+)
+
+class PostAnalyticsRollup(models.Model):
+    # Hourly and daily totals, maintained by the rollup tasks in tasks.py
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    post = models.ForeignKey(Post, related_name='analytics_rollups', on_delete=models.CASCADE)
+    period = models.CharField(max_length=4, choices=rollup_period_options)
+    bucket = models.DateTimeField()
+
+    views = models.PositiveIntegerField(default=0)
+    unique_views = models.PositiveIntegerField(default=0)
+    impressions = models.PositiveIntegerField(default=0)
+    clicks = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['bucket']
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'period', 'bucket'], name='blog_unique_post_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.post.title} - {self.period} {self.bucket}"
+
+class CategoryAnalyticsRollup(models.Model):
+    # Hourly and daily totals, maintained by the rollup tasks in tasks.py
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    category = models.ForeignKey(Category, related_name='analytics_rollups', on_delete=models.CASCADE)
+    period = models.CharField(max_length=4, choices=rollup_period_options)
+    bucket = models.DateTimeField()
+
+    views = models.PositiveIntegerField(default=0)
+    unique_views = models.PositiveIntegerField(default=0)
+    impressions = models.PositiveIntegerField(default=0)
+    clicks = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['bucket']
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'period', 'bucket'], name='blog_unique_category_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.category.name} - {self.period} {self.bucket}"
 
 class Heading(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -181,7 +409,88 @@ def create_post_analytics(sender, instance, created, **kwargs):
     if created:
         PostAnalytics.objects.create(post=instance)
 
+@receiver(post_save, sender=Post)
+def sync_post_headings(sender, instance, **kwargs):
+    # Heading rows mirror the TOC parsed in Post.save
+    if not getattr(instance, '_toc_changed', False):
+        return
+    instance._toc_changed = False
+    # invalidate_post_cache already bumps the post's generation
+    with transaction.atomic(), replacing_headings():
+        Heading.objects.filter(post=instance).delete()
+        Heading.objects.bulk_create([Heading(post=instance, **entry) for entry in instance.toc])
+
+@receiver(post_save, sender=Post)
+def update_post_search_vector(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not SEARCH_FIELDS.intersection(update_fields):
+        return
+    update_search_vector(Post.objects.filter(pk=instance.pk))
+
 @receiver(post_save, sender=Category)
 def create_category_analytics(sender, instance, created, **kwargs):
     if created:
-        CategoryAnalytics.objects.create(category=instance)
\ No newline at end of file
+        CategoryAnalytics.objects.create(category=instance)
+
+# Post fields remember_post_slug reads back before a save
+TRACKED_POST_FIELDS = frozenset({'slug', 'status', 'category', 'category_id', 'created_at'})
+
+@receiver(pre_save, sender=Post)
+def remember_post_slug(sender, instance, update_fields=None, **kwargs):
+    # Keep the stored slug around so a renamed post also invalidates its old URL,
+    # and the stored status/category/date for the category counters
+    instance._previous_state = None
+    if update_fields and not TRACKED_POST_FIELDS.intersection(update_fields):
+        # None of them is written, the stored values are the instance's own
+        instance._previous_state = (instance.slug, instance.status, instance.category_id, instance.created_at)
+    elif not instance._state.adding:
+        instance._previous_state = Post.objects.filter(pk=instance.pk).values_list(
+            'slug', 'status', 'category_id', 'created_at'
+        ).first()
+    instance._previous_slug = instance._previous_state[0] if instance._previous_state else None
+
+@receiver(post_save, sender=Post)
+def update_category_post_counters(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_state', None)
+    was_published = bool(previous) and previous[1] == 'published'
+    is_published = instance.status == 'published'
+    if was_published and is_published and previous[2:] == (instance.category_id, instance.created_at):
+        return
+
+    if was_published:
+        update_category_posts(previous[2], -1)
+    if is_published:
+        update_category_posts(instance.category_id, 1)
+
+@receiver(post_delete, sender=Post)
+def remove_post_from_category_counters(sender, instance, **kwargs):
+    if instance.status == 'published':
+        update_category_posts(instance.category_id, -1)
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_cache(sender, instance, **kwargs):
+    slugs = (instance.slug, getattr(instance, '_previous_slug', None))
+    transaction.on_commit(lambda: invalidate_post(instance.pk, *slugs))
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_cache(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_category(instance.slug))
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Category)
+def queue_thumbnail_variants(sender, instance, **kwargs):
+    # Resizing happens in Celery, the task saves the variants back with update_fields
+    if needs_variants(instance):
+        from .tasks import generate_thumbnail_variants
+        label, pk = sender._meta.label, str(instance.pk)
+        transaction.on_commit(lambda: generate_thumbnail_variants.delay(label, pk))
+
+@receiver(post_save, sender=Heading)
+@receiver(post_delete, sender=Heading)
+def invalidate_heading_cache(sender, instance, **kwargs):
+    if _replacing_headings.get():
+        return
+    slug = Post.objects.filter(pk=instance.post_id).values_list('slug', flat=True).first()
+    if slug:
+        transaction.on_commit(lambda: bump_generation(post_namespace(slug)))
@@ -0,0 +1,122 @@
+import base64
+import json
+import uuid
+
+from django.conf import settings
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ParseError
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+# sorting/ordering option -> (keyset field, descending)
+KEYSET_ORDERINGS = {
+    "newest": ("created_at", True),
+    "oldest": ("created_at", False),
+    "recently_updated": ("updated_at", True),
+    "asc": ("title", False),
+    "desc": ("title", True),
+}
+DATETIME_FIELDS = ("created_at", "updated_at")
+
+
+def is_cursor_request(request):
+    return request.query_params.get("pagination") == "cursor" or "cursor" in request.query_params
+
+
+class PostCursorPagination:
+    """
+    Keyset pagination over ``(field, id)`` for post listings.
+
+    The limit is pushed into SQL and the position is carried in an opaque
+    cursor, so page 500 costs the same as page 1. Only the orders that map
+    to a column are supported (see KEYSET_ORDERINGS); ``p`` and ``count``
+    are not available in this mode.
+    """
+
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    page_size = 6
+
+    def __init__(self, sorting=None, ordering=None):
+        option = ordering or sorting or "newest"
+        if option not in KEYSET_ORDERINGS:
+            raise ParseError(detail=f"Cursor pagination does not support '{option}' ordering")
+        self.field, self.descending = KEYSET_ORDERINGS[option]
+        self.max_page_size = getattr(settings, "MAX_PAGE_SIZE", 100)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            page_size = self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def encode_cursor(self, value, pk):
+        if self.field in DATETIME_FIELDS:
+            value = value.isoformat()
+        raw = json.dumps([value, str(pk)]).encode("utf-8")
+        return base64.urlsafe_b64encode(raw).decode("ascii")
+
+    def decode_cursor(self, cursor):
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            # Both halves end up in SQL, anything but the shapes encode_cursor writes is rejected here
+            pk = str(uuid.UUID(str(pk)))
+            if self.field in DATETIME_FIELDS:
+                value = parse_datetime(value)
+                if value is None:
+                    raise ValueError(cursor)
+            elif not isinstance(value, str):
+                raise ValueError(cursor)
+        except (TypeError, ValueError):
+            raise ParseError(detail="Invalid cursor")
+        return value, pk
+
+    def get_sort_expression(self):
+        # NULL titles sort as empty strings so every row has a comparable key
+        if self.field == "title":
+            return Coalesce("title", Value(""))
+        return F(self.field)
+
+    def page_queryset(self, queryset, request):
+        """Return the ``(id, keyset_value)`` rows of the requested page, plus one to detect the next."""
+        page_size = self.get_page_size(request)
+        queryset = queryset.annotate(keyset_value=self.get_sort_expression())
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            value, pk = self.decode_cursor(cursor)
+            lookup = "lt" if self.descending else "gt"
+            queryset = queryset.filter(
+                Q(**{f"keyset_value__{lookup}": value})
+                | Q(keyset_value=value, **{f"id__{lookup}": pk})
+            )
+
+        prefix = "-" if self.descending else ""
+        return (
+            queryset.order_by(f"{prefix}keyset_value", f"{prefix}id")
+            .values_list("id", "keyset_value")[:page_size + 1]
+        )
+
+    def get_page(self, rows, request):
+        page_size = self.get_page_size(request)
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = self.encode_cursor(rows[-1][1], rows[-1][0])
+
+        return [str(pk) for pk, value in rows], next_cursor
+
+    def paginate_queryset(self, queryset, request):
+        """Return ``(page_ids, next_cursor)`` for the requested page."""
+        return self.get_page(list(self.page_queryset(queryset, request)), request)
+
+    async def apaginate_queryset(self, queryset, request):
+        return self.get_page([row async for row in self.page_queryset(queryset, request)], request)
+
+    def get_next_link(self, request, next_cursor):
+        if next_cursor is None:
+            return None
+        url = remove_query_param(request.build_absolute_uri(), "p")
+        return replace_query_param(url, self.cursor_query_param, next_cursor)
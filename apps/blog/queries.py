@@ -0,0 +1,145 @@
+import uuid
+
+from django.db.models import F, Q
+
+from .models import Category, Post
+from .search import search_posts
+
+# Columns read by PostListSerializer, category and analytics included
+POST_LIST_FIELDS = (
+    "id",
+    "title",
+    "description",
+    "thumbnail",
+    "thumbnail_variants",
+    "slug",
+    "category__id",
+    "category__name",
+    "category__slug",
+    "post_analytics__id",
+    "post_analytics__views",
+)
+
+
+def post_list_queryset(queryset=None):
+    """Posts with exactly what PostListSerializer needs, in a single query."""
+    queryset = Post.postobjects.all() if queryset is None else queryset
+    return queryset.select_related("category", "post_analytics").only(*POST_LIST_FIELDS)
+
+
+def post_detail_queryset(queryset=None):
+    """
+    Posts with everything PostSerializer needs, in a single query.
+
+    Headings come from the stored TOC, so nothing is left to load lazily.
+    The search vector and content hash are never serialized.
+    """
+    queryset = Post.postobjects.all() if queryset is None else queryset
+    return queryset.select_related("category", "post_analytics").defer("search_vector", "content_hash")
+
+
+# Listing querysets shared by the sync views and their async variants (apps.blog.async_views)
+
+def filter_posts(posts, search, categories):
+    if search != "":
+        posts = search_posts(posts, search)
+
+    # filter by categories
+    if categories:
+        category_queries = Q()
+        for category in categories:
+            try:
+                uuid.UUID(category)
+                uuid_query = Q(category__id=category)
+                category_queries |= uuid_query
+            except ValueError:
+                slug_query = Q(category__slug=category)
+                category_queries |= slug_query
+        posts = posts.filter(category_queries)
+
+    return posts
+
+
+def sort_posts(posts, search, sorting, ordering):
+    # best matches first unless the client asks for another order
+    if search != "" and (sorting in (None, "search_rank")) and not ordering:
+        posts = posts.order_by("-search_rank", "-created_at")
+
+    #aplly sorting
+    if sorting:
+        if sorting == "newest":
+            posts = posts.order_by("-created_at")
+        elif sorting == "recently_updated":
+            posts = posts.order_by("-updated_at")
+        elif sorting == "oldest":
+            posts = posts.order_by("created_at")
+        elif sorting == "most_viewed":
+            posts = posts.annotate(popularity=F("post_analytics__views")).order_by("-popularity")
+
+    #aplly ordering
+    if ordering:
+        if ordering == "asc":
+            posts = posts.order_by("title")
+        elif ordering == "desc":
+            posts = posts.order_by("-title")
+
+    return posts
+
+
+def subtree_posts(path):
+    # Every path below the category starts with its own: a constant prefix the
+    # path index can serve, like Category.get_descendants
+    if path is None:
+        return Post.postobjects.none()
+    return Post.postobjects.filter(category__path__startswith=path)
+
+
+def category_posts(category_id, include_descendants=False):
+    if not include_descendants:
+        return Post.postobjects.filter(category_id=category_id)
+    return subtree_posts(Category.objects.filter(pk=category_id).values_list("path", flat=True).first())
+
+
+async def acategory_posts(category_id, include_descendants=False):
+    if not include_descendants:
+        return Post.postobjects.filter(category_id=category_id)
+    return subtree_posts(await Category.objects.filter(pk=category_id).values_list("path", flat=True).afirst())
+
+
+def filter_categories(parent_slug, search, sorting, ordering, fields):
+    """
+    Return ``(categories, all_categories)`` for a category listing.
+
+    ``categories`` is the filtered and sorted listing loading only ``fields``,
+    ``all_categories`` every category under the same parent.
+    """
+    if parent_slug:
+        all_categories = Category.objects.filter(parent__slug=parent_slug)
+    else:
+        all_categories = Category.objects.filter(parent__isnull=True)
+    categories = all_categories.only(*fields)
+
+    if search != "":
+        categories = categories.filter(
+            Q(title__icontains=search) |
+            Q(name__icontains=search) |
+            Q(slug__icontains=search) |
+            Q(description__icontains=search)
+        )
+
+    #aplly sorting
+    if sorting == "most_viewed":
+        categories = categories.annotate(popularity=F("category_analytics__views")).order_by("-popularity")
+    elif sorting == "most_posts":
+        categories = categories.order_by("-subtree_post_count", "name")
+    elif sorting == "recently_updated":
+        categories = categories.order_by(F("latest_post_at").desc(nulls_last=True), "name")
+
+    #aplly ordering
+    if ordering:
+        if ordering == "asc":
+            categories = categories.order_by("name")
+        elif ordering == "desc":
+            categories = categories.order_by("-name")
+
+    return categories, all_categories
@@ -0,0 +1,161 @@
+import datetime
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from .analytics import CATEGORY, POST
+from .models import (
+    Category,
+    CategoryAnalyticsRollup,
+    CategoryView,
+    Post,
+    PostAnalyticsRollup,
+    PostView,
+)
+
+# kind -> (rollup model, raw view model, counted model, foreign key)
+ROLLUP_TARGETS = {
+    POST: (PostAnalyticsRollup, PostView, Post, "post_id"),
+    CATEGORY: (CategoryAnalyticsRollup, CategoryView, Category, "category_id"),
+}
+
+PERIODS = {
+    "hour": TruncHour,
+    "day": TruncDay,
+}
+
+ROLLUP_CHUNK_SIZE = getattr(settings, "BLOG_ANALYTICS_FLUSH_CHUNK_SIZE", 1000)
+# Hours of raw views recomputed on every run, late rows are picked up on the next one
+ROLLUP_LOOKBACK_HOURS = getattr(settings, "BLOG_ROLLUP_LOOKBACK_HOURS", 3)
+# Raw PostView/CategoryView rows older than this are deleted once rolled up
+RAW_VIEW_RETENTION_DAYS = max(2, getattr(settings, "BLOG_RAW_VIEW_RETENTION_DAYS", 30))
+
+
+def truncate(period, moment):
+    moment = timezone.localtime(moment)
+    if period == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def ensure_rollups(kind, period, keys):
+    """Create missing rollup rows for ``(object_id, bucket)`` keys and return their IDs."""
+    model, view_model, counted_model, field = ROLLUP_TARGETS[kind]
+
+    model.objects.bulk_create(
+        [model(period=period, bucket=bucket, **{field: object_id}) for object_id, bucket in keys],
+        ignore_conflicts=True,
+    )
+    rows = model.objects.filter(
+        period=period,
+        bucket__in={bucket for object_id, bucket in keys},
+        **{f"{field}__in": {object_id for object_id, bucket in keys}},
+    ).values_list(field, "bucket", "id")
+    return {(str(object_id), bucket): pk for object_id, bucket, pk in rows}
+
+
+def add_counter_rollups(kind, counter, counts, moment):
+    """
+    Add flushed ``counter`` values to the hour and day that contain ``moment``.
+
+    Rows are created first and then incremented with F-expressions, so
+    concurrent flushes of different counters never overwrite each other.
+    ``counts`` must only contain objects that still exist.
+    """
+    model = ROLLUP_TARGETS[kind][0]
+
+    for period in PERIODS:
+        bucket = truncate(period, moment)
+        rollup_ids = ensure_rollups(kind, period, [(object_id, bucket) for object_id in counts])
+        model.objects.bulk_update(
+            [
+                model(id=rollup_ids[(object_id, bucket)], **{counter: F(counter) + count})
+                for object_id, count in counts.items()
+                if (object_id, bucket) in rollup_ids
+            ],
+            [counter],
+        )
+
+
+def rollup_views(kind, since=None):
+    """
+    Recompute unique views from the raw view rows since ``since``.
+
+    Raw rows are unique per viewer and day, so they can't tell how many
+    views there were: total views are added by the view stream drain.
+    Buckets are overwritten rather than incremented, so running this again
+    over the same window is harmless. Returns the number of buckets written.
+    """
+    model, view_model, counted_model, field = ROLLUP_TARGETS[kind]
+    since = since or timezone.now() - datetime.timedelta(hours=ROLLUP_LOOKBACK_HOURS)
+    written = 0
+
+    for period, trunc in PERIODS.items():
+        rows = (
+            view_model.objects.filter(timestamp__gte=truncate(period, since))
+            .annotate(bucket=trunc("timestamp"))
+            .values(field, "bucket")
+            .annotate(unique_views=Count("ip_address", distinct=True))
+            .order_by()
+            .iterator(chunk_size=ROLLUP_CHUNK_SIZE)
+        )
+
+        while True:
+            chunk = list(islice(rows, ROLLUP_CHUNK_SIZE))
+            if not chunk:
+                break
+
+            with transaction.atomic():
+                rollup_ids = ensure_rollups(kind, period, [(row[field], row["bucket"]) for row in chunk])
+                model.objects.bulk_update(
+                    [
+                        model(id=rollup_ids[(str(row[field]), row["bucket"])], unique_views=row["unique_views"])
+                        for row in chunk
+                    ],
+                    ["unique_views"],
+                )
+            written += len(chunk)
+
+    return written
+
+
+def compact_raw_views(kind, retention_days=RAW_VIEW_RETENTION_DAYS):
+    """
+    Delete raw view rows older than ``retention_days``, in chunks.
+
+    Unique views are deduplicated per day (see apps.blog.dedup) and rolled
+    up within hours, so old rows are not needed for either.
+    """
+    view_model = ROLLUP_TARGETS[kind][1]
+    cutoff = timezone.localdate() - datetime.timedelta(days=max(2, retention_days))
+    deleted = 0
+
+    while True:
+        ids = list(view_model.objects.filter(date__lt=cutoff).values_list("id", flat=True)[:ROLLUP_CHUNK_SIZE])
+        if not ids:
+            break
+        view_model.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+
+    return deleted
+
+
+def get_series(kind, object_id, period="day", start=None, end=None):
+    """Return the rollup time series of one post or category between ``start`` and ``end``."""
+    model, view_model, counted_model, field = ROLLUP_TARGETS[kind]
+    end = end or timezone.now()
+    if start is None:
+        start = end - (datetime.timedelta(days=30) if period == "day" else datetime.timedelta(hours=48))
+
+    return list(
+        model.objects.filter(
+            period=period,
+            bucket__gte=truncate(period, start),
+            bucket__lte=end,
+            **{field: object_id},
+        ).values("bucket", "views", "unique_views", "impressions", "clicks")
+    )
@@ -0,0 +1,7 @@
+from django.urls import path
+from .consumers import LiveAnalyticsConsumer
+
+
+websocket_urlpatterns = [
+  path('ws/blog/analytics/', LiveAnalyticsConsumer.as_asgi(), name='live-analytics'),
+]
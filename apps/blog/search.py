@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connections
+from django.db.models import Case, F, FloatField, Q, Value, When
+
+# Fields that feed Post.search_vector, with their Postgres weights
+SEARCH_WEIGHTS = (
+    ('title', 'A'),
+    ('keywords', 'B'),
+    ('description', 'B'),
+    ('content', 'C'),
+)
+SEARCH_FIELDS = frozenset(field for field, weight in SEARCH_WEIGHTS)
+
+# Same ratios Postgres uses by default for ts_rank ({D, C, B, A})
+FALLBACK_WEIGHTS = {'A': 1.0, 'B': 0.4, 'C': 0.2, 'D': 0.1}
+
+
+def get_search_config():
+    return getattr(settings, 'BLOG_SEARCH_CONFIG', 'english')
+
+
+def supports_full_text(queryset):
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def post_search_vector():
+    config = get_search_config()
+    vector = None
+    for field, weight in SEARCH_WEIGHTS:
+        part = SearchVector(field, weight=weight, config=config)
+        vector = part if vector is None else vector + part
+    return vector
+
+
+def update_search_vector(queryset):
+    """Recompute the stored search vector for the given posts (Postgres only)."""
+    if not supports_full_text(queryset):
+        return 0
+    return queryset.update(search_vector=post_search_vector())
+
+
+def search_posts(queryset, search):
+    """
+    Filter posts matching ``search`` and annotate them with ``search_rank``.
+
+    On Postgres this uses the GIN-indexed ``search_vector``; other backends
+    (SQLite in tests) fall back to icontains lookups with a weighted rank that
+    mirrors the Postgres field weights.
+    """
+    if supports_full_text(queryset):
+        query = SearchQuery(search, search_type='websearch', config=get_search_config())
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        )
+
+    matches = Q()
+    rank = Value(0.0)
+    for field, weight in SEARCH_WEIGHTS:
+        lookup = Q(**{f'{field}__icontains': search})
+        matches |= lookup
+        rank = rank + Case(
+            When(lookup, then=Value(FALLBACK_WEIGHTS[weight])),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+    return queryset.filter(matches).annotate(search_rank=rank)
@@ -1,10 +1,24 @@
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 from .models import Post, Category, Heading, PostView
+from .thumbnails import thumbnail_srcset
+
+class ThumbnailSrcsetField(serializers.Field):
+    # {format: srcset} of the resized thumbnails, built by apps.blog.thumbnails
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', 'thumbnail_variants')
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return thumbnail_srcset(value, self.parent.Meta.model._meta.get_field('thumbnail').storage)
 
 class CategorySerializer(serializers.ModelSerializer):
+    thumbnail_srcset = ThumbnailSrcsetField()
+
     class Meta:
         model = Category
-        fields = '__all__'
+        exclude = ['thumbnail_variants']
 
 class HeadingSerializer(serializers.ModelSerializer):
     class Meta:
@@ -16,11 +30,17 @@ class HeadingSerializer(serializers.ModelSerializer):
             'order'
     ]
 
-class CategoryListSerializer(serializers.ModelSerializer):
+class PostCategorySerializer(serializers.ModelSerializer):
+    # Category as embedded in post listings
     class Meta:
         model = Category
         fields = ['id', 'name', 'slug']
 
+class CategoryListSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Category
+        fields = ['id', 'name', 'slug', 'published_post_count', 'subtree_post_count', 'latest_post_at']
+
 class PostViewSerializer(serializers.ModelSerializer):
     class Meta:
         model = PostView
@@ -28,22 +48,98 @@ class PostViewSerializer(serializers.ModelSerializer):
 
 class PostSerializer(serializers.ModelSerializer):
     category = CategorySerializer()
-    headings = HeadingSerializer(many=True)
+    # Precomputed on save, same shape as HeadingSerializer without a query
+    headings = serializers.JSONField(source='toc', read_only=True)
     view_count = serializers.SerializerMethodField()
+    thumbnail_srcset = ThumbnailSrcsetField()
     class Meta:
         model = Post
-        fields = '__all__'
+        exclude = ['search_vector', 'toc', 'content_hash', 'thumbnail_variants']
 
     def get_view_count(self, obj):
-        return obj.post_analytics.views if obj.post_analytics else 0
+        # post_analytics is loaded with select_related, see apps.blog.queries
+        analytics = getattr(obj, 'post_analytics', None)
+        return analytics.views if analytics else 0
 
 class PostListSerializer(serializers.ModelSerializer):
-    category = CategoryListSerializer()
+    category = PostCategorySerializer()
     view_count = serializers.SerializerMethodField()
+    thumbnail_srcset = ThumbnailSrcsetField()
 
     class Meta:
         model = Post
-        fields = ['id', 'title', 'description', 'thumbnail', 'slug', 'category', 'view_count']
+        fields = ['id', 'title', 'description', 'thumbnail', 'thumbnail_srcset', 'slug', 'category', 'view_count']
 
     def get_view_count(self, obj):
-        return obj.post_analytics.views if obj.post_analytics else 0
\ No newline at end of file
+        # post_analytics is loaded with select_related, see apps.blog.queries
+        analytics = getattr(obj, 'post_analytics', None)
+        return analytics.views if analytics else 0
+
+# Fast read-only list serialization: the same output as PostListSerializer and
+# CategoryListSerializer, built straight from values() rows without the DRF
+# field machinery. The serializers above stay for writes, admin and details.
+
+POST_LIST_VALUES = (
+    'id',
+    'title',
+    'description',
+    'thumbnail',
+    'thumbnail_variants',
+    'slug',
+    'category_id',
+    'category__name',
+    'category__slug',
+    'post_analytics__views',
+)
+
+datetime_field = serializers.DateTimeField()
+
+def file_representation(storage, name):
+    # Same rules as serializers.ImageField without a request in the context
+    if not name:
+        return None
+    if api_settings.UPLOADED_FILES_USE_URL:
+        return storage.url(name)
+    return name
+
+def post_list_row(row, storage):
+    return {
+        'id': str(row['id']),
+        'title': row['title'],
+        'description': row['description'],
+        'thumbnail': file_representation(storage, row['thumbnail']),
+        'thumbnail_srcset': thumbnail_srcset(row['thumbnail_variants'], storage),
+        'slug': row['slug'],
+        'category': {
+            'id': str(row['category_id']),
+            'name': row['category__name'],
+            'slug': row['category__slug'],
+        },
+        'view_count': row['post_analytics__views'] or 0,
+    }
+
+def category_list_row(row):
+    return {
+        'id': str(row['id']),
+        'name': row['name'],
+        'slug': row['slug'],
+        'published_post_count': row['published_post_count'],
+        'subtree_post_count': row['subtree_post_count'],
+        'latest_post_at': datetime_field.to_representation(row['latest_post_at']) if row['latest_post_at'] else None,
+    }
+
+def post_list_rows(queryset):
+    """PostListSerializer output for ``queryset``, from one values() query."""
+    storage = Post._meta.get_field('thumbnail').storage
+    return [post_list_row(row, storage) for row in queryset.values(*POST_LIST_VALUES)]
+
+def category_list_rows(queryset):
+    """CategoryListSerializer output for ``queryset``, from one values() query."""
+    return [category_list_row(row) for row in queryset.values(*CategoryListSerializer.Meta.fields)]
+
+async def apost_list_rows(queryset):
+    storage = Post._meta.get_field('thumbnail').storage
+    return [post_list_row(row, storage) async for row in queryset.values(*POST_LIST_VALUES)]
+
+async def acategory_list_rows(queryset):
+    return [category_list_row(row) async for row in queryset.values(*CategoryListSerializer.Meta.fields)]
@@ -1,13 +1,41 @@
 from celery import shared_task
+import datetime
+import ipaddress
 import logging
-from .models import PostAnalytics, Post, CategoryAnalytics, Category
+import os
+import socket
+import time
+import uuid
+from django.apps import apps
+from .models import PostAnalytics, Post, PostView, CategoryAnalytics, Category, CategoryView, click_through_rate_expression, path_ancestors
 import redis
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max
+from collections import Counter, defaultdict
+from itertools import islice
+from .analytics import (
+  CATEGORY,
+  CLICK_ROLLUPS,
+  CLICKS,
+  COUNTER_BUCKET_SECONDS,
+  IMPRESSIONS,
+  POST,
+  counter_buckets_key,
+  counter_key,
+  current_bucket,
+  VIEW_STREAM_GROUP,
+  VIEW_STREAM_MAXLEN,
+  view_stream_key,
+)
+from core.redis import get_redis
+from .cache import touch_view_counts
+from .dedup import get_view_dedup_backend
+from .rollups import add_counter_rollups, compact_raw_views, rollup_views, truncate
+from .thumbnails import update_thumbnail_variants
 
 logger = logging.getLogger(__name__)
 
-redis_client = redis.StrictRedis(host=settings.REDIS_HOST, port=6379, db=0)
-
 @shared_task
 def increment_post_impressions(post_id):
   try:
@@ -16,72 +44,412 @@ def increment_post_impressions(post_id):
   except Exception as e:
     logger.error(f"Error incrementing impressions for post {post_id}: {e}")
     
+# kind -> (analytics model, counted model, analytics foreign key)
+COUNTER_TARGETS = {
+  POST: (PostAnalytics, Post, "post_id"),
+  CATEGORY: (CategoryAnalytics, Category, "category_id"),
+}
+
+# counter -> analytics/rollup field; CLICK_ROLLUPS are already in the lifetime totals
+COUNTER_FIELDS = {
+  IMPRESSIONS: "impressions",
+  CLICKS: "clicks",
+  CLICK_ROLLUPS: "clicks",
+}
+LIFETIME_COUNTERS = (IMPRESSIONS, CLICKS)
+
+FLUSH_CHUNK_SIZE = getattr(settings, "BLOG_ANALYTICS_FLUSH_CHUNK_SIZE", 1000)
+
+def flushing_key(key):
+  return f"{key}:flushing"
+
+def claim_counter_buckets(kind, counter):
+  """
+  Yield ``(key, bucket)`` for every hash that is safe to flush.
+
+  Hashes left behind by an interrupted run are picked up first (found with
+  SCAN). Closed buckets are then moved out of the write path with an atomic
+  SREM + RENAMENX, so increments that land late simply recreate the bucket
+  and are flushed on the next run instead of being lost.
+  """
+  for key in get_redis().scan_iter(match=flushing_key(counter_key(kind, counter, "*")), count=FLUSH_CHUNK_SIZE):
+    yield key, int(key.decode("utf-8").split(":")[2])
+
+  current = current_bucket()
+  for bucket in get_redis().sscan_iter(counter_buckets_key(kind, counter), count=FLUSH_CHUNK_SIZE):
+    if int(bucket) >= current:
+      continue
+
+    key = counter_key(kind, counter, int(bucket))
+    pipe = get_redis().pipeline()
+    pipe.srem(counter_buckets_key(kind, counter), bucket)
+    pipe.renamenx(key, flushing_key(key))
+    removed, renamed = pipe.execute(raise_on_error=False)
+
+    # A missing bucket raises "no such key", nothing to flush then
+    if renamed is True:
+      yield flushing_key(key), int(bucket)
+
+def parse_counters(items):
+  counts = Counter()
+  for object_id, value in items:
+    try:
+      counts[str(uuid.UUID(object_id.decode("utf-8")))] += int(value)
+    except ValueError:
+      logger.info(f"Skipping malformed counter {object_id!r}")
+  return counts
+
+def apply_counters(kind, counter, counts, moment):
+  """Apply one chunk of flushed counters to the lifetime totals and the rollups of ``moment``."""
+  model, counted_model, field = COUNTER_TARGETS[kind]
+
+  # Counters of deleted posts/categories are dropped
+  existing = (str(object_id) for object_id in counted_model.objects.filter(id__in=counts).values_list("id", flat=True))
+  counts = {object_id: counts[object_id] for object_id in existing if counts[object_id] > 0}
+
+  if counter in LIFETIME_COUNTERS:
+    apply_lifetime_counters(kind, counter, counts)
+  add_counter_rollups(kind, COUNTER_FIELDS[counter], counts, moment)
+  return len(counts)
+
+def apply_lifetime_counters(kind, counter, counts):
+  """Add ``counts`` to ``counter`` on the analytics rows and recompute their CTR in one UPDATE."""
+  model, counted_model, field = COUNTER_TARGETS[kind]
+
+  rows = {
+    str(object_id): pk
+    for object_id, pk in model.objects.filter(**{f"{field}__in": counts}).values_list(field, "id")
+  }
+
+  missing = [object_id for object_id in counts if object_id not in rows]
+  if missing:
+    model.objects.bulk_create([model(**{field: object_id}) for object_id in missing], ignore_conflicts=True)
+    rows.update(
+      (str(object_id), pk)
+      for object_id, pk in model.objects.filter(**{f"{field}__in": missing}).values_list(field, "id")
+    )
+
+  updates = []
+  for object_id, count in counts.items():
+    total = F(counter) + count
+    values = {"clicks": F("clicks"), "impressions": F("impressions"), counter: total}
+    updates.append(model(
+      id=rows[object_id],
+      click_through_rate=click_through_rate_expression(values["clicks"], values["impressions"]),
+      **{counter: total},
+    ))
+
+  model.objects.bulk_update(updates, [counter, "click_through_rate"])
+
+def flush_counters(kind, counter):
+  """Drain pending ``counter`` values of ``kind`` into the database."""
+  started = time.monotonic()
+  stats = {"kind": kind, "counter": counter, "buckets": 0, "counters": 0, "updated": 0, "total": 0}
+
+  lock = get_redis().lock(f"{kind}:{counter}:flush_lock", timeout=60 * 30, blocking=False)
+  if not lock.acquire():
+    logger.info(f"Another {kind} {counter} flush is running, skipping.")
+    return stats
+
+  try:
+    for key, bucket in claim_counter_buckets(kind, counter):
+      stats["buckets"] += 1
+      moment = datetime.datetime.fromtimestamp(bucket * COUNTER_BUCKET_SECONDS, tz=datetime.timezone.utc)
+      items = get_redis().hscan_iter(key, count=FLUSH_CHUNK_SIZE)
+
+      while True:
+        chunk = list(islice(items, FLUSH_CHUNK_SIZE))
+        if not chunk:
+          break
+
+        counts = parse_counters(chunk)
+        with transaction.atomic():
+          stats["updated"] += apply_counters(kind, counter, counts, moment)
+
+        # Only forget counters once they are committed
+        get_redis().hdel(key, *(object_id for object_id, value in chunk))
+        stats["counters"] += len(chunk)
+        stats["total"] += sum(counts.values())
+
+      get_redis().delete(key)
+  finally:
+    lock.release()
+
+  stats["seconds"] = round(time.monotonic() - started, 3)
+  stats["counters_per_second"] = round(stats["counters"] / stats["seconds"]) if stats["seconds"] else stats["counters"]
+  logger.info(
+    f"Flushed {stats['total']} {kind} {counter} from {stats['counters']} counters "
+    f"in {stats['buckets']} buckets in {stats['seconds']}s ({stats['counters_per_second']} counters/s)"
+  )
+  return stats
+
 @shared_task
 def sync_impressions_to_db():
   # Aggregate all impression counts from Redis and update the database
-  
-    keys = redis_client.keys("post:impressions:*")
-    for key in keys:
-      try:
-        post_id = key.decode("utf-8").split(":")[-1]
-        
-        try:
-          post = Post.objects.get(id=post_id)
-        except Post.DoesNotExist:
-          logger.info(f"Post with ID {post_id} does not exist.")
-          continue
-        
-        impressions = int(redis_client.get(key))
-        if impressions == 0:
-          redis_client.delete(key)
-          continue 
-        
-        analytics, created = PostAnalytics.objects.get_or_create(post=post)
-        analytics.impressions += impressions
-        analytics.save()
-        analytics._update_click_through_rate()
-        
-        redis_client.delete(key)
-        
-      except Exception as e:
-        logger.error(f"Error syncing impressions to DB: {e}")
-        
+  return flush_counters(POST, IMPRESSIONS)
+
+@shared_task
+def sync_clicks_to_db():
+  # Clicks buffered in Redis when BLOG_BUFFERED_CLICKS is enabled, plus the
+  # rollup share of clicks that were written directly
+  return [flush_counters(POST, CLICKS), flush_counters(POST, CLICK_ROLLUPS)]
+
 @shared_task
 def increment_post_views(slug, ip_address):
+  # Legacy: views now go through the view stream, kept to drain queued messages
   try:
     post = Post.objects.get(slug=slug)
     post_analytics, _ = PostAnalytics.objects.get_or_create(post=post)
     post_analytics.increment_view(ip_address)
+    touch_view_counts()
   except Exception as e:
     logger.error(f"Error incrementing views for post {slug}: {e}")
     
+# kind -> raw view model used for unique view deduplication
+VIEW_MODELS = {
+  POST: PostView,
+  CATEGORY: CategoryView,
+}
+
+VIEW_STREAM_BATCH_SIZE = getattr(settings, "BLOG_VIEW_STREAM_BATCH_SIZE", 5000)
+# A run stops reading after this long and schedules another one if events are left
+VIEW_STREAM_TIME_BUDGET = getattr(settings, "BLOG_VIEW_STREAM_TIME_BUDGET", 50)
+# Pending entries idle for this long belong to a dead consumer and are taken over
+VIEW_STREAM_CLAIM_IDLE_MS = 5 * 60 * 1000
+
+def ensure_view_group(kind):
+  try:
+    get_redis().xgroup_create(view_stream_key(kind), VIEW_STREAM_GROUP, id="0", mkstream=True)
+  except redis.ResponseError as e:
+    if "BUSYGROUP" not in str(e):
+      raise
+
+def read_view_events(kind, consumer):
+  """
+  Yield batches of ``(entry_id, fields)`` for ``consumer``.
+
+  Entries a crashed consumer read but never acknowledged are claimed first,
+  then new entries are read until the stream is empty or the time budget
+  is spent.
+  """
+  stream = view_stream_key(kind)
+  deadline = time.monotonic() + VIEW_STREAM_TIME_BUDGET
+
+  claimed = get_redis().xautoclaim(
+    stream, VIEW_STREAM_GROUP, consumer, min_idle_time=VIEW_STREAM_CLAIM_IDLE_MS, count=VIEW_STREAM_BATCH_SIZE
+  )
+  # Entries trimmed by MAXLEN while pending come back without fields
+  entries = [(entry_id, fields) for entry_id, fields in claimed[1] if fields]
+  if entries:
+    yield entries
+
+  while time.monotonic() < deadline:
+    response = get_redis().xreadgroup(VIEW_STREAM_GROUP, consumer, {stream: ">"}, count=VIEW_STREAM_BATCH_SIZE)
+    if not response or not response[0][1]:
+      break
+    yield response[0][1]
+
+def entry_hour(entry_id):
+  # Stream entry IDs start with the milliseconds at which the view was added
+  milliseconds = int(entry_id.decode("utf-8").split("-")[0])
+  return truncate("hour", datetime.datetime.fromtimestamp(milliseconds / 1000, tz=datetime.timezone.utc))
+
+def add_hourly_rollups(kind, counter, counts):
+  """Add ``{(hour, object_id): count}`` to the ``counter`` rollups of each hour and its day."""
+  hours = defaultdict(dict)
+  for (hour, object_id), count in counts.items():
+    hours[hour][object_id] = count
+  for hour, hour_counts in hours.items():
+    add_counter_rollups(kind, counter, hour_counts, hour)
+
+def apply_views(kind, entries):
+  """Deduplicate one batch of stream entries and add the unique views to the analytics rows."""
+  model, counted_model, field = COUNTER_TARGETS[kind]
+
+  # (object_id, ip_address) -> hour of its first view in the batch, and every view per hour
+  views, totals = {}, Counter()
+  for entry_id, fields in entries:
+    try:
+      # The address ends up in an inet column, one bad value would fail the whole batch
+      ip_address = str(ipaddress.ip_address(fields[b"ip"].decode("utf-8")))
+      view = (str(uuid.UUID(fields[b"id"].decode("utf-8"))), ip_address)
+      hour = entry_hour(entry_id)
+    except (KeyError, ValueError):
+      # Skipped entries are acked with the rest of the batch, they never come back
+      logger.info(f"Skipping malformed view event {entry_id!r}")
+      continue
+    views.setdefault(view, hour)
+    totals[(hour, view[0])] += 1
+
+  # Views of deleted posts/categories are dropped
+  existing = {
+    str(object_id)
+    for object_id in counted_model.objects.filter(id__in={object_id for object_id, ip in views}).values_list("id", flat=True)
+  }
+  views = {view: hour for view, hour in views.items() if view[0] in existing}
+  add_hourly_rollups(kind, "views", {key: count for key, count in totals.items() if key[1] in existing})
+
+  backend = get_view_dedup_backend()
+  new_views = backend.record_views(VIEW_MODELS[kind], field, list(views))
+  counts = Counter(object_id for object_id, ip_address in new_views)
+  if not counts:
+    return 0
+
+  if not backend.keeps_raw_views:
+    # No raw rows for rollup_views to count, the new viewers go to the rollups here
+    add_hourly_rollups(kind, "unique_views", Counter((views[view], view[0]) for view in new_views))
+
+  model.objects.bulk_create([model(**{field: object_id}) for object_id in counts], ignore_conflicts=True)
+  rows = model.objects.filter(**{f"{field}__in": counts}).values_list(field, "id")
+  model.objects.bulk_update(
+    [model(id=pk, views=F("views") + counts[str(object_id)]) for object_id, pk in rows],
+    ["views"],
+  )
+  return sum(counts.values())
+
+def view_stream_metrics(kind):
+  """Length, pending entries and lag (entries and seconds) of the view stream."""
+  stream = view_stream_key(kind)
+  metrics = {"length": get_redis().xlen(stream), "pending": 0, "lag": 0, "lag_seconds": 0}
+
+  if not metrics["length"]:
+    return metrics
+
+  group = next(
+    (group for group in get_redis().xinfo_groups(stream) if group["name"].decode("utf-8") == VIEW_STREAM_GROUP),
+    {},
+  )
+  metrics["pending"] = group.get("pending", 0)
+  # The oldest entry not delivered yet tells how far behind the consumers are
+  start = b"(" + group["last-delivered-id"] if group else "-"
+  oldest = get_redis().xrange(stream, min=start, count=1)
+  if oldest:
+    metrics["lag"] = group.get("lag") or metrics["length"] - metrics["pending"]
+    created = int(oldest[0][0].decode("utf-8").split("-")[0]) / 1000
+    metrics["lag_seconds"] = round(max(0, time.time() - created), 3)
+  return metrics
+
+def drain_view_stream(kind):
+  """Count every view waiting in the stream of ``kind``, in batches."""
+  started = time.monotonic()
+  stats = {"kind": kind, "events": 0, "views": 0}
+  consumer = f"{socket.gethostname()}:{os.getpid()}"
+
+  lock = get_redis().lock(f"{kind}:view_stream:drain_lock", timeout=VIEW_STREAM_TIME_BUDGET * 4, blocking=False)
+  if not lock.acquire():
+    logger.info(f"Another {kind} view stream drain is running, skipping.")
+    return stats
+
+  try:
+    ensure_view_group(kind)
+    for entries in read_view_events(kind, consumer):
+      with transaction.atomic():
+        stats["views"] += apply_views(kind, entries)
+
+      # Only forget events once their views are committed
+      entry_ids = [entry_id for entry_id, fields in entries]
+      pipe = get_redis().pipeline(transaction=False)
+      pipe.xack(view_stream_key(kind), VIEW_STREAM_GROUP, *entry_ids)
+      pipe.xdel(view_stream_key(kind), *entry_ids)
+      pipe.execute()
+      stats["events"] += len(entries)
+
+    get_redis().xgroup_delconsumer(view_stream_key(kind), VIEW_STREAM_GROUP, consumer)
+  finally:
+    lock.release()
+
+  # Cached payloads embed view counts, also publishes changes a previous run held back
+  touch_view_counts(stats["views"] > 0)
+
+  stats.update(view_stream_metrics(kind))
+  stats["seconds"] = round(time.monotonic() - started, 3)
+  stats["events_per_second"] = round(stats["events"] / stats["seconds"]) if stats["seconds"] else stats["events"]
+  logger.info(
+    f"Counted {stats['views']} {kind} views from {stats['events']} events in {stats['seconds']}s "
+    f"({stats['events_per_second']} events/s), lag {stats['lag']} events / {stats['lag_seconds']}s"
+  )
+  if stats["length"] >= VIEW_STREAM_MAXLEN * 0.8:
+    logger.warning(f"{kind} view stream is close to its cap ({stats['length']}/{VIEW_STREAM_MAXLEN}), old views will be dropped")
+  return stats
+
+@shared_task
+def sync_view_events_to_db():
+  # Views recorded by PostDetailView and analytics/events/
+  stats = [drain_view_stream(POST), drain_view_stream(CATEGORY)]
+
+  # Back-pressure: a run that spent its whole budget is followed right away by
+  # another one instead of waiting for the next beat
+  if any(stat.get("lag") and stat["seconds"] >= VIEW_STREAM_TIME_BUDGET for stat in stats):
+    sync_view_events_to_db.apply_async(countdown=1)
+  return stats
+
 @shared_task
 def sync_category_impressions_to_db():
   # Aggregate all impression counts from Redis and update the database
+  return flush_counters(CATEGORY, IMPRESSIONS)
+
+@shared_task
+def sync_category_clicks_to_db():
+  # Clicks buffered in Redis when BLOG_BUFFERED_CLICKS is enabled, plus the
+  # rollup share of clicks that were written directly
+  return [flush_counters(CATEGORY, CLICKS), flush_counters(CATEGORY, CLICK_ROLLUPS)]
+
+@shared_task
+def rollup_analytics():
+  # Refresh hourly/daily unique views from the recent raw rows, only the
+  # exact dedup backend writes them
+  if not get_view_dedup_backend().keeps_raw_views:
+    return {}
+  return {kind: rollup_views(kind) for kind in (POST, CATEGORY)}
 
-    keys = redis_client.keys("category:impressions:*")
-    for key in keys:
-      try:
-        category_id = key.decode("utf-8").split(":")[-1]
-        
-        try:
-          category = Category.objects.get(id=category_id)
-        except Category.DoesNotExist:
-          logger.info(f"Category with ID {category_id} does not exist.")
-          continue
-
-        impressions = int(redis_client.get(key))
-        if impressions == 0:
-          redis_client.delete(key)
-          continue       
-        
-        analytics, created = CategoryAnalytics.objects.get_or_create(category=category)
-        analytics.impressions += impressions
-        analytics.save()
-        analytics._update_click_through_rate()
-        
-        redis_client.delete(key)
-        
-      except Exception as e:
-        logger.error(f"Error syncing impressions to DB: {e}")
- 
\ No newline at end of file
+@shared_task
+def compact_analytics():
+  # Prune raw PostView/CategoryView rows that are past their retention
+  deleted = {kind: compact_raw_views(kind) for kind in (POST, CATEGORY)}
+  logger.info(f"Compacted raw views: {deleted}")
+  return deleted
+
+def reconcile_category_counters():
+  """
+  Recompute post counts, subtree totals and latest post dates of every
+  category and fix the rows that drifted. Returns the number of fixed rows.
+  """
+  published = {
+    row["category_id"]: (row["count"], row["latest"])
+    for row in Post.postobjects.order_by().values("category_id").annotate(count=Count("id"), latest=Max("created_at"))
+  }
+  categories = list(Category.objects.only("id", "path", "published_post_count", "subtree_post_count", "latest_post_at"))
+
+  subtree = Counter()
+  for category in categories:
+    count = published.get(category.id, (0, None))[0]
+    for ancestor_id in path_ancestors(category.path):
+      subtree[ancestor_id] += count
+
+  drifted = []
+  for category in categories:
+    count, latest = published.get(category.id, (0, None))
+    expected = (count, subtree[category.id], latest)
+    if (category.published_post_count, category.subtree_post_count, category.latest_post_at) != expected:
+      category.published_post_count, category.subtree_post_count, category.latest_post_at = expected
+      drifted.append(category)
+
+  Category.objects.bulk_update(
+    drifted, ["published_post_count", "subtree_post_count", "latest_post_at"], batch_size=FLUSH_CHUNK_SIZE
+  )
+  if drifted:
+    logger.warning(f"Reconciled post counters of {len(drifted)} categories")
+  return len(drifted)
+
+@shared_task
+def sync_category_post_counters():
+  # Safety net for the counters kept by the Post receivers
+  return reconcile_category_counters()
+
+@shared_task
+def generate_thumbnail_variants(model_label, pk, force=False):
+  """Resize the thumbnail of one Post or Category, see apps.blog.thumbnails."""
+  variants = update_thumbnail_variants(apps.get_model(model_label), pk, force)
+  if variants is None:
+    return {"model": model_label, "pk": pk, "variants": 0}
+  return {"model": model_label, "pk": pk, "variants": len(variants.get("variants", []))}
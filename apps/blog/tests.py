@@ -1,3 +1,1023 @@
-from django.test import TestCase
+import base64
+import datetime
+import gzip
+import io
+import json
+import shutil
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+import fakeredis
+import redis
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from core.ratelimit import USAGE_BUCKET_SECONDS, usage_key
+from core.redis import get_redis, pipelined
+from core.tasks import aggregate_api_usage
+
+from . import async_views
+from .live import CounterWatch
+from .analytics import (
+    CATEGORY,
+    IMPRESSIONS,
+    POST,
+    VIEW_STREAM_GROUP,
+    counter_buckets_key,
+    counter_key,
+    current_bucket,
+    queue_counters,
+    record_view,
+    view_stream_key,
+)
+from .cache import (
+    CATEGORIES,
+    POST_LISTS,
+    VIEW_COUNTS,
+    get_generations,
+    get_post_fragments,
+    post_fragment_keys,
+    post_namespace,
+    set_post_fragments,
+    touch_view_counts,
+)
+from .models import Category, Heading, Post, PostAnalytics, PostAnalyticsRollup, PostView
+from .queries import post_list_queryset
+from .rollups import rollup_views
+from .serializers import CategoryListSerializer, CategorySerializer, PostListSerializer, category_list_rows, post_list_rows
+from .tasks import apply_counters, drain_view_stream, ensure_view_group, flush_counters, reconcile_category_counters
+from .thumbnails import update_thumbnail_variants
+from .transfer import PostImporter, export_ndjson
+from .utils import get_client_ip
+
+API_KEY = "test-key"
+
+
+class FakeRedisMixin:
+    """Run core.redis clients against an empty in-memory Redis for every test."""
+
+    def setUp(self):
+        super().setUp()
+        pool_kwargs = {"connection_class": fakeredis.FakeConnection, "server": fakeredis.FakeServer()}
+        redis_settings = self.settings(REDIS_CONNECTION_POOL_KWARGS=pool_kwargs)
+        redis_settings.enable()
+        self.addCleanup(redis_settings.disable)
+
+
+@override_settings(
+    VALID_API_KEYS=[API_KEY],
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+)
+class ReadQueryCountTests(APITestCase):
+    """
+    Query budget of every read endpoint, on a cache miss and on a hit.
+
+    Serializers must only read what the views load up front (see
+    apps.blog.queries). A lazy relation access shows up here as an extra
+    query per post, so raising any of these numbers needs a good reason.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Django", slug="django")
+        cls.child = Category.objects.create(name="ORM", slug="orm", parent=cls.category)
+        cls.posts = [
+            Post.objects.create(
+                title=f"Post {i}",
+                description="Description",
+                content=f"<h2>Intro {i}</h2><p>Content</p><h3>Details</h3>",
+                keywords="django",
+                slug=f"post-{i}",
+                status="published",
+                author="author",
+                category=cls.category if i % 2 else cls.child,
+            )
+            for i in range(8)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client.credentials(HTTP_API_KEY=API_KEY)
+
+    def assertQueries(self, url, miss, hit):
+        with self.assertNumQueries(miss):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        with self.assertNumQueries(hit):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def test_post_detail(self):
+        # post, category and analytics in one JOIN; headings come from the TOC
+        response = self.assertQueries("/api/blog/post/?slug=post-1", miss=1, hit=0)
+        self.assertEqual(len(response.json()["results"]["headings"]), 2)
+
+    def test_post_detail_compressed(self):
+        # rendered and compressed once at cache fill, a hit only copies bytes
+        Post.objects.filter(slug="post-1").update(content="<p>" + "Content " * 200 + "</p>")
+        plain = self.client.get("/api/blog/post/?slug=post-1")
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/blog/post/?slug=post-1", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertNotEqual(response["ETag"], plain["ETag"])
+
+    def test_post_list(self):
+        # ordered IDs, then one query for the page
+        self.assertQueries("/api/blog/posts/", miss=2, hit=0)
+
+    def test_post_list_search(self):
+        self.assertQueries("/api/blog/posts/?search=post&sorting=most_viewed", miss=2, hit=0)
+
+    def test_post_list_cursor(self):
+        # keyset page, posts themselves come from the fragment cache on the second request
+        self.assertQueries("/api/blog/posts/?pagination=cursor", miss=2, hit=1)
+
+    def test_post_list_invalid_cursor(self):
+        # well-formed base64 and JSON, but not a position encode_cursor could have written
+        for value, pk in (("2024-01-01T00:00:00+00:00", "not-a-uuid"), ("2024-01-01T00:00:00+00:00", 1), ({}, "")):
+            cursor = base64.urlsafe_b64encode(json.dumps([value, pk]).encode()).decode()
+            response = self.client.get("/api/blog/posts/", {"cursor": cursor})
+            self.assertEqual(response.status_code, 400, response.content)
+        self.assertEqual(self.client.get("/api/blog/posts/", {"cursor": "%%%"}).status_code, 400)
+
+    def test_category_posts(self):
+        # slug -> id, ordered IDs, then the page
+        self.assertQueries("/api/blog/category/posts/?slug=django", miss=3, hit=0)
+
+    def test_category_posts_with_descendants(self):
+        # the subtree is a prefix match on the category's materialized path, not a query per level
+        response = self.assertQueries("/api/blog/category/posts/?slug=django&include_descendants=true", miss=4, hit=0)
+        self.assertEqual(response.data["count"], len(self.posts))
+
+    def test_category_tree(self):
+        response = self.assertQueries("/api/blog/categories/tree/", miss=1, hit=0)
+        self.assertEqual(response.data["results"][0]["children"][0]["slug"], "orm")
+
+    def test_post_headings(self):
+        self.assertQueries("/api/blog/post/headings/?slug=post-1", miss=1, hit=0)
+
+    def test_revalidation(self):
+        # a matching ETag is answered from the cache generations alone
+        for url in ("/api/blog/post/?slug=post-1", "/api/blog/posts/", "/api/blog/categories/"):
+            etag = self.client.get(url).headers["ETag"]
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+    def test_category_list(self):
+        self.assertQueries("/api/blog/categories/", miss=1, hit=0)
+        self.assertQueries("/api/blog/categories/?parent_slug=django", miss=1, hit=0)
+
+
+class FastListSerializationTests(APITestCase):
+    """The values()-based list payloads must render exactly like the DRF serializers."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Django", slug="django")
+        Category.objects.create(name="Empty", slug="empty")
+        for i in range(3):
+            Post.objects.create(
+                title=f"Post {i}",
+                description=None if i else "Description",
+                content="<p>Content</p>",
+                thumbnail="blog/post/thumbnail.png" if i else None,
+                thumbnail_variants={
+                    "source": "blog/post/thumbnail.png",
+                    "variants": [
+                        {"name": "blog/post/thumbnail.320w.webp", "width": 320, "height": 180, "format": "webp"},
+                        {"name": "blog/post/thumbnail.320w.jpg", "width": 320, "height": 180, "format": "jpeg"},
+                    ],
+                } if i == 2 else {},
+                keywords="django",
+                slug=f"post-{i}",
+                status="published",
+                author="author",
+                category=category,
+            )
+
+    def render(self, items):
+        return JSONRenderer().render(sorted(items, key=lambda item: item["id"]))
+
+    def test_post_list_rows(self):
+        posts = Post.postobjects.all()
+        self.assertEqual(
+            self.render(post_list_rows(posts)),
+            self.render(PostListSerializer(post_list_queryset(posts), many=True).data),
+        )
+
+    def test_category_list_rows(self):
+        categories = Category.objects.all()
+        self.assertEqual(
+            self.render(category_list_rows(categories)),
+            self.render(CategoryListSerializer(categories, many=True).data),
+        )
+
+
+@override_settings(
+    VALID_API_KEYS=[API_KEY],
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+)
+class ClickViewTests(FakeRedisMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Django", slug="django")
+        cls.post = Post.objects.create(
+            title="Post", content="<p>Content</p>", keywords="django", slug="post",
+            status="published", author="author", category=cls.category,
+        )
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client.credentials(HTTP_API_KEY=API_KEY)
+
+    def click(self, name, slug):
+        return self.client.post(reverse(name), {"slug": slug}, format="json")
+
+    def test_click_returns_count(self):
+        # the UPDATE, then the new count read back, inside one savepoint
+        for clicks in (1, 2):
+            with self.assertNumQueries(4):
+                response = self.click("increment-post-click", "post")
+            self.assertEqual(response.data["results"]["clicks"], clicks)
+        with self.assertNumQueries(4):
+            response = self.click("increment-category-click", "django")
+        self.assertEqual(response.data["results"]["clicks"], 1)
+        self.assertEqual(PostAnalytics.objects.get(post=self.post).click_through_rate, 0)
+        self.assertEqual(self.click("increment-post-click", "missing").status_code, 404)
+
+    @override_settings(BLOG_BUFFERED_CLICKS=True)
+    def test_buffered_click(self):
+        # same keys as a direct write, the count is only known once flushed
+        for name, slug in (("increment-post-click", "post"), ("increment-category-click", "django")):
+            with self.assertNumQueries(1):
+                response = self.click(name, slug)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data["results"], {"message": "Click recorded successfully", "clicks": None})
+        self.assertEqual(PostAnalytics.objects.get(post=self.post).clicks, 0)
+
+    @override_settings(BLOG_BUFFERED_CLICKS=True)
+    def test_buffered_click_without_redis(self):
+        # a click Redis can't take is written straight to the database
+        with mock.patch("apps.blog.analytics.get_redis", side_effect=redis.ConnectionError("down")):
+            response = self.click("increment-post-click", "post")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"]["clicks"], 1)
+        self.assertEqual(PostAnalytics.objects.get(post=self.post).clicks, 1)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class HeadingSyncTests(TestCase):
+
+    def save_queries(self, headings):
+        post = Post.objects.create(
+            title="Post", content="<p>Content</p>", keywords="django", slug=f"post-{headings}",
+            status="published", author="author", category=Category.objects.create(name="Django", slug="django"),
+        )
+        post.content = "".join(f"<h2>Heading {i}</h2><p>Content</p>" for i in range(headings))
+        post.save()
+        post.content = post.content.replace("Heading", "Section")
+        with CaptureQueriesContext(connection) as context:
+            post.save()
+        self.assertEqual(list(post.headings.values_list("title", flat=True)), [f"Section {i}" for i in range(headings)])
+        return len(context.captured_queries)
+
+    def test_no_query_per_heading(self):
+        self.assertEqual(self.save_queries(20), self.save_queries(2))
+
+    def test_heading_delete_invalidates_post(self):
+        post = Post.objects.create(
+            title="Post", content="<h2>Intro</h2><p>Content</p>", keywords="django", slug="post",
+            status="published", author="author", category=Category.objects.create(name="Django", slug="django"),
+        )
+        namespace = post_namespace("post")
+        before = get_generations(namespace)[namespace]
+        with self.captureOnCommitCallbacks(execute=True):
+            post.headings.get().delete()
+        self.assertGreater(get_generations(namespace)[namespace], before)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class ThumbnailVariantTests(APITestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media_settings = self.settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.category = Category.objects.create(name="Django", slug="django")
+
+    def image(self, width, height, mode="RGBA"):
+        output = io.BytesIO()
+        Image.new(mode, (width, height), "red").save(output, format="PNG")
+        return ContentFile(output.getvalue(), name="cover.png")
+
+    def test_variants(self):
+        with mock.patch("apps.blog.tasks.generate_thumbnail_variants.delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.category.thumbnail.save("cover.png", self.image(800, 400))
+        delay.assert_called_once_with("blog.Category", str(self.category.pk))
+
+        variants = update_thumbnail_variants(Category, self.category.pk)
+        storage = self.category.thumbnail.storage
+        # 1024 would upscale the 800px original
+        self.assertEqual(
+            [(variant["width"], variant["height"], variant["format"]) for variant in variants["variants"]],
+            [(320, 160, "webp"), (320, 160, "jpeg"), (640, 320, "webp"), (640, 320, "jpeg")],
+        )
+        self.assertTrue(all(storage.exists(variant["name"]) for variant in variants["variants"]))
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.thumbnail_variants, variants)
+
+        # Up to date variants are not rendered again
+        with mock.patch("apps.blog.thumbnails.render_variant") as render:
+            self.assertEqual(update_thumbnail_variants(Category, self.category.pk, force=False), variants)
+            self.category.thumbnail_variants = {}
+            self.category.save(update_fields=["thumbnail_variants"])
+            self.assertEqual(update_thumbnail_variants(Category, self.category.pk), variants)
+        render.assert_not_called()
+
+        # A smaller image replaces them, the stale ones are deleted
+        self.category.refresh_from_db()
+        with mock.patch("apps.blog.tasks.generate_thumbnail_variants.delay"):
+            self.category.thumbnail.save("small.png", self.image(200, 100, mode="RGB"))
+        replaced = update_thumbnail_variants(Category, self.category.pk)
+        self.assertEqual([variant["width"] for variant in replaced["variants"]], [200, 200])
+        self.assertFalse(any(storage.exists(variant["name"]) for variant in variants["variants"]))
+
+    def test_srcset(self):
+        with mock.patch("apps.blog.tasks.generate_thumbnail_variants.delay"):
+            self.category.thumbnail.save("cover.png", self.image(700, 350))
+        update_thumbnail_variants(Category, self.category.pk)
+        self.category.refresh_from_db()
+        srcset = CategorySerializer(self.category).data["thumbnail_srcset"]
+        self.assertEqual(sorted(srcset), ["jpeg", "webp"])
+        self.assertRegex(srcset["webp"], r"^\S+\.320w\.webp 320w, \S+\.640w\.webp 640w$")
+        self.assertIsNone(CategorySerializer(Category(name="New", slug="new")).data["thumbnail_srcset"])
+
+
+@override_settings(
+    VALID_API_KEYS=[API_KEY],
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+)
+class TransferTests(APITestCase):
+    """export_posts NDJSON must import back into the same blog."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Django", slug="django", description="Web")
+        child = Category.objects.create(name="ORM", slug="orm", parent=category)
+        for i in range(5):
+            Post.objects.create(
+                title=f"Post {i}",
+                description="Description",
+                content=f"<h2>Intro {i}</h2><p>Content</p><h3>Details</h3>",
+                keywords="django",
+                slug=f"post-{i}",
+                status="draft" if i == 4 else "published",
+                author="author",
+                category=child if i % 2 else category,
+            )
+
+    def export(self):
+        return [json.loads(line) for line in export_ndjson(chunk_size=2)]
+
+    def test_round_trip(self):
+        lines = list(export_ndjson(chunk_size=2))
+        Category.objects.all().delete()
+
+        stats = PostImporter(batch_size=2).run(lines)
+        self.assertEqual((stats["categories"], stats["posts"], stats["headings"], stats["skipped"]), (2, 5, 10, 0))
+        self.assertEqual(self.export(), [json.loads(line) for line in lines])
+        self.assertEqual(PostAnalytics.objects.count(), 5)
+        self.assertEqual(
+            list(Category.objects.order_by("depth").values_list("published_post_count", "subtree_post_count")),
+            [(2, 4), (2, 2)],
+        )
+
+        # Importing again updates the same rows
+        edited = [line.replace('"Post 1"', '"Post one"') for line in lines] + ["not json\n"]
+        stats = PostImporter(batch_size=2).run(edited)
+        self.assertEqual((stats["posts"], stats["skipped"]), (5, 1))
+        self.assertEqual(Post.objects.count(), 5)
+        self.assertEqual(Post.objects.get(slug="post-1").title, "Post one")
+        self.assertEqual(Heading.objects.count(), 10)
+
+    def test_export_view_staff_only(self):
+        url = reverse("post-export")
+        self.client.credentials(HTTP_API_KEY=API_KEY)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        staff = User.objects.create_user("staff", password="password", is_staff=True)
+        self.client.force_authenticate(staff)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        records = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual(records, self.export())
+
+
+@override_settings(
+    VALID_API_KEYS=[API_KEY],
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+)
+class AsyncReadViewTests(APITestCase):
+    """The async read views (BLOG_ASYNC_VIEWS) must answer byte for byte like the sync ones."""
+
+    views = {
+        "/api/blog/posts/": async_views.AsyncPostListView,
+        "/api/blog/post/": async_views.AsyncPostDetailView,
+        "/api/blog/post/headings/": async_views.AsyncPostHeadingsView,
+        "/api/blog/categories/": async_views.AsyncCategoryListView,
+        "/api/blog/category/posts/": async_views.AsyncCategoryDetailView,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Django", slug="django")
+        Category.objects.create(name="ORM", slug="orm", parent=category)
+        for i in range(8):
+            Post.objects.create(
+                title=f"Post {i}",
+                description="Description",
+                content=f"<h2>Intro {i}</h2><p>Content</p>",
+                keywords="django",
+                slug=f"post-{i}",
+                status="published",
+                author="author",
+                category=category,
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client.credentials(HTTP_API_KEY=API_KEY)
+
+    def assertSameResponse(self, path, **params):
+        expected = self.client.get(path, params)
+        view = self.views[path].as_view()
+        for attempt in ("miss", "hit"):
+            request = AsyncRequestFactory().get(path, params, headers={"API-Key": API_KEY})
+            response = async_to_sync(view)(request)
+            self.assertEqual(response.status_code, expected.status_code, attempt)
+            self.assertEqual(response.content, expected.content, attempt)
+            self.assertEqual(response.get("ETag"), expected.get("ETag"), attempt)
+
+    def test_post_list(self):
+        self.assertSameResponse("/api/blog/posts/", page_size=3, p=2)
+        self.assertSameResponse("/api/blog/posts/", search="post", sorting="most_viewed")
+        self.assertSameResponse("/api/blog/posts/", pagination="cursor")
+        self.assertSameResponse("/api/blog/posts/", p=99)
+
+    def test_post_detail(self):
+        self.assertSameResponse("/api/blog/post/", slug="post-1")
+        self.assertSameResponse("/api/blog/post/headings/", slug="post-1")
+        self.assertSameResponse("/api/blog/post/", slug="missing")
+
+    def test_categories(self):
+        self.assertSameResponse("/api/blog/categories/")
+        self.assertSameResponse("/api/blog/category/posts/", slug="django", include_descendants="true")
+        self.assertSameResponse("/api/blog/category/posts/", slug="missing")
+
+    def test_api_key_required(self):
+        request = AsyncRequestFactory().get("/api/blog/posts/")
+        response = async_to_sync(self.views["/api/blog/posts/"].as_view())(request)
+        self.assertEqual(response.status_code, 403)
+        self.client.credentials()
+        self.assertEqual(response.content, self.client.get("/api/blog/posts/").content)
+
+
+class LiveCounterWatchTests(SimpleTestCase):
+    """Deltas pushed by apps.blog.live, from raw bucket totals."""
+
+    def test_deltas(self):
+        watch = CounterWatch(bucket=10)
+        # what the bucket held when the watch started is a baseline
+        self.assertEqual(watch.delta("clicks", 10, b"7"), 0)
+        self.assertEqual(watch.delta("clicks", 10, b"9"), 2)
+        # a counter that shows up later, or a newer bucket, counts in full
+        self.assertEqual(watch.delta("views", 10, None), 0)
+        self.assertEqual(watch.delta("views", 10, b"3"), 3)
+        self.assertEqual(watch.delta("clicks", 11, b"4"), 4)
+
+    def test_claimed_bucket(self):
+        watch = CounterWatch(bucket=10)
+        watch.delta("clicks", 10, b"5")
+        # renamed away by the sync task, then recreated by a late increment
+        self.assertEqual(watch.delta("clicks", 10, None), 0)
+        self.assertEqual(watch.delta("clicks", 10, b"1"), 1)
+
+
+class StubPipeline:
+
+    def __init__(self, executed):
+        self.executed = executed
+        self.commands = []
+
+    def incr(self, key):
+        self.commands.append(key)
+
+    def execute(self):
+        self.executed.append(self.commands)
+        return [f"{key}:ok" for key in self.commands]
+
+
+class PipelinedTests(SimpleTestCase):
+    """core.redis.pipelined hands every item its own replies, batch after batch."""
+
+    def test_replies_per_item(self):
+        executed = []
+        client = mock.Mock(pipeline=lambda transaction: StubPipeline(executed))
+
+        def queue(pipe, item):
+            for _ in range(item):
+                pipe.incr(f"key{item}")
+            return item
+
+        replies = pipelined(client, [1, 2, 0, 3], queue, batch_size=2)
+        self.assertEqual(replies, [["key1:ok"], ["key2:ok", "key2:ok"], [], ["key3:ok"] * 3])
+        self.assertEqual(len(executed), 2)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class ViewStreamTests(FakeRedisMixin, TestCase):
+    """Views queued on the Redis stream and counted by drain_view_stream."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Django", slug="django")
+        cls.post = Post.objects.create(
+            title="Post", content="<p>Content</p>", keywords="django", slug="post",
+            status="published", author="author", category=category,
+        )
+
+    def view(self, *ip_addresses):
+        for ip_address in ip_addresses:
+            record_view(POST, self.post.id, ip_address)
+
+    def rollup(self, period="day"):
+        return PostAnalyticsRollup.objects.filter(post=self.post, period=period).values("views", "unique_views").get()
+
+    def assertUniqueViews(self, views):
+        self.assertEqual(PostAnalytics.objects.get(post=self.post).views, views)
+
+    def test_exact(self):
+        self.view("10.0.0.1", "10.0.0.1", "10.0.0.2")
+        self.assertEqual(drain_view_stream(POST)["views"], 2)
+        self.assertEqual(PostView.objects.count(), 2)
+        self.assertUniqueViews(2)
+
+    def test_malformed_entries(self):
+        # anything the drain can't count is acked with its batch instead of failing it on every retry
+        stream = view_stream_key(POST)
+        get_redis().xadd(stream, {"id": str(self.post.id), "ip": "foo"})
+        get_redis().xadd(stream, {"id": "not-a-uuid", "ip": "10.0.0.1"})
+        get_redis().xadd(stream, {"ip": "10.0.0.1"})
+        self.view("10.0.0.1")
+
+        stats = drain_view_stream(POST)
+        self.assertEqual((stats["events"], stats["views"], stats["pending"], stats["length"]), (4, 1, 0, 0))
+        self.assertEqual(list(PostView.objects.values_list("ip_address", flat=True)), ["10.0.0.1"])
+
+    def test_claims_entries_of_dead_consumers(self):
+        self.view("10.0.0.1", "10.0.0.2")
+        ensure_view_group(POST)
+        # read by a worker that died before acknowledging them
+        get_redis().xreadgroup(VIEW_STREAM_GROUP, "dead", {view_stream_key(POST): ">"})
+        with mock.patch("apps.blog.tasks.VIEW_STREAM_CLAIM_IDLE_MS", 0):
+            stats = drain_view_stream(POST)
+        self.assertEqual((stats["events"], stats["views"], stats["pending"]), (2, 2, 0))
+        self.assertUniqueViews(2)
+
+    def test_client_ip(self):
+        factory = RequestFactory()
+        for forwarded_for, expected in (
+            ("203.0.113.7, 10.0.0.1", "203.0.113.7"),
+            (" 2001:DB8::1 ", "2001:db8::1"),
+            ("foo", None),
+            ("", "127.0.0.1"),
+        ):
+            request = factory.get("/", HTTP_X_FORWARDED_FOR=forwarded_for)
+            self.assertEqual(get_client_ip(request), expected)
+
+        # views without an address are not queued
+        self.view(None)
+        self.assertFalse(get_redis().exists(view_stream_key(POST)))
+
+    def test_rollups(self):
+        # every view counts in views, each viewer once a day in unique_views
+        self.view("10.0.0.1", "10.0.0.1", "10.0.0.2")
+        drain_view_stream(POST)
+        self.assertEqual(drain_view_stream(POST)["events"], 0)
+        rollup_views(POST)
+        self.assertEqual(self.rollup(), {"views": 3, "unique_views": 2})
+        self.assertEqual(self.rollup("hour"), {"views": 3, "unique_views": 2})
+
+        # recomputing unique views leaves the view totals alone
+        self.view("10.0.0.1")
+        drain_view_stream(POST)
+        rollup_views(POST)
+        self.assertEqual(self.rollup(), {"views": 4, "unique_views": 2})
+
+    def test_redis_backends_write_no_rows(self):
+        for backend in ("hyperloglog", "bloom"):
+            with self.subTest(backend), self.settings(BLOG_VIEW_DEDUP_BACKEND=backend):
+                PostAnalytics.objects.filter(post=self.post).update(views=0)
+                PostAnalyticsRollup.objects.all().delete()
+                get_redis().flushall()
+
+                self.view("10.0.0.1", "10.0.0.1", "10.0.0.2")
+                drain_view_stream(POST)
+                # a viewer seen in an earlier drain is not new either
+                self.view("10.0.0.2", "10.0.0.3")
+                drain_view_stream(POST)
+
+                self.assertFalse(PostView.objects.exists())
+                self.assertUniqueViews(3)
+                self.assertEqual(self.rollup(), {"views": 5, "unique_views": 3})
+                self.assertEqual(self.rollup("hour"), {"views": 5, "unique_views": 3})
+
+
+@override_settings(
+    VALID_API_KEYS=[API_KEY],
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+)
+class AnalyticsEventsTests(FakeRedisMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Django", slug="django")
+        cls.post = Post.objects.create(
+            title="Post", content="<p>Content</p>", keywords="django", slug="post",
+            status="published", author="author", category=cls.category,
+        )
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client.credentials(HTTP_API_KEY=API_KEY)
+
+    def send(self, events):
+        response = self.client.post(reverse("analytics-events"), {"events": events}, format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data["results"]
+
+    def test_events(self):
+        results = self.send([
+            {"type": "post", "event": "click", "slug": "post"},
+            {"type": "post", "event": "impression", "id": str(self.post.id), "timestamp": 1},
+            {"type": "category", "event": "view", "slug": "django"},
+            {"type": "post", "event": "view", "id": "00000000-0000-0000-0000-000000000000"},
+            {"type": "category", "event": "click", "id": str(self.post.id)},
+            {"type": "post", "event": "click", "slug": "missing"},
+            {"type": "post", "event": "share", "slug": "post"},
+            {"type": "post", "event": "click", "id": "not-a-uuid"},
+            "click",
+        ])
+        self.assertEqual(results, {"accepted": 3, "rejected": 6})
+        self.assertEqual(get_redis().xlen(view_stream_key(CATEGORY)), 1)
+        self.assertFalse(get_redis().exists(view_stream_key(POST)))
+
+
+@override_settings(
+    VALID_API_KEYS=[API_KEY],
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    API_RATE_LIMITS={"default": {"rate": 0.01, "burst": 1}},
+    API_KEY_QUOTAS={},
+)
+class RateLimitTests(FakeRedisMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Django", slug="django")
+        Post.objects.create(
+            title="Post", content="<p>Content</p>", keywords="django", slug="post",
+            status="published", author="author", category=category,
+        )
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client.credentials(HTTP_API_KEY=API_KEY)
+
+    def usage(self):
+        return {
+            field.decode("utf-8").rsplit(":", 1)[1]: int(value)
+            for key in get_redis().scan_iter(match=usage_key("*"))
+            for field, value in get_redis().hgetall(key).items()
+        }
+
+    def test_throttled(self):
+        self.assertEqual(self.client.get(reverse("post-list")).status_code, 200)
+        response = self.client.get(reverse("post-list"))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "100")
+        usage = self.usage()
+        self.assertEqual((usage["requests"], usage["throttled"]), (2, 1))
+
+    def test_browsable_api_charged_once(self):
+        response = self.client.get(reverse("post-list"), HTTP_ACCEPT="text/html")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.usage()["requests"], 1)
+
+    def test_aggregate_usage(self):
+        bucket = int(time.time() // USAGE_BUCKET_SECONDS) - 1
+        get_redis().hset(usage_key(bucket), mapping={"abc:requests": 3, "abc:latency_count": 2, "abc:latency_ms": 50})
+        get_redis().hset(usage_key(bucket + 1), "abc:requests", 1)
+
+        summary = aggregate_api_usage()
+        self.assertEqual(summary["abc"]["requests"], 3)
+        self.assertEqual(aggregate_api_usage(), {})
+
+        day = datetime.date.fromtimestamp(bucket * USAGE_BUCKET_SECONDS).isoformat()
+        self.assertEqual(
+            get_redis().hgetall(f"api_usage:day:{day}"),
+            {b"abc:requests": b"3", b"abc:latency_count": b"2", b"abc:latency_ms": b"50"},
+        )
+        self.assertFalse(get_redis().exists(usage_key(bucket)))
+        self.assertTrue(get_redis().exists(usage_key(bucket + 1)))
+
+
+@override_settings(
+    VALID_API_KEYS=[API_KEY],
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+)
+class ImpressionCounterTests(FakeRedisMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Django", slug="django")
+        cls.posts = [
+            Post.objects.create(
+                title=f"Post {i}", content="<p>Content</p>", keywords="django", slug=f"post-{i}",
+                status="published", author="author", category=cls.category,
+            )
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client.credentials(HTTP_API_KEY=API_KEY)
+
+    def test_listing_records_impressions(self):
+        bucket = current_bucket()
+        with mock.patch("apps.blog.analytics.current_bucket", return_value=bucket):
+            self.assertEqual(self.client.get(reverse("post-list")).status_code, 200)
+            self.assertEqual(self.client.get(reverse("post-list")).status_code, 200)
+
+        self.assertEqual(get_redis().smembers(counter_buckets_key(POST, IMPRESSIONS)), {str(bucket).encode()})
+        self.assertEqual(
+            get_redis().hgetall(counter_key(POST, IMPRESSIONS, bucket)),
+            {str(post.id).encode(): b"2" for post in self.posts},
+        )
+
+    def queue_impressions(self, bucket, counts):
+        pipe = get_redis().pipeline()
+        queue_counters(pipe, {(POST, IMPRESSIONS, bucket, object_id): count for object_id, count in counts.items()})
+        pipe.execute()
+
+    def impressions(self):
+        return dict(PostAnalytics.objects.filter(impressions__gt=0).values_list("post__slug", "impressions"))
+
+    def test_flush(self):
+        bucket = current_bucket() - 2
+        self.queue_impressions(bucket, {str(self.posts[0].id): 3, str(self.posts[1].id): 1, "not-a-uuid": 5})
+        self.queue_impressions(current_bucket() + 1, {str(self.posts[2].id): 1})
+
+        self.assertEqual(flush_counters(POST, IMPRESSIONS)["total"], 4)
+        self.assertEqual(flush_counters(POST, IMPRESSIONS)["total"], 0)
+        self.assertEqual(self.impressions(), {"post-0": 3, "post-1": 1})
+        self.assertEqual(
+            PostAnalyticsRollup.objects.get(post=self.posts[0], period="hour").impressions, 3,
+        )
+        self.assertFalse(get_redis().exists(counter_key(POST, IMPRESSIONS, bucket)))
+
+    def test_late_increment_flushed_next_run(self):
+        bucket = current_bucket() - 2
+        self.queue_impressions(bucket, {str(self.posts[0].id): 3})
+
+        def late_apply(*args):
+            # Lands after the bucket was claimed, recreating it
+            self.queue_impressions(bucket, {str(self.posts[0].id): 2})
+            return apply_counters(*args)
+
+        with mock.patch("apps.blog.tasks.apply_counters", side_effect=late_apply):
+            self.assertEqual(flush_counters(POST, IMPRESSIONS)["total"], 3)
+        self.assertEqual(flush_counters(POST, IMPRESSIONS)["total"], 2)
+        self.assertEqual(self.impressions(), {"post-0": 5})
+
+    def test_interrupted_flush_resumed(self):
+        key = counter_key(POST, IMPRESSIONS, current_bucket() - 2)
+        get_redis().hset(f"{key}:flushing", str(self.posts[1].id), 4)
+
+        self.assertEqual(flush_counters(POST, IMPRESSIONS)["buckets"], 1)
+        self.assertEqual(self.impressions(), {"post-1": 4})
+
+
+class CategoryCounterTests(TestCase):
+
+    def setUp(self):
+        self.root = Category.objects.create(name="Python", slug="python")
+        self.child = Category.objects.create(name="Django", slug="django", parent=self.root)
+
+    def create_post(self, slug, category, status="published"):
+        return Post.objects.create(
+            title=slug, content="<p>Content</p>", keywords="django", slug=slug,
+            status=status, author="author", category=category,
+        )
+
+    def counters(self, category):
+        category.refresh_from_db()
+        return category.published_post_count, category.subtree_post_count, category.latest_post_at
+
+    def test_receivers(self):
+        first = self.create_post("first", self.child)
+        second = self.create_post("second", self.child)
+        self.create_post("draft", self.root, status="draft")
+        self.assertEqual(self.counters(self.child), (2, 2, second.created_at))
+        self.assertEqual(self.counters(self.root), (0, 2, None))
+
+        second.status = "draft"
+        second.save()
+        first.category = self.root
+        first.save()
+        self.assertEqual(self.counters(self.child), (0, 0, None))
+        self.assertEqual(self.counters(self.root), (1, 1, first.created_at))
+
+        first.delete()
+        self.assertEqual(self.counters(self.root), (0, 0, None))
+
+    def test_unrelated_update_fields(self):
+        post = self.create_post("post", self.child)
+        post.thumbnail_variants = {"320": "thumb.webp"}
+        # only the UPDATE, the tracked fields are not read back
+        with self.assertNumQueries(1):
+            post.save(update_fields=["thumbnail_variants"])
+        self.assertEqual(self.counters(self.child), (1, 1, post.created_at))
+
+    def test_reconcile(self):
+        post = self.create_post("post", self.child)
+        Category.objects.update(published_post_count=5, subtree_post_count=0, latest_post_at=None)
+
+        self.assertEqual(reconcile_category_counters(), 2)
+        self.assertEqual(self.counters(self.child), (1, 1, post.created_at))
+        self.assertEqual(self.counters(self.root), (0, 1, None))
+        self.assertEqual(reconcile_category_counters(), 0)
+
+
+@override_settings(
+    VALID_API_KEYS=[API_KEY],
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+)
+class SearchTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Django", slug="django")
+        for slug, title, keywords, content in [
+            ("in-content", "Post", "python", "<p>All about celery</p>"),
+            ("in-title", "Celery tasks", "python", "<p>Content</p>"),
+            ("in-keywords", "Post", "celery", "<p>Content</p>"),
+            ("no-match", "Post", "python", "<p>Content</p>"),
+        ]:
+            Post.objects.create(
+                title=title, content=content, keywords=keywords, slug=slug,
+                status="published", author="author", category=category,
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client.credentials(HTTP_API_KEY=API_KEY)
+
+    def test_ranking(self):
+        response = self.client.get(reverse("post-list"), {"search": "celery"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([post["slug"] for post in response.data["results"]], ["in-title", "in-keywords", "in-content"])
+
+
+@override_settings(
+    VALID_API_KEYS=[API_KEY],
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+)
+class CacheInvalidationTests(FakeRedisMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Django", slug="django")
+        cls.posts = [
+            Post.objects.create(
+                title=f"Post {i}", content="<p>Content</p>", keywords="django", slug=f"post-{i}",
+                status="published", author="author", category=cls.category,
+            )
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client.credentials(HTTP_API_KEY=API_KEY)
+
+    def titles(self):
+        return {post["slug"]: post["title"] for post in self.client.get("/api/blog/posts/").data["results"]}
+
+    def fragment_keys(self, posts):
+        generations = get_generations(CATEGORIES, VIEW_COUNTS)
+        return post_fragment_keys([str(post.id) for post in posts], *generations.values())
+
+    def fragments(self):
+        return get_post_fragments(self.fragment_keys(self.posts))
+
+    def test_fragments_survive_other_posts_changes(self):
+        self.titles()
+        self.assertEqual(len(self.fragments()), 3)
+
+        post = self.posts[0]
+        post.title = "Renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            post.save()
+        self.assertEqual(set(self.fragments()), {str(p.id) for p in self.posts[1:]})
+        # the ID list is rebuilt, only the changed post is loaded again
+        with self.assertNumQueries(2):
+            self.assertEqual(self.titles()["post-0"], "Renamed")
+
+    def test_late_fragment_write_is_orphaned(self):
+        # a miss that read the row before the edit committed stores it afterwards
+        keys = self.fragment_keys(self.posts[:1])
+        stale = self.titles()
+        post = self.posts[0]
+        post.title = "Renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            post.save()
+        set_post_fragments({str(post.id): {"slug": "post-0", "title": stale["post-0"]}}, keys)
+
+        self.assertEqual(self.titles()["post-0"], "Renamed")
+
+    def test_post_save_invalidates(self):
+        self.assertEqual(self.client.get("/api/blog/post/", {"slug": "post-1"}).status_code, 200)
+        post = self.posts[1]
+        post.slug = "moved"
+        post.status = "draft"
+        with self.captureOnCommitCallbacks(execute=True):
+            post.save()
+
+        self.assertEqual(self.client.get("/api/blog/post/", {"slug": "post-1"}).status_code, 404)
+        self.assertNotIn("moved", self.titles())
+
+    def test_category_save_invalidates(self):
+        self.titles()
+        before = get_generations(CATEGORIES, POST_LISTS)
+        self.category.name = "Python"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.save()
+
+        after = get_generations(CATEGORIES, POST_LISTS)
+        self.assertTrue(all(after[namespace] > before[namespace] for namespace in before))
+        results = self.client.get("/api/blog/posts/").data["results"]
+        self.assertEqual({post["category"]["name"] for post in results}, {"Python"})
+
+    def test_view_counts_published_by_drain(self):
+        post = self.posts[0]
+        detail = self.client.get("/api/blog/post/", {"slug": "post-0"})
+        listing = self.client.get("/api/blog/posts/", {"sorting": "most_viewed"})
+        self.assertEqual(detail.json()["results"]["view_count"], 0)
+
+        record_view(POST, post.id, "10.0.0.2")
+        drain_view_stream(POST)
+
+        response = self.client.get("/api/blog/post/", {"slug": "post-0"}, HTTP_IF_NONE_MATCH=detail["ETag"])
+        self.assertEqual(response.status_code, 200)
+        # the first request's own view and this one
+        self.assertEqual(response.json()["results"]["view_count"], 2)
+        response = self.client.get("/api/blog/posts/", {"sorting": "most_viewed"}, HTTP_IF_NONE_MATCH=listing["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"][0], {**response.data["results"][0], "slug": "post-0", "view_count": 2})
+
+    def test_view_counts_bumped_at_most_once_per_max_age(self):
+        self.assertTrue(touch_view_counts())
+        generation = get_generations(VIEW_COUNTS)[VIEW_COUNTS]
+        self.assertFalse(touch_view_counts())
+        self.assertFalse(touch_view_counts(changed=False))
+        self.assertEqual(get_generations(VIEW_COUNTS)[VIEW_COUNTS], generation)
+
+        # once the interval is over, the held back change goes out without new views
+        cache.delete("view_counts:bumped")
+        self.assertTrue(touch_view_counts(changed=False))
+        self.assertGreater(get_generations(VIEW_COUNTS)[VIEW_COUNTS], generation)
+        cache.delete("view_counts:bumped")
+        self.assertFalse(touch_view_counts(changed=False))
@@ -0,0 +1,122 @@
+import io
+import logging
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+# Card and content widths the frontend asks for, in pixels
+THUMBNAIL_WIDTHS = tuple(sorted(getattr(settings, "BLOG_THUMBNAIL_WIDTHS", (320, 640, 1024))))
+THUMBNAIL_FORMATS = tuple(getattr(settings, "BLOG_THUMBNAIL_FORMATS", ("webp", "jpeg")))
+THUMBNAIL_QUALITY = getattr(settings, "BLOG_THUMBNAIL_QUALITY", 80)
+
+# format -> (file extension, Pillow save options)
+FORMAT_OPTIONS = {
+    "webp": ("webp", {"format": "WEBP", "method": 4}),
+    "jpeg": ("jpg", {"format": "JPEG", "optimize": True, "progressive": True}),
+}
+
+
+def variant_name(name, width, image_format):
+    # Next to the original: blog/<title>/cover.png -> blog/<title>/cover.640w.webp
+    root, ext = os.path.splitext(name)
+    return f"{root}.{width}w.{FORMAT_OPTIONS[image_format][0]}"
+
+
+def supported_formats():
+    formats = []
+    for image_format in THUMBNAIL_FORMATS:
+        if image_format not in FORMAT_OPTIONS or (image_format == "webp" and not features.check("webp")):
+            logger.warning(f"Thumbnail format {image_format} is not supported, skipped")
+            continue
+        formats.append(image_format)
+    return formats
+
+
+def target_widths(width):
+    # Never upscale: widths above the original are dropped, a small image keeps its own width
+    return [target for target in THUMBNAIL_WIDTHS if target < width] or [width]
+
+
+def render_variant(image, width, image_format):
+    height = max(1, round(image.height * width / image.width))
+    variant = image.resize((width, height), Image.Resampling.LANCZOS)
+    if image_format == "jpeg" and variant.mode != "RGB":
+        # JPEG has no alpha, flatten transparent images on white
+        background = Image.new("RGB", variant.size, "white")
+        variant = variant.convert("RGBA")
+        background.paste(variant, mask=variant.getchannel("A"))
+        variant = background
+
+    output = io.BytesIO()
+    variant.save(output, quality=THUMBNAIL_QUALITY, **FORMAT_OPTIONS[image_format][1])
+    return output.getvalue(), height
+
+
+def build_variants(field_file, current=None, force=False):
+    """
+    Return the ``thumbnail_variants`` value for the image in ``field_file``.
+
+    Variants already in storage are kept unless ``force``, so running this
+    again is cheap. Variants of a previous image are deleted.
+    """
+    current = current or {}
+    storage = field_file.storage
+    variants = []
+
+    if field_file:
+        with field_file.open("rb") as source:
+            image = Image.open(source)
+            image = ImageOps.exif_transpose(image)
+            image.load()
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+
+        for width in target_widths(image.width):
+            height = max(1, round(image.height * width / image.width))
+            for image_format in supported_formats():
+                name = variant_name(field_file.name, width, image_format)
+                if force or not storage.exists(name):
+                    content, height = render_variant(image, width, image_format)
+                    storage.delete(name)
+                    name = storage.save(name, ContentFile(content))
+                variants.append({"name": name, "width": width, "height": height, "format": image_format})
+
+    kept = {variant["name"] for variant in variants}
+    for variant in current.get("variants", []):
+        if variant["name"] not in kept:
+            storage.delete(variant["name"])
+
+    return {"source": field_file.name, "variants": variants} if variants else {}
+
+
+def needs_variants(instance):
+    # The stored variants were built from another image, or the image is gone
+    return (instance.thumbnail.name or "") != (instance.thumbnail_variants or {}).get("source", "")
+
+
+def update_thumbnail_variants(model, pk, force=False):
+    """Build and store the variants of one Post or Category, returning them (None if it is gone)."""
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return None
+    if not force and not needs_variants(instance):
+        return instance.thumbnail_variants
+
+    variants = build_variants(instance.thumbnail, instance.thumbnail_variants, force)
+    if variants != instance.thumbnail_variants:
+        instance.thumbnail_variants = variants
+        # Saving through the model lets the cache receivers invalidate the payloads
+        instance.save(update_fields=["thumbnail_variants"])
+    return variants
+
+
+def thumbnail_srcset(variants, storage):
+    """``{format: srcset}`` for the stored variants, None without any."""
+    srcset = {}
+    for variant in (variants or {}).get("variants", []):
+        srcset.setdefault(variant["format"], []).append(f"{storage.url(variant['name'])} {variant['width']}w")
+    return {image_format: ", ".join(entries) for image_format, entries in srcset.items()} or None
@@ -0,0 +1,190 @@
+import json
+import logging
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models.fields.files import FieldFile
+from django.utils.dateparse import parse_datetime
+
+from .cache import CATEGORIES, POST_LISTS, bump_generation, invalidate_posts
+from .headings import content_hash
+from .models import Category, Heading, Post, PostAnalytics, replacing_headings
+from .search import update_search_vector
+from .tasks import reconcile_category_counters
+
+logger = logging.getLogger(__name__)
+
+# Posts read per query on export and written per transaction on import
+TRANSFER_CHUNK_SIZE = getattr(settings, "BLOG_TRANSFER_CHUNK_SIZE", 2000)
+
+CATEGORY = "category"
+POST = "post"
+HEADING = "heading"
+
+CATEGORY_FIELDS = ("name", "title", "description", "thumbnail")
+POST_FIELDS = ("title", "description", "content", "thumbnail", "keywords", "status", "author", "created_at")
+HEADING_FIELDS = ("slug", "title", "level", "order")
+
+
+def field_value(instance, field):
+    value = getattr(instance, field)
+    # File fields travel as their storage name
+    return (value.name or None) if isinstance(value, FieldFile) else value
+
+
+def export_records(chunk_size=TRANSFER_CHUNK_SIZE):
+    """
+    Yield every category, then every post followed by its headings, as dicts.
+
+    Categories come parents first (ordered by their materialized path) so
+    an import can link them as it reads them. Posts are read ``chunk_size``
+    at a time with their headings prefetched per chunk.
+    """
+    categories = Category.objects.select_related("parent").order_by("path").only("parent__slug", "slug", *CATEGORY_FIELDS)
+    for category in categories.iterator(chunk_size=chunk_size):
+        yield {
+            "type": CATEGORY,
+            "slug": category.slug,
+            "parent": category.parent.slug if category.parent else None,
+            **{field: field_value(category, field) for field in CATEGORY_FIELDS},
+        }
+
+    posts = (
+        Post.objects.select_related("category")
+        .prefetch_related("headings")
+        .order_by("created_at", "id")
+        .only("slug", "category__slug", *POST_FIELDS)
+    )
+    for post in posts.iterator(chunk_size=chunk_size):
+        yield {
+            "type": POST,
+            "slug": post.slug,
+            "category": post.category.slug,
+            **{field: field_value(post, field) for field in POST_FIELDS},
+        }
+        for heading in post.headings.all():
+            yield {"type": HEADING, "post": post.slug, **{field: getattr(heading, field) for field in HEADING_FIELDS}}
+
+
+def export_ndjson(chunk_size=TRANSFER_CHUNK_SIZE):
+    """export_records as NDJSON lines."""
+    for record in export_records(chunk_size):
+        yield json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+class PostImporter:
+    """
+    Import NDJSON records from export_records, upserting on ``slug``.
+
+    Categories are saved one by one as they come (there are few, and saving
+    keeps their paths right). Posts are buffered and written ``batch_size``
+    at a time with one upsert, and what the post_save receivers would do per
+    post (analytics rows, headings, search vectors, cache invalidation) is
+    done once per batch. Category post counters are recomputed at the end.
+    Memory only ever holds one batch.
+    """
+
+    def __init__(self, batch_size=TRANSFER_CHUNK_SIZE):
+        self.batch_size = batch_size
+        self.category_ids = dict(Category.objects.values_list("slug", "id"))
+        self.buffer = {}
+        self.stats = {"categories": 0, "posts": 0, "headings": 0, "thumbnails": 0, "skipped": 0}
+
+    def skip(self, line_number, reason):
+        self.stats["skipped"] += 1
+        logger.warning(f"Skipping record on line {line_number}: {reason}")
+
+    def run(self, lines):
+        for line_number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                self.add(record)
+            except (ValueError, KeyError, TypeError) as e:
+                self.skip(line_number, e)
+        self.flush()
+
+        # Counters are kept per post by the receivers, here they are rebuilt once
+        reconcile_category_counters()
+        bump_generation(CATEGORIES, POST_LISTS)
+        return self.stats
+
+    def add(self, record):
+        kind = record["type"]
+        if kind == CATEGORY:
+            self.add_category(record)
+        elif kind == POST:
+            if len(self.buffer) >= self.batch_size:
+                self.flush()
+            if record["category"] not in self.category_ids:
+                raise ValueError(f"unknown category {record['category']!r}")
+            self.buffer[record["slug"]] = (record, [])
+        elif kind == HEADING:
+            # Headings follow their post, so it is still in the buffer
+            self.buffer[record["post"]][1].append({field: record[field] for field in HEADING_FIELDS})
+        else:
+            raise ValueError(f"unknown type {kind!r}")
+
+    def add_category(self, record):
+        parent = record.get("parent")
+        if parent and parent not in self.category_ids:
+            raise ValueError(f"unknown parent category {parent!r}")
+
+        category = Category.objects.filter(slug=record["slug"]).first() or Category(slug=record["slug"])
+        for field in CATEGORY_FIELDS:
+            setattr(category, field, record.get(field))
+        category.parent_id = self.category_ids.get(parent)
+        category.save()
+        self.category_ids[category.slug] = category.id
+        self.stats["categories"] += 1
+
+    def build_post(self, record, headings):
+        post = Post(
+            slug=record["slug"],
+            category_id=self.category_ids[record["category"]],
+            **{field: record.get(field) for field in POST_FIELDS if field != "created_at"},
+        )
+        if record.get("created_at"):
+            post.created_at = parse_datetime(record["created_at"])
+        if headings:
+            # Exported content already carries the heading anchors
+            post.toc = sorted(headings, key=lambda heading: heading["order"])
+            post.content_hash = content_hash(post.content)
+        else:
+            post.refresh_toc()
+        return post
+
+    def flush(self):
+        if not self.buffer:
+            return
+        posts = [self.build_post(record, headings) for record, headings in self.buffer.values()]
+        slugs = list(self.buffer)
+
+        with transaction.atomic():
+            Post.objects.bulk_create(
+                posts,
+                update_conflicts=True,
+                unique_fields=["slug"],
+                update_fields=[*POST_FIELDS, "category", "toc", "content_hash", "updated_at"],
+            )
+            # Upserted rows keep their own id, read them back
+            ids = dict(Post.objects.filter(slug__in=slugs).values_list("slug", "id"))
+            PostAnalytics.objects.bulk_create([PostAnalytics(post_id=post_id) for post_id in ids.values()], ignore_conflicts=True)
+
+            # Like sync_post_headings, the whole batch is invalidated below
+            with replacing_headings():
+                Heading.objects.filter(post_id__in=ids.values()).delete()
+            headings = Heading.objects.bulk_create(
+                [Heading(post_id=ids[post.slug], **entry) for post in posts for entry in post.toc],
+                batch_size=self.batch_size,
+            )
+            update_search_vector(Post.objects.filter(id__in=ids.values()))
+
+        invalidate_posts(ids.items())
+        self.stats["posts"] += len(posts)
+        self.stats["headings"] += len(headings)
+        # Their variants are left to the generate_thumbnails command
+        self.stats["thumbnails"] += sum(1 for post in posts if post.thumbnail)
+        self.buffer = {}
@@ -1,5 +1,16 @@
+from django.conf import settings
 from django.urls import path
-from .views import PostListView, PostDetailView, PostHeadingsView, CategoryListView, IncrementCategoryClickView, IncrementPostClickView, CategoryDetailView
+from .views import PostListView, PostDetailView, PostHeadingsView, CategoryListView, CategoryTreeView, IncrementCategoryClickView, IncrementPostClickView, CategoryDetailView, PostAnalyticsView, CategoryAnalyticsView, AnalyticsEventsView, PostExportView
+
+# Under ASGI the read endpoints are served by their async variants
+if getattr(settings, "BLOG_ASYNC_VIEWS", False):
+  from .async_views import (
+    AsyncCategoryDetailView as CategoryDetailView,
+    AsyncCategoryListView as CategoryListView,
+    AsyncPostDetailView as PostDetailView,
+    AsyncPostHeadingsView as PostHeadingsView,
+    AsyncPostListView as PostListView,
+  )
 
 
 
@@ -9,6 +20,11 @@ urlpatterns = [
   path('post/headings/', PostHeadingsView.as_view(), name='post-headings'),
   path('post/increment_click/', IncrementPostClickView.as_view(), name='increment-post-click'),
   path('categories/', CategoryListView.as_view(), name='category-list'),
+  path('categories/tree/', CategoryTreeView.as_view(), name='category-tree'),
   path('categories/increment_click/', IncrementCategoryClickView.as_view(), name='increment-category-click'),
   path('category/posts/', CategoryDetailView.as_view(), name='category-posts'),
+  path('post/analytics/', PostAnalyticsView.as_view(), name='post-analytics'),
+  path('category/analytics/', CategoryAnalyticsView.as_view(), name='category-analytics'),
+  path('analytics/events/', AnalyticsEventsView.as_view(), name='analytics-events'),
+  path('posts/export/', PostExportView.as_view(), name='post-export'),
 ]
\ No newline at end of file
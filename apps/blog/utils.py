@@ -1,9 +1,16 @@
+import ipaddress
+
+
 def get_client_ip(request):
     # Get client IP address from request
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
     # If there are multiple IPs, take the first one
     if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0]
+        ip = x_forwarded_for.split(',')[0].strip()
     else:
         ip = request.META.get('REMOTE_ADDR')
-    return ip
\ No newline at end of file
+    # The header is client controlled, anything but an address is dropped
+    try:
+        return str(ipaddress.ip_address(ip))
+    except ValueError:
+        return None
@@ -1,27 +1,188 @@
-import redis
+from rest_framework_api.serializers import APIResponseSerializer
 from rest_framework_api.views import StandardAPIView
+from rest_framework import status
+from rest_framework.response import Response
 from django.conf import settings
-from rest_framework.exceptions import APIException, NotFound
+from rest_framework.exceptions import APIException, NotFound, ParseError
+from rest_framework.permissions import IsAdminUser
 from core.permissions import HasValidAPIKey
 from django.core.cache import cache
-from django.db.models import Q, F, Prefetch
-from .models import CategoryAnalytics, Heading, Post, PostAnalytics, Category
+from .analytics import (
+    CATEGORY,
+    CLICK_ROLLUPS,
+    CLICKS,
+    IMPRESSIONS,
+    POST,
+    parse_event_timestamp,
+    record_counters,
+    record_events,
+    record_view,
+    record_category_clicks,
+    record_category_impressions,
+    record_post_clicks,
+    record_post_impressions,
+)
+from .cache import (
+    CACHE_TIMEOUT,
+    CATEGORIES,
+    LIST_CACHE_TIMEOUT,
+    POST_DETAIL_TIMEOUT,
+    POST_LISTS,
+    VIEW_COUNTS,
+    category_id_key,
+    category_list_key,
+    category_list_namespaces,
+    category_posts_key,
+    category_tree_key,
+    get_generations,
+    get_id_list,
+    get_post_fragments,
+    post_detail_key,
+    post_fragment_keys,
+    post_id_key,
+    post_list_key,
+    post_namespace,
+    post_toc_key,
+    set_id_list,
+    set_post_fragments,
+)
+from .queries import (
+    category_posts,
+    filter_categories,
+    filter_posts,
+    post_detail_queryset,
+    post_list_queryset,
+    sort_posts,
+)
+from .compression import IDENTITY, negotiate_encoding, render_variants, variant_response, wants_plain_json
+from .conditional import ConditionalGetMixin
+from .pagination import PostCursorPagination, is_cursor_request
+from .rollups import PERIODS, get_series
+from .transfer import export_ndjson
+from .models import CategoryAnalytics, Post, PostAnalytics, Category, increment_counters
 from .serializers import (
-    HeadingSerializer,
     PostListSerializer,
     PostSerializer,
     CategoryListSerializer,
     CategorySerializer,
+    category_list_rows,
+    post_list_rows,
 )
+import datetime
+import json
+import redis
 import uuid
-from django.shortcuts import get_object_or_404
-from .tasks import increment_post_impressions, increment_post_views
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .tasks import increment_post_impressions
 from .utils import get_client_ip
 
-redis_client = redis.StrictRedis(host=settings.REDIS_HOST, port=6379, db=0)
+# kind -> (manager of the objects that can be tracked, slug -> id cache key)
+SLUG_LOOKUPS = {
+    POST: (Post.postobjects, post_id_key),
+    CATEGORY: (Category.objects, category_id_key),
+}
+
+def serialize_posts(post_ids, *generations):
+    """
+    Return PostListSerializer output for ``post_ids`` in the given order.
+
+    Serialized posts are cached individually, versioned by their own
+    generation, so a listing hit costs two get_many and only the posts
+    missing from the cache touch the database.
+    """
+    keys = post_fragment_keys(post_ids, *generations)
+    fragments = get_post_fragments(keys)
+    missing = [post_id for post_id in post_ids if post_id not in fragments]
+
+    if missing:
+        if getattr(settings, "BLOG_FAST_LIST_SERIALIZERS", True):
+            posts = post_list_rows(Post.postobjects.filter(id__in=missing))
+        else:
+            posts = PostListSerializer(post_list_queryset().filter(id__in=missing), many=True).data
+        fresh = {str(post["id"]): dict(post) for post in posts}
+        set_post_fragments(fresh, keys)
+        fragments.update(fresh)
+
+    return [fragments[post_id] for post_id in post_ids if post_id in fragments]
+
+def resolve_ids(kind, slugs):
+    """
+    Map slugs to IDs with a single cache round trip.
+
+    Only slugs missing from the cache reach the database, in one query, so
+    buffered analytics stay off the database. Unknown slugs are left out.
+    """
+    manager, key_function = SLUG_LOOKUPS[kind]
+    keys = {key_function(slug): slug for slug in set(slugs)}
+    ids = {keys[key]: object_id for key, object_id in cache.get_many(keys.keys()).items()}
+
+    missing = [slug for slug in keys.values() if slug not in ids]
+    if missing:
+        found = {slug: str(pk) for slug, pk in manager.filter(slug__in=missing).values_list("slug", "id")}
+        cache.set_many({key_function(slug): pk for slug, pk in found.items()}, timeout=CACHE_TIMEOUT)
+        ids.update(found)
+
+    return ids
+
+def existing_ids(kind, object_ids):
+    """The IDs out of ``object_ids`` that can be tracked, in one query."""
+    manager = SLUG_LOOKUPS[kind][0]
+    return {str(pk) for pk in manager.filter(id__in=object_ids).values_list("id", flat=True)}
+
+def get_post_id(slug):
+    """Resolve a published post slug to its ID, cached so buffered analytics skip the database."""
+    post_id = resolve_ids(POST, [slug]).get(slug)
+    if post_id is None:
+        raise NotFound(detail="The requested post does not exist")
+    return post_id
+
+def get_category_id(slug):
+    category_id = resolve_ids(CATEGORY, [slug]).get(slug)
+    if category_id is None:
+        raise NotFound(detail="The requested category does not exist")
+    return category_id
+
+class PostIDListAPIView(ConditionalGetMixin, StandardAPIView):
+    """Paginates post IDs and only hydrates the requested page."""
+
+    def hydrate_page(self, page_ids, generations):
+        serialized_posts = serialize_posts(page_ids, generations[CATEGORIES], generations[VIEW_COUNTS])
+
+        # Count impressions for the whole page in one Redis round trip
+        record_post_impressions(page_ids)
+
+        return serialized_posts
+
+    def paginate_posts(self, request, post_ids, generations):
+        response = self.paginate(request, post_ids)
+
+        if response.data["success"]:
+            response.data["results"] = self.hydrate_page(response.data["results"], generations)
+
+        return response
+
+    def paginate_posts_by_cursor(self, request, posts, generations, sorting=None, ordering=None):
+        paginator = PostCursorPagination(sorting, ordering)
+        page_ids, next_cursor = paginator.paginate_queryset(posts, request)
+        serializer = APIResponseSerializer(
+            {
+                "success": True,
+                "status": status.HTTP_200_OK,
+                "results": self.hydrate_page(page_ids, generations),
+                "next": paginator.get_next_link(request, next_cursor),
+                "previous": None,
+            }
+        )
+        return Response(serializer.data)
 
-class PostListView(StandardAPIView):
+class PostListView(PostIDListAPIView):
     permission_classes = [HasValidAPIKey]
+
+    def get_rate_limit_scope(self, request):
+        # full-text search is the expensive path
+        return "search" if request.query_params.get("search", "").strip() else None
     
     def get(self, request, *args, **kwargs):
         try:
@@ -30,88 +191,45 @@ class PostListView(StandardAPIView):
             sorting = request.query_params.get("sorting", None)
             ordering = request.query_params.get("ordering", None)
             categories = request.query_params.getlist("categories", None)
-            page = request.query_params.get("p", 1)
-            
-            
-            # verify if posts are in cache
-            cache_key = f'post_list:{search}:{sorting}:{ordering}:{categories}:{page}'
-            cached_post = cache.get(cache_key)
             
-            if cached_post:
-                
-                cached_post = [
-                    post for post in cached_post if search.lower() in post['title'].lower() or
-                    search.lower() in post['description'].lower() or
-                    search.lower() in post['content'].lower() or
-                    search.lower() in post['keywords'].lower()
-                ]
-
-                serialized_posts = PostListSerializer(cached_post, many=True).data
-                
-                return self.paginate(request ,cached_post)
+            generations = get_generations(POST_LISTS, CATEGORIES, VIEW_COUNTS)
+            not_modified = self.not_modified(request, *generations.values())
+            if not_modified:
+                return not_modified
+
+            # keyset pages go straight to SQL, the limit makes them cheap
+            if is_cursor_request(request):
+                posts = filter_posts(Post.postobjects.all(), search, categories)
+                return self.paginate_posts_by_cursor(request, posts, generations, sorting, ordering)
             
-            # initial empty queryset
-            posts = Post.postobjects.all().select_related('category').prefetch_related(Prefetch("post_analytics", to_attr="analytics_cache"))
+            # verify if the post IDs are in cache
+            cache_key = post_list_key(search, sorting, ordering, categories, generations[POST_LISTS], generations[VIEW_COUNTS])
+            post_ids = get_id_list(cache_key)
             
-            if not posts.exists():
-                raise NotFound(detail="No posts found")
+            if post_ids is not None:
+                return self.paginate_posts(request, post_ids, generations)
             
             # If not in cache, fetch from database
-            if search != "":
-                posts = Post.postobjects.filter(
-                    Q(title__icontains=search) | 
-                    Q(description__icontains=search) | 
-                    Q(content__icontains=search) |
-                    Q(keywords__icontains=search)
-                )
-                
-            # filter by categories
-            if categories:
-                category_queries = Q()
-                for category in categories:
-                    try:
-                        uuid.UUID(category)
-                        uuid_query = Q(category__id=category)
-                        category_queries |= uuid_query
-                    except ValueError:
-                        slug_query = Q(category__slug=category)
-                        category_queries |= slug_query
-                posts = posts.filter(category_queries).distinct()
-
-            #aplly sorting
-            if sorting:
-                if sorting == "newest":
-                    posts = posts.order_by("-created_at")
-                elif sorting == "recently_updated":
-                    posts = posts.order_by("-updated_at")
-                elif sorting == "oldest":
-                    posts = posts.order_by("created_at")
-                elif sorting == "most_viewed":
-                    posts = posts.annotate(popularity=F("analytics_cache__views")).order_by("-popularity")
-                            
-            #aplly ordering
-            if ordering:
-                if ordering == "asc":
-                    posts = posts.order_by("title")
-                elif ordering == "desc":
-                    posts = posts.order_by("-title")        
-                    
-            # save to cache
-            cache.set(cache_key, posts, timeout=60 * 5)  # Cache for 5 minutes
-
-            # serialize posts
-            serialized_posts = PostListSerializer(posts, many=True).data
-            
-            # Increment impressions for each post in the cached list
-            for post in cached_post:
-                redis_client.incr(f"post:impressions:{post.id}")
+            posts = filter_posts(Post.postobjects.all(), search, categories)
+            posts = sort_posts(posts, search, sorting, ordering)
+
+            post_ids = list(posts.values_list("id", flat=True))
+
+            # only an empty result pays for the "any posts at all" check
+            if not post_ids and not Post.postobjects.exists():
+                raise NotFound(detail="No posts found")
+
+            # save only the ordered IDs, posts are cached one by one
+            post_ids = set_id_list(cache_key, post_ids)
             
-            return self.paginate(request, serialized_posts)
+            return self.paginate_posts(request, post_ids, generations)
         
+        except APIException:
+            raise
         except Exception as e:
             raise APIException(detail=str(e))
 
-class PostDetailView(StandardAPIView):
+class PostDetailView(ConditionalGetMixin, StandardAPIView):
     permission_classes = [HasValidAPIKey]
     
     def get(self, request):
@@ -121,21 +239,40 @@ class PostDetailView(StandardAPIView):
         slug = request.query_params.get("slug")
 
         try:
-            #Verify if post is in cache
-            cached_post = cache.get(f'post_detail:{slug}')
+            post_generation = post_namespace(slug)
+            generations = get_generations(post_generation, CATEGORIES, VIEW_COUNTS)
+
+            # every encoding is its own representation with its own ETag
+            encoding = negotiate_encoding(request) if wants_plain_json(request) else IDENTITY
+
+            # a revalidation still counts as a view, the ID comes from the cache
+            not_modified = self.not_modified(request, *generations.values(), variant=encoding)
+            if not_modified:
+                post_id = cache.get(post_id_key(slug))
+                if post_id:
+                    record_view(POST, post_id, ip_address)
+                return not_modified
+
+            #Verify if post is in cache, stored as rendered (and compressed) bytes
+            cache_key = post_detail_key(slug, generations[post_generation], generations[CATEGORIES], generations[VIEW_COUNTS])
+            cached_post = cache.get(cache_key)
             if cached_post:
-                # Increment impressions for the cached post
-                increment_post_views.delay(cached_post['slug'], ip_address)
-                return self.response(cached_post)
+                # Count the view, a single XADD drained by sync_view_events_to_db
+                record_view(POST, cached_post['id'], ip_address)
+                return self.cached_response(request, cached_post, encoding)
 
             # If not in cache, fetch from database
-            post = Post.postobjects.get(slug=slug)
-            serialized_post = PostSerializer(post).data    
-            
-            # Save to cache
-            cache.set(f'post_detail:{slug}', serialized_post, timeout=60 * 5)  # Cache for 5 minutes
+            post = post_detail_queryset().get(slug=slug)
+            serialized_post = PostSerializer(post).data
+
+            # Render and compress once, edits orphan this key through the post generation
+            cached_post = {"id": str(post.id), **render_variants(self.response(serialized_post).data)}
+            cache.set_many(
+                {cache_key: cached_post, post_id_key(slug): str(post.id)},
+                timeout=POST_DETAIL_TIMEOUT,
+            )
             
-            increment_post_views.delay(post.slug, ip_address)
+            record_view(POST, post.id, ip_address)
             
         except Post.DoesNotExist:
             raise NotFound(
@@ -144,186 +281,410 @@ class PostDetailView(StandardAPIView):
         except Exception as e:
             raise APIException(detail=str(e))
 
-        return self.response(serialized_post)
+        return self.cached_response(request, cached_post, encoding)
+
+    def cached_response(self, request, cached_post, encoding):
+        if wants_plain_json(request):
+            return variant_response(cached_post, encoding)
+        return Response(json.loads(cached_post[IDENTITY]))
 
-class PostHeadingsView(StandardAPIView):
+class PostHeadingsView(ConditionalGetMixin, StandardAPIView):
     permission_classes = [HasValidAPIKey]
     
     def get(self, request):
         
         post_slug = request.query_params.get("slug")
-        heading_objects = Heading.objects.filter(post__slug=post_slug)
-        serialized_data = HeadingSerializer(heading_objects, many=True).data
 
-        return self.response(serialized_data)
+        # The TOC is stored on the post, a cache hit costs no query at all
+        post_generation = post_namespace(post_slug)
+        generation = get_generations(post_generation)[post_generation]
+        not_modified = self.not_modified(request, generation)
+        if not_modified:
+            return not_modified
+
+        cache_key = post_toc_key(post_slug, generation)
+        toc = cache.get(cache_key)
+        if toc is None:
+            toc = Post.objects.filter(slug=post_slug).values_list("toc", flat=True).first() or []
+            cache.set(cache_key, toc, timeout=CACHE_TIMEOUT)
+
+        return self.response(toc)
 
 class IncrementPostClickView(StandardAPIView):
     permission_classes = [HasValidAPIKey]
+    rate_limit_scope = "analytics"
 
     def post(self, request):
         """Incrementa el contador de clics de un post basado en su slug."""
 
-        data = request.data
+        slug = request.data.get("slug")
 
-        try:
-            post = Post.postobjects.get(slug=data["slug"])
-        except Post.DoesNotExist:
-            raise NotFound(detail="The requested post does not exist")
+        if not slug:
+            return self.error("Post slug is required")
+
+        # Buffered mode: count in Redis, sync_clicks_to_db writes in bulk.
+        # The new count isn't known until then, so "clicks" is null.
+        # If Redis is unavailable the click is written directly instead
+        if settings.BLOG_BUFFERED_CLICKS and record_post_clicks([get_post_id(slug)]):
+            return self.response({"message": "Click recorded successfully", "clicks": None})
 
         try:
-            post_analytics, created = PostAnalytics.objects.get_or_create(post=post)
-            post_analytics.increment_click()
+            # One UPDATE: clicks = clicks + 1 and the new click_through_rate, then the new count
+            analytics = PostAnalytics.objects.filter(post__slug=slug, post__status="published")
+            updated = increment_counters(analytics, clicks=1, returning=("post_id", "clicks"))
+            if not updated:
+                # Posts created before analytics existed have no row yet
+                try:
+                    post = Post.postobjects.get(slug=slug)
+                except Post.DoesNotExist:
+                    raise NotFound(detail="The requested post does not exist")
+                post_analytics, created = PostAnalytics.objects.get_or_create(post=post)
+                post_analytics.increment_click()
+                updated = [(post.id, post_analytics.clicks)]
+        except NotFound:
+            raise
         except Exception as e:
             raise APIException(
                 detail=f"An error ocurred while updating post analytics: {str(e)}"
             )
 
+        post_id, clicks = updated[0]
+        # The hourly/daily rollup share, flushed by sync_clicks_to_db
+        record_counters(POST, CLICK_ROLLUPS, [post_id])
+
         return self.response(
             {
                 "message": "Click incremented successfully",
-                "clicks": post_analytics.clicks,
+                "clicks": clicks,
             }
         )
 
-class CategoryListView(StandardAPIView):
+class CategoryListView(ConditionalGetMixin, StandardAPIView):
     permission_classes = [HasValidAPIKey]
+
+    def get_rate_limit_scope(self, request):
+        return "search" if request.query_params.get("search", "").strip() else None
     
     def get(self, request):
         
         try:
             parent_slug = request.query_params.get("parent_slug", None)
             search = request.query_params.get("search", "").strip()
-            page = request.query_params.get("p", 1)
             sorting = request.query_params.get("sorting", None)
             ordering = request.query_params.get("ordering", None)
 
 
-            cache_key = f'category_list:{page}:{search}:{sorting}:{ordering}:{parent_slug}'
-            cached_categories = cache.get(cache_key)
+            generations = get_generations(*category_list_namespaces(sorting))
+            not_modified = self.not_modified(request, *generations.values())
+            if not_modified:
+                return not_modified
 
-            if cached_categories:
-                serialized_cateogries = CategoryListSerializer(cached_categories, many=True).data
-                
-                for category in cached_categories:
-                    redis_client.incr(f"category:impressions:{category.id}")
-                return self.paginate(request, serialized_cateogries)
-
-            if parent_slug:
-                categories = Category.objects.filter(parent__slug=parent_slug).prefetch_related(Prefetch("category_analytics", to_attr="analytics_cache"))
-            else:
-                categories = Category.objects.filter(parent__isnull=True).prefetch_related(Prefetch("category_analytics", to_attr="analytics_cache"))
-            
-            if not categories.exists():
-                raise NotFound(detail="No categories found")
+            cache_key = category_list_key(search, sorting, ordering, parent_slug, *generations.values())
+            serialized_categories = cache.get(cache_key)
 
-            # If not in cache, fetch from database
-            if search != "":
-                categories = categories.filter(
-                    Q(title__icontains=search) | 
-                    Q(name__icontains=search) |
-                    Q(slug__icontains=search) |
-                    Q(description__icontains=search) 
+            if serialized_categories is None:
+                # If not in cache, fetch from database, only the columns CategoryListSerializer reads
+                categories, all_categories = filter_categories(
+                    parent_slug, search, sorting, ordering, CategoryListSerializer.Meta.fields
                 )
-                
-            #aplly sorting
-            if sorting:
-                if sorting == "newest":
-                    posts = posts.order_by("-created_at")
-                elif sorting == "recently_updated":
-                    posts = posts.order_by("-updated_at")
-                elif sorting == "oldest":
-                    posts = posts.order_by("created_at")
-                elif sorting == "most_viewed":
-                    posts = posts.annotate(popularity=F("analytics_cache__views")).order_by("-popularity")
-            
-            #aplly ordering
-            if ordering:
-                if ordering == "asc":
-                    posts = posts.order_by("name")
-                elif ordering == "desc":
-                    posts = posts.order_by("-name")        
-                                  
+
+                if getattr(settings, "BLOG_FAST_LIST_SERIALIZERS", True):
+                    serialized_categories = category_list_rows(categories)
+                else:
+                    serialized_categories = [dict(category) for category in CategoryListSerializer(categories, many=True).data]
+
+                # only an empty result pays for the "any categories at all" check
+                if not serialized_categories and (search == "" or not all_categories.exists()):
+                    raise NotFound(detail="No categories found")
+
+                cache.set(cache_key, serialized_categories, timeout=LIST_CACHE_TIMEOUT)
             
-            cache.set(cache_key, categories, timeout=60 * 5)
+            response = self.paginate(request, serialized_categories)
             
-            serialized_cateogries = CategoryListSerializer(categories, many=True).data
+            if response.data["success"]:
+                record_category_impressions(category["id"] for category in response.data["results"])
             
-            for category in categories:
-                redis_client.incr(f"category:impressions:{category.id}")
+            return response
 
+        except NotFound:
+            raise
         except Exception as e:
             raise APIException(detail=str(e))
                
 class IncrementCategoryClickView(StandardAPIView):
     permission_classes = [HasValidAPIKey]
+    rate_limit_scope = "analytics"
 
     def post(self, request):
         """Incrementa el contador de clics de un categoria basado en su slug."""
 
-        data = request.data
+        slug = request.data.get("slug")
 
-        try:
-            category = Category.objects.get(slug=data["slug"])
-        except Category.DoesNotExist:
-            raise NotFound(detail="The requested category does not exist")
+        if not slug:
+            return self.error("Category slug is required")
+
+        # Buffered mode: count in Redis, sync_category_clicks_to_db writes in bulk.
+        # The new count isn't known until then, so "clicks" is null.
+        # If Redis is unavailable the click is written directly instead
+        if settings.BLOG_BUFFERED_CLICKS and record_category_clicks([get_category_id(slug)]):
+            return self.response({"message": "Click recorded successfully", "clicks": None})
 
         try:
-            category_analytics, created = CategoryAnalytics.objects.get_or_create(category=category)
-            category_analytics.increment_click()
+            # One UPDATE: clicks = clicks + 1 and the new click_through_rate, then the new count
+            analytics = CategoryAnalytics.objects.filter(category__slug=slug)
+            updated = increment_counters(analytics, clicks=1, returning=("category_id", "clicks"))
+            if not updated:
+                # Categories created before analytics existed have no row yet
+                category = Category.objects.filter(slug=slug).first()
+                if category is None:
+                    raise NotFound(detail="The requested category does not exist")
+                category_analytics, created = CategoryAnalytics.objects.get_or_create(category=category)
+                category_analytics.increment_click()
+                updated = [(category.id, category_analytics.clicks)]
+        except NotFound:
+            raise
         except Exception as e:
             raise APIException(
                 detail=f"An error ocurred while updating category analytics: {str(e)}"
             )
 
+        category_id, clicks = updated[0]
+        # The hourly/daily rollup share, flushed by sync_category_clicks_to_db
+        record_counters(CATEGORY, CLICK_ROLLUPS, [category_id])
+
         return self.response(
             {
                 "message": "Click incremented successfully",
-                "clicks": category_analytics.clicks,
+                "clicks": clicks,
             }
         )
 
-class CategoryDetailView(StandardAPIView):
+class CategoryDetailView(PostIDListAPIView):
     permission_classes = [HasValidAPIKey]
     
     def get(self, request):
         
         try:
             slug = request.query_params.get("slug", None)
-            page = request.query_params.get("p", 1)
             
             if not slug:
-                raise self.error(detail="Category slug is required")
-            
-            #construir cache key
-            cache_key = f'category_post:{slug}:{page}'
-            cached_post = cache.get(cache_key)
+                return self.error("Category slug is required")
             
-            if cached_post:
+            include_descendants = request.query_params.get("include_descendants", "").lower() in ("1", "true", "yes")
+            generations = get_generations(POST_LISTS, CATEGORIES, VIEW_COUNTS)
+            not_modified = self.not_modified(request, *generations.values())
+            if not_modified:
+                return not_modified
+
+            if is_cursor_request(request):
+                posts = category_posts(get_category_id(slug), include_descendants)
+                return self.paginate_posts_by_cursor(
+                    request,
+                    posts,
+                    generations,
+                    request.query_params.get("sorting", None),
+                    request.query_params.get("ordering", None),
+                )
 
-                serialized_posts = PostListSerializer(cached_post, many=True).data
-                
-                for post in cached_post:
-                    redis_client.incr(f"post:impressions:{post.id}")
-                return self.paginate(request ,cached_post)
+            #construir cache key
+            cache_key = category_posts_key(slug, generations[POST_LISTS], include_descendants)
+            post_ids = get_id_list(cache_key)
             
-            #obtener categoria por slug
-            category = get_object_or_404(Category, slug=slug)
+            if post_ids is not None:
+                return self.paginate_posts(request, post_ids, generations)
             
-            #obtener posts de la categoria
-            posts = Post.postobjects.filter(category=category).select_related('category').prefetch_related(Prefetch("post_analytics", to_attr="analytics_cache"))
+            #obtener posts de la categoria, el id de la categoria sale de la cache
+            posts = category_posts(get_category_id(slug), include_descendants)
+            post_ids = list(posts.values_list("id", flat=True))
             
-            if not posts.exists():
+            if not post_ids:
                 raise NotFound(detail="No posts found in this category")
             
-            cache.set(cache_key, posts, timeout=60 * 5)
-            
-            #serializar posts
-            serialized_posts = PostListSerializer(posts, many=True).data
-            
-            for post in posts:
-                    redis_client.incr(f"post:impressions:{post.id}")
+            post_ids = set_id_list(cache_key, post_ids)
             
-            return self.paginate(request, serialized_posts)
+            return self.paginate_posts(request, post_ids, generations)
         
+        except (APIException, Http404):
+            raise
         except Exception as e:
-            raise APIException(detail=str(e))
\ No newline at end of file
+            raise APIException(detail=str(e))
+
+class CategoryTreeView(ConditionalGetMixin, StandardAPIView):
+    permission_classes = [HasValidAPIKey]
+
+    def get(self, request):
+        """Todo el arbol de categorias, construido con una sola consulta y cacheado."""
+
+        generations = get_generations(CATEGORIES, POST_LISTS)
+        not_modified = self.not_modified(request, *generations.values())
+        if not_modified:
+            return not_modified
+
+        cache_key = category_tree_key(generations[CATEGORIES], generations[POST_LISTS])
+        tree = cache.get(cache_key)
+
+        if tree is None:
+            nodes = {}
+            tree = []
+            # Shallow levels first, so every parent is seen before its children
+            for category in Category.objects.order_by("depth", "name").values(
+                "id", "name", "slug", "parent_id", "published_post_count", "subtree_post_count"
+            ):
+                node = {
+                    "id": str(category["id"]),
+                    "name": category["name"],
+                    "slug": category["slug"],
+                    "published_post_count": category["published_post_count"],
+                    "subtree_post_count": category["subtree_post_count"],
+                    "children": [],
+                }
+                nodes[category["id"]] = node
+                siblings = nodes[category["parent_id"]]["children"] if category["parent_id"] else tree
+                siblings.append(node)
+            cache.set(cache_key, tree, timeout=CACHE_TIMEOUT)
+
+        return self.response(tree)
+
+def parse_moment(value):
+    # Accepts ISO dates or datetimes for the analytics series endpoints
+    if not value:
+        return None
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValueError(value)
+            moment = datetime.datetime.combine(day, datetime.time.min)
+    except ValueError:
+        raise ParseError(detail=f"Invalid date: {value}")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+class PostAnalyticsView(StandardAPIView):
+    permission_classes = [HasValidAPIKey]
+
+    def get(self, request):
+        """Hourly or daily views, unique views, impressions and clicks of a post."""
+
+        slug = request.query_params.get("slug", None)
+        period = request.query_params.get("period", "day")
+
+        if not slug:
+            return self.error("Post slug is required")
+        if period not in PERIODS:
+            return self.error("Period must be 'hour' or 'day'")
+
+        start = parse_moment(request.query_params.get("start"))
+        end = parse_moment(request.query_params.get("end"))
+
+        return self.response(get_series(POST, get_post_id(slug), period, start, end))
+
+class CategoryAnalyticsView(StandardAPIView):
+    permission_classes = [HasValidAPIKey]
+
+    def get(self, request):
+        """Hourly or daily views, unique views, impressions and clicks of a category."""
+
+        slug = request.query_params.get("slug", None)
+        period = request.query_params.get("period", "day")
+
+        if not slug:
+            return self.error("Category slug is required")
+        if period not in PERIODS:
+            return self.error("Period must be 'hour' or 'day'")
+
+        start = parse_moment(request.query_params.get("start"))
+        end = parse_moment(request.query_params.get("end"))
+
+        return self.response(get_series(CATEGORY, get_category_id(slug), period, start, end))
+
+class AnalyticsEventsView(StandardAPIView):
+    permission_classes = [HasValidAPIKey]
+    rate_limit_scope = "analytics"
+
+    event_types = (POST, CATEGORY)
+    event_counters = {"click": CLICKS, "impression": IMPRESSIONS}
+
+    def post(self, request):
+        """
+        Record a batch of clicks, impressions and views.
+
+        Expects a list of ``{"type": "post"|"category", "event":
+        "click"|"impression"|"view", "id" or "slug", "timestamp"}`` objects.
+        Every event is counted through Redis in one pipeline; invalid or
+        unknown events are skipped and reported as rejected.
+        """
+
+        events = request.data.get("events") if isinstance(request.data, dict) else request.data
+        max_events = getattr(settings, "BLOG_MAX_ANALYTICS_EVENTS", 500)
+
+        if not isinstance(events, list):
+            return self.error("A list of events is required")
+        if len(events) > max_events:
+            return self.error(f"At most {max_events} events can be sent at once")
+
+        valid, slugs, object_ids = self.validate_events(events)
+        ids = {kind: resolve_ids(kind, kind_slugs) if kind_slugs else {} for kind, kind_slugs in slugs.items()}
+        known = {kind: existing_ids(kind, kind_ids) if kind_ids else set() for kind, kind_ids in object_ids.items()}
+
+        ip_address = get_client_ip(request)
+        counters, views = [], []
+        for kind, event, object_id, slug, timestamp in valid:
+            if slug:
+                object_id = ids[kind].get(slug)
+            elif object_id not in known[kind]:
+                object_id = None
+            if object_id is None:
+                continue
+            if event == "view":
+                views.append((kind, object_id, ip_address))
+            else:
+                counters.append((kind, self.event_counters[event], object_id, timestamp))
+
+        try:
+            record_events(counters, views)
+        except redis.RedisError as e:
+            raise APIException(detail=f"Analytics are unavailable: {e}")
+
+        accepted = len(counters) + len(views)
+        return self.response({"accepted": accepted, "rejected": len(events) - accepted})
+
+    def validate_events(self, events):
+        # Shape checks only, slugs and IDs are looked up in bulk afterwards
+        valid = []
+        slugs = {kind: set() for kind in self.event_types}
+        object_ids = {kind: set() for kind in self.event_types}
+        for event in events:
+            if not isinstance(event, dict):
+                continue
+            kind, name = event.get("type"), event.get("event")
+            if kind not in self.event_types or (name != "view" and name not in self.event_counters):
+                continue
+
+            object_id, slug = event.get("id"), event.get("slug")
+            try:
+                timestamp = parse_event_timestamp(event.get("timestamp"))
+                if object_id is not None:
+                    object_id, slug = str(uuid.UUID(str(object_id))), None
+                elif not isinstance(slug, str) or not slug:
+                    continue
+            except ValueError:
+                continue
+
+            if slug:
+                slugs[kind].add(slug)
+            else:
+                object_ids[kind].add(object_id)
+            valid.append((kind, name, object_id, slug, timestamp))
+        return valid, slugs, object_ids
+
+class PostExportView(StandardAPIView):
+    permission_classes = [HasValidAPIKey, IsAdminUser]
+
+    def get(self, request):
+        """Every category, post and heading as NDJSON, streamed (see apps.blog.transfer)."""
+        response = StreamingHttpResponse(export_ndjson(), content_type="application/x-ndjson")
+        response["Content-Disposition"] = 'attachment; filename="posts.ndjson"'
+        return response
@@ -15,8 +15,14 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 django_asgi_app = get_asgi_application()
 
-from channels.routing import ProtocolTypeRouter
+from channels.routing import ProtocolTypeRouter, URLRouter
+from channels.security.websocket import OriginValidator
+from django.conf import settings
+
+from apps.blog.routing import websocket_urlpatterns
 
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
+    # Live analytics, see apps.blog.consumers
+    "websocket": OriginValidator(URLRouter(websocket_urlpatterns), settings.CHANNELS_ALLOWED_ORIGINS),
 })
@@ -0,0 +1,75 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from whitenoise.middleware import WhiteNoiseMiddleware as BaseWhiteNoiseMiddleware
+
+from .ratelimit import record_latency
+
+
+class APIUsageMiddleware:
+    """
+    Measure the latency of every API key request.
+
+    Nothing is sent to Redis here: latencies are buffered in the process and
+    travel with the key's next rate limit check (see core.ratelimit).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.monotonic()
+        response = self.get_response(request)
+        self.record(request, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.monotonic()
+        response = await self.get_response(request)
+        self.record(request, started)
+        return response
+
+    def record(self, request, started):
+        api_key = request.headers.get('API-Key')
+        if api_key and api_key in getattr(settings, 'VALID_API_KEYS', []):
+            record_latency(api_key, (time.monotonic() - started) * 1000)
+
+
+class WhiteNoiseMiddleware(BaseWhiteNoiseMiddleware):
+    """
+    WhiteNoise that can also run in an async middleware chain.
+
+    The stock middleware is sync only, under ASGI Django would then push every
+    request through a thread. Here only static files are served from a thread,
+    everything else stays on the event loop.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve, thread_sensitive=False)(static_file, request)
+        return await self.get_response(request)
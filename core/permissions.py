@@ -1,12 +1,36 @@
 from rest_framework import permissions
+from rest_framework.exceptions import Throttled
 from django.conf import settings
 
+from .ratelimit import check_rate_limit
+
 class HasValidAPIKey(permissions.BasePermission):
     """
     Custom permission to check if the request has a valid API key.
     The API key is expected to be provided in the 'Authorization' header.
+
+    Valid keys are also rate limited (see core.ratelimit): every request is
+    charged to the key's global bucket and to the bucket of the view's
+    ``rate_limit_scope`` (or ``get_rate_limit_scope(request)``), and gets a
+    429 with Retry-After once either is empty.
     """
 
     def has_permission(self, request, view):
         api_key = request.headers.get('API-Key')
-        return api_key in getattr(settings, 'VALID_API_KEYS', [])
\ No newline at end of file
+        if api_key not in getattr(settings, 'VALID_API_KEYS', []):
+            return False
+
+        # The browsable API checks permissions again while rendering, on a clone
+        # of the request: the outcome is kept on the HttpRequest they share so
+        # a request is only ever charged once
+        http_request = getattr(request, '_request', request)
+        if not hasattr(http_request, '_api_key_wait'):
+            if hasattr(view, 'get_rate_limit_scope'):
+                scope = view.get_rate_limit_scope(request)
+            else:
+                scope = getattr(view, 'rate_limit_scope', None)
+            http_request._api_key_wait = check_rate_limit(api_key, scope)
+
+        if http_request._api_key_wait:
+            raise Throttled(wait=http_request._api_key_wait)
+        return True
@@ -0,0 +1,147 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+
+import redis
+from django.conf import settings
+
+from .redis import get_async_redis, get_redis
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCOPE = "default"
+USAGE_BUCKET_SECONDS = 60
+USAGE_FIELDS = ("requests", "throttled", "latency_count", "latency_ms")
+
+# Token buckets for every scope a request is charged to, refilled lazily.
+# Nothing is taken unless every bucket has a token, the usage counters (and
+# latencies measured by APIUsageMiddleware since the last call) go into the
+# same script, so a request costs exactly one round trip.
+#
+# KEYS: bucket keys..., usage hash
+# ARGV: now (ms), key id, pending latency count, pending latency ms,
+#       then rate (tokens/s) and burst of each bucket
+TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local key_id = ARGV[2]
+local buckets = #KEYS - 1
+local usage = KEYS[buckets + 1]
+local wait = 0
+local tokens = {}
+
+for i = 1, buckets do
+  local rate = tonumber(ARGV[3 + i * 2])
+  local burst = tonumber(ARGV[4 + i * 2])
+  local state = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+  local available = tonumber(state[1]) or burst
+  local updated = tonumber(state[2]) or now
+  available = math.min(burst, available + math.max(0, now - updated) * rate / 1000)
+  if available < 1 then
+    wait = math.max(wait, (1 - available) * 1000 / rate)
+  end
+  tokens[i] = available
+end
+
+redis.call('HINCRBY', usage, key_id .. ':requests', 1)
+if tonumber(ARGV[3]) > 0 then
+  redis.call('HINCRBY', usage, key_id .. ':latency_count', ARGV[3])
+  redis.call('HINCRBY', usage, key_id .. ':latency_ms', ARGV[4])
+end
+redis.call('EXPIRE', usage, 86400)
+
+if wait > 0 then
+  redis.call('HINCRBY', usage, key_id .. ':throttled', 1)
+  return math.ceil(wait)
+end
+
+for i = 1, buckets do
+  local rate = tonumber(ARGV[3 + i * 2])
+  local burst = tonumber(ARGV[4 + i * 2])
+  redis.call('HSET', KEYS[i], 'tokens', tostring(tokens[i] - 1), 'ts', now)
+  redis.call('PEXPIRE', KEYS[i], math.ceil(burst / rate * 1000) + 1000)
+end
+return 0
+"""
+
+# Latencies measured in this process, sent along with the key's next check
+_pending_latency = defaultdict(lambda: [0, 0])
+_pending_lock = threading.Lock()
+
+
+def key_id(api_key):
+    # API keys are secrets, Redis only ever sees a digest
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def usage_key(bucket):
+    return f"api_usage:minute:{bucket}"
+
+
+def get_limits(api_key, scope=None):
+    """
+    Return ``[(scope, rate, burst)]`` for the buckets a request is charged to.
+
+    API_RATE_LIMITS holds the defaults per scope and API_KEY_QUOTAS the
+    overrides of each key, both as ``{scope: {"rate": ..., "burst": ...}}``.
+    A scope without a limit is simply not checked.
+    """
+    defaults = getattr(settings, "API_RATE_LIMITS", {})
+    overrides = getattr(settings, "API_KEY_QUOTAS", {}).get(api_key, {})
+    limits = []
+    for name in dict.fromkeys((DEFAULT_SCOPE, scope or DEFAULT_SCOPE)):
+        limit = overrides.get(name, defaults.get(name))
+        if limit and limit.get("rate"):
+            limits.append((name, float(limit["rate"]), float(limit.get("burst", limit["rate"]))))
+    return limits
+
+
+def token_bucket_call(api_key, scope=None):
+    # keys and args of the TOKEN_BUCKET_SCRIPT call that charges one request
+    limits = get_limits(api_key, scope)
+    identifier = key_id(api_key)
+    with _pending_lock:
+        latency_count, latency_ms = _pending_latency.pop(identifier, (0, 0))
+
+    keys = [f"api_rate:{identifier}:{name}" for name, rate, burst in limits]
+    keys.append(usage_key(int(time.time() // USAGE_BUCKET_SECONDS)))
+    args = [int(time.time() * 1000), identifier, latency_count, latency_ms]
+    for name, rate, burst in limits:
+        args.extend((rate, burst))
+    return keys, args
+
+
+def check_rate_limit(api_key, scope=None):
+    """
+    Charge one request to ``api_key`` and return the seconds to wait (0 if allowed).
+
+    Redis errors never block requests, they are logged and the request goes through.
+    """
+    keys, args = token_bucket_call(api_key, scope)
+    try:
+        wait_ms = get_redis().register_script(TOKEN_BUCKET_SCRIPT)(keys=keys, args=args)
+    except redis.RedisError as e:
+        logger.warning(f"Rate limiting unavailable: {e}")
+        return 0
+    return math.ceil(int(wait_ms) / 1000)
+
+
+async def acheck_rate_limit(api_key, scope=None):
+    """check_rate_limit for async views, the same script through redis.asyncio."""
+    keys, args = token_bucket_call(api_key, scope)
+    try:
+        script = get_async_redis().register_script(TOKEN_BUCKET_SCRIPT)
+        wait_ms = await script(keys=keys, args=args)
+    except redis.RedisError as e:
+        logger.warning(f"Rate limiting unavailable: {e}")
+        return 0
+    return math.ceil(int(wait_ms) / 1000)
+
+
+def record_latency(api_key, milliseconds):
+    with _pending_lock:
+        pending = _pending_latency[key_id(api_key)]
+        pending[0] += 1
+        pending[1] += int(milliseconds)
@@ -0,0 +1,193 @@
+import asyncio
+import threading
+import time
+import weakref
+from collections import defaultdict
+from itertools import islice
+
+import redis
+import redis.asyncio
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+# One place for the Redis connections of the app code (analytics, rate
+# limits, live counters). Every client has socket and connect timeouts and
+# a bounded pool: when Redis stalls, callers fail fast with a RedisError
+# (which they already treat as "Redis is unavailable") instead of piling up
+# threads waiting on a dead socket.
+
+_lock = threading.Lock()
+_clients = {}
+# asyncio connections belong to the event loop that opened them, so every
+# loop (one per uvicorn worker, a fresh one per async_to_sync call) gets its
+# own clients, dropped with the loop
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def default_redis_url():
+    return getattr(settings, "REDIS_CLIENT_URL", None) or f"redis://{settings.REDIS_HOST}:6379/0"
+
+
+def pool_options():
+    return {
+        "max_connections": getattr(settings, "REDIS_MAX_CONNECTIONS", 50),
+        # Seconds to wait for a free connection once the pool is exhausted
+        "timeout": getattr(settings, "REDIS_POOL_TIMEOUT", 1),
+        "socket_timeout": getattr(settings, "REDIS_SOCKET_TIMEOUT", 2),
+        "socket_connect_timeout": getattr(settings, "REDIS_SOCKET_CONNECT_TIMEOUT", 1),
+        "health_check_interval": getattr(settings, "REDIS_HEALTH_CHECK_INTERVAL", 30),
+    }
+
+
+class CommandStats:
+    """Calls, errors and latency per Redis command, for this process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.commands = defaultdict(lambda: {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+
+    def record(self, command, started, failed=False):
+        milliseconds = (time.perf_counter() - started) * 1000
+        with self.lock:
+            stats = self.commands[command]
+            stats["calls"] += 1
+            stats["errors"] += failed
+            stats["total_ms"] += milliseconds
+            stats["max_ms"] = max(stats["max_ms"], milliseconds)
+
+    def snapshot(self, reset=False):
+        with self.lock:
+            commands = {command: dict(stats) for command, stats in self.commands.items()}
+            if reset:
+                self.commands.clear()
+        for stats in commands.values():
+            stats["avg_ms"] = round(stats["total_ms"] / stats["calls"], 3) if stats["calls"] else 0
+            stats["total_ms"], stats["max_ms"] = round(stats["total_ms"], 3), round(stats["max_ms"], 3)
+        return commands
+
+
+command_stats = CommandStats()
+
+
+def command_name(args):
+    name = args[0] if args else "UNKNOWN"
+    return (name.decode("utf-8") if isinstance(name, bytes) else str(name)).upper()
+
+
+def pipeline_name(pipe):
+    # A pipeline is one round trip, it is timed as a whole
+    return "MULTI" if pipe.transaction else "PIPELINE"
+
+
+class Redis(redis.Redis):
+    def execute_command(self, *args, **options):
+        started, failed = time.perf_counter(), True
+        try:
+            result = super().execute_command(*args, **options)
+            failed = False
+            return result
+        finally:
+            command_stats.record(command_name(args), started, failed)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return Pipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class Pipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error=True):
+        started, failed = time.perf_counter(), True
+        try:
+            result = super().execute(raise_on_error)
+            failed = False
+            return result
+        finally:
+            command_stats.record(pipeline_name(self), started, failed)
+
+
+class AsyncRedis(redis.asyncio.Redis):
+    async def execute_command(self, *args, **options):
+        started, failed = time.perf_counter(), True
+        try:
+            result = await super().execute_command(*args, **options)
+            failed = False
+            return result
+        finally:
+            command_stats.record(command_name(args), started, failed)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return AsyncPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class AsyncPipeline(redis.asyncio.client.Pipeline):
+    async def execute(self, raise_on_error=True):
+        started, failed = time.perf_counter(), True
+        try:
+            result = await super().execute(raise_on_error)
+            failed = False
+            return result
+        finally:
+            command_stats.record(pipeline_name(self), started, failed)
+
+
+def get_redis(url=None):
+    """Return the client for ``url`` (the default Redis without one), shared by every thread."""
+    url = url or default_redis_url()
+    client = _clients.get(url)
+    if client is None:
+        with _lock:
+            if url not in _clients:
+                # Extra pool arguments of the sync clients, e.g. a stand-in connection class
+                extra = getattr(settings, "REDIS_CONNECTION_POOL_KWARGS", {})
+                pool = redis.BlockingConnectionPool.from_url(url, **pool_options(), **extra)
+                _clients[url] = Redis(connection_pool=pool)
+            client = _clients[url]
+    return client
+
+
+def get_async_redis(url=None):
+    """Return the asyncio Redis client for ``url`` of the running event loop."""
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    url = url or default_redis_url()
+    if url not in clients:
+        pool = redis.asyncio.BlockingConnectionPool.from_url(url, **pool_options())
+        clients[url] = AsyncRedis(connection_pool=pool)
+    return clients[url]
+
+
+@receiver(setting_changed)
+def reset_clients(setting, **kwargs):
+    # override_settings of the Redis settings must not keep the old pools
+    if setting.startswith("REDIS_"):
+        with _lock:
+            _clients.clear()
+        _async_clients.clear()
+
+
+def get_command_stats(reset=False):
+    """``{command: {calls, errors, total_ms, max_ms, avg_ms}}`` measured in this process."""
+    return command_stats.snapshot(reset)
+
+
+def batches(items, size):
+    items = iter(items)
+    while batch := list(islice(items, size)):
+        yield batch
+
+
+def pipelined(client, items, queue, batch_size=None, transaction=False):
+    """
+    Run ``queue(pipe, item)`` for every item and return the replies of each item.
+
+    ``queue`` adds the commands of one item and returns how many it added.
+    Items are sent ``batch_size`` (REDIS_PIPELINE_BATCH_SIZE) at a time, so a
+    large batch never builds one huge request or reply in memory.
+    """
+    replies = []
+    for batch in batches(items, batch_size or getattr(settings, "REDIS_PIPELINE_BATCH_SIZE", 1000)):
+        pipe = client.pipeline(transaction=transaction)
+        sizes = [queue(pipe, item) for item in batch]
+        results = iter(pipe.execute())
+        replies.extend(list(islice(results, size)) for size in sizes)
+    return replies
+
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
 import environ
+from celery.schedules import crontab
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -69,13 +70,14 @@ CKEDITOR_UPLOAD_PATH = "media/"
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'core.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.APIUsageMiddleware',
 ]
 
 ROOT_URLCONF = 'core.urls'
@@ -176,16 +178,83 @@ CHANNEL_LAYERS = {
 }
 
 REDIS_HOST = env("REDIS_HOST")
-CACHE = {
+
+# Redis of analytics, rate limits and live counters (core.redis). Timeouts are in seconds and
+# also apply to the cache, so a stalled Redis fails requests fast instead of holding threads
+REDIS_CLIENT_URL = env.str("REDIS_CLIENT_URL", default=f"redis://{REDIS_HOST}:6379/0")
+REDIS_MAX_CONNECTIONS = env.int("REDIS_MAX_CONNECTIONS", default=50)
+REDIS_POOL_TIMEOUT = env.float("REDIS_POOL_TIMEOUT", default=1)
+REDIS_SOCKET_TIMEOUT = env.float("REDIS_SOCKET_TIMEOUT", default=2)
+REDIS_SOCKET_CONNECT_TIMEOUT = env.float("REDIS_SOCKET_CONNECT_TIMEOUT", default=1)
+REDIS_HEALTH_CHECK_INTERVAL = env.int("REDIS_HEALTH_CHECK_INTERVAL", default=30)
+REDIS_PIPELINE_BATCH_SIZE = env.int("REDIS_PIPELINE_BATCH_SIZE", default=1000)
+
+# Postgres text search configuration used for Post.search_vector
+BLOG_SEARCH_CONFIG = env.str("BLOG_SEARCH_CONFIG", default="english")
+
+CACHES = {
   "default": {
       "BACKEND": "django_redis.cache.RedisCache",
       "LOCATION": env("REDIS_URL"),
       "OPTIONS": {
           "CLIENT_CLASS": "django_redis.client.DefaultClient",
+          # Counted in the per-command latency stats of core.redis
+          "REDIS_CLIENT_CLASS": "core.redis.Redis",
+          "SOCKET_TIMEOUT": REDIS_SOCKET_TIMEOUT,
+          "SOCKET_CONNECT_TIMEOUT": REDIS_SOCKET_CONNECT_TIMEOUT,
+          "CONNECTION_POOL_CLASS": "redis.BlockingConnectionPool",
+          "CONNECTION_POOL_KWARGS": {"max_connections": REDIS_MAX_CONNECTIONS, "timeout": REDIS_POOL_TIMEOUT},
       },
   }
 }
 
+# Token bucket per API key and scope (tokens per second, bucket size), see core.ratelimit.
+# API_KEY_QUOTAS overrides them per key: {"<key>": {"default": {"rate": 50, "burst": 200}}}
+API_RATE_LIMITS = {
+    "default": {"rate": 20, "burst": 100},
+    "search": {"rate": 5, "burst": 20},
+    "analytics": {"rate": 10, "burst": 50},
+}
+API_KEY_QUOTAS = env.json("API_KEY_QUOTAS", default={})
+
+# Blog caches are invalidated by generation counters, so this is only an upper bound
+BLOG_CACHE_TIMEOUT = env.int("BLOG_CACHE_TIMEOUT", default=60 * 60 * 6)
+# Cached view counts (and most_viewed orderings) are refreshed at most this often
+BLOG_VIEW_COUNT_MAX_AGE = env.int("BLOG_VIEW_COUNT_MAX_AGE", default=60 * 5)
+
+# Count clicks in Redis and let the sync_*clicks_to_db tasks write them in bulk.
+# The click endpoints then answer with "clicks": null, the count isn't known yet
+BLOG_BUFFERED_CLICKS = env.bool("BLOG_BUFFERED_CLICKS", default=False)
+
+# Build list payloads from values() rows instead of DRF serializers (same output)
+BLOG_FAST_LIST_SERIALIZERS = env.bool("BLOG_FAST_LIST_SERIALIZERS", default=True)
+
+# Serve the read endpoints with the async views of apps.blog.async_views (ASGI deployments)
+BLOG_ASYNC_VIEWS = env.bool("BLOG_ASYNC_VIEWS", default=False)
+
+# Largest batch accepted by analytics/events/, and how far back client timestamps may go
+BLOG_MAX_ANALYTICS_EVENTS = env.int("BLOG_MAX_ANALYTICS_EVENTS", default=500)
+BLOG_ANALYTICS_EVENT_MAX_AGE = env.int("BLOG_ANALYTICS_EVENT_MAX_AGE", default=60 * 60)
+
+# Unique view counting: "exact" (database), "hyperloglog" or "bloom" (Redis)
+BLOG_VIEW_DEDUP_BACKEND = env.str("BLOG_VIEW_DEDUP_BACKEND", default="exact")
+BLOG_VIEW_BLOOM_CAPACITY = env.int("BLOG_VIEW_BLOOM_CAPACITY", default=10000)
+BLOG_VIEW_BLOOM_ERROR_RATE = env.float("BLOG_VIEW_BLOOM_ERROR_RATE", default=0.01)
+
+# Views are appended to a capped Redis stream and drained in batches by sync_view_events_to_db
+BLOG_VIEW_STREAM_MAXLEN = env.int("BLOG_VIEW_STREAM_MAXLEN", default=1_000_000)
+BLOG_VIEW_STREAM_BATCH_SIZE = env.int("BLOG_VIEW_STREAM_BATCH_SIZE", default=5000)
+BLOG_VIEW_STREAM_TIME_BUDGET = env.int("BLOG_VIEW_STREAM_TIME_BUDGET", default=50)
+
+# Live analytics over WebSockets (apps.blog.live): one message per subscription per interval at most
+BLOG_LIVE_ANALYTICS_INTERVAL_MS = env.int("BLOG_LIVE_ANALYTICS_INTERVAL_MS", default=1000)
+BLOG_LIVE_ANALYTICS_MAX_SUBSCRIPTIONS = env.int("BLOG_LIVE_ANALYTICS_MAX_SUBSCRIPTIONS", default=50)
+
+# Responsive thumbnails (apps.blog.thumbnails), resized by Celery next to the original image
+BLOG_THUMBNAIL_WIDTHS = env.list("BLOG_THUMBNAIL_WIDTHS", cast=int, default=[320, 640, 1024])
+BLOG_THUMBNAIL_FORMATS = env.list("BLOG_THUMBNAIL_FORMATS", default=["webp", "jpeg"])
+BLOG_THUMBNAIL_QUALITY = env.int("BLOG_THUMBNAIL_QUALITY", default=80)
+
 CHANNELS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
 ]   
@@ -199,6 +268,7 @@ CELERY_BROKER_URL = env("REDIS_URL")
 CELERY_BROKER_TRANSPORT_OPTIONS = {
   'visibility_timeout': 3600,
   'socket_timeout': 5,
+  'socket_connect_timeout': REDIS_SOCKET_CONNECT_TIMEOUT,
   'retry_on_timeout': True,
 }
 CELERY_RESULT_BACKEND = 'django-db'
@@ -209,4 +279,44 @@ CELERY_IMPORTS = (
 )
 
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
-CELERY_BEAT_SCHEDULE = {}
\ No newline at end of file
+# Views, impressions and buffered clicks only reach the database through
+# these flushes. The DatabaseScheduler copies the entries into its table
+CELERY_BEAT_SCHEDULE = {
+  'sync-view-events': {
+    'task': 'apps.blog.tasks.sync_view_events_to_db',
+    'schedule': 30.0,
+  },
+  'sync-impressions': {
+    'task': 'apps.blog.tasks.sync_impressions_to_db',
+    'schedule': 60.0,
+  },
+  'sync-clicks': {
+    'task': 'apps.blog.tasks.sync_clicks_to_db',
+    'schedule': 60.0,
+  },
+  'sync-category-impressions': {
+    'task': 'apps.blog.tasks.sync_category_impressions_to_db',
+    'schedule': 60.0,
+  },
+  'sync-category-clicks': {
+    'task': 'apps.blog.tasks.sync_category_clicks_to_db',
+    'schedule': 60.0,
+  },
+  # Recomputes the last BLOG_ROLLUP_LOOKBACK_HOURS hours of unique views
+  'rollup-analytics': {
+    'task': 'apps.blog.tasks.rollup_analytics',
+    'schedule': crontab(minute='*/15'),
+  },
+  'compact-analytics': {
+    'task': 'apps.blog.tasks.compact_analytics',
+    'schedule': crontab(hour=4, minute=0),
+  },
+  'sync-category-post-counters': {
+    'task': 'apps.blog.tasks.sync_category_post_counters',
+    'schedule': crontab(minute=30),
+  },
+  'aggregate-api-usage': {
+    'task': 'core.tasks.aggregate_api_usage',
+    'schedule': crontab(minute='*/5'),
+  },
+}
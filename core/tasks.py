@@ -1,6 +1,9 @@
 from __future__ import absolute_import, unicode_literals
 from celery import shared_task
+from collections import Counter
+import datetime
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -10,9 +13,79 @@ import django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 django.setup()
 
+import redis
+
+from .ratelimit import USAGE_BUCKET_SECONDS, USAGE_FIELDS, usage_key
+from .redis import get_redis
+
 @shared_task
 def sample_task(x, y):
     """A simple task that adds two numbers."""
     result = x + y
     logger.info(f"Adding {x} + {y} = {result}")
-    return result
\ No newline at end of file
+    return result
+
+
+# Days of per-day usage kept in Redis
+USAGE_DAY_TTL = 60 * 60 * 24 * 90
+
+
+def fold_usage_minute(key, day):
+    """
+    Add one closed minute of usage to its day and delete the minute, in one MULTI.
+
+    The minute is WATCHed while it is read, so the day totals and the
+    delete are applied together or not at all. A failed run leaves the
+    minute for the next one. Returns the usage that was added.
+    """
+    day_key = f"api_usage:day:{day}"
+    with get_redis().pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(key)
+                usage = {field.decode("utf-8"): int(value) for field, value in pipe.hgetall(key).items()}
+                pipe.multi()
+                for field, value in usage.items():
+                    pipe.hincrby(day_key, field, value)
+                if usage:
+                    pipe.expire(day_key, USAGE_DAY_TTL)
+                pipe.delete(key)
+                pipe.execute()
+                return usage
+            except redis.WatchError:
+                # A late request touched the minute, read it again
+                continue
+
+
+@shared_task
+def aggregate_api_usage():
+    """
+    Fold the closed per-minute API usage hashes into per-day hashes.
+
+    Every minute is added to its day and deleted atomically, so a run that
+    dies halfway neither loses nor double counts a minute. Returns the
+    totals per key digest.
+    """
+    current = int(time.time() // USAGE_BUCKET_SECONDS)
+    totals = Counter()
+
+    for key in get_redis().scan_iter(match=usage_key("*"), count=1000):
+        bucket = int(key.decode("utf-8").rsplit(":", 1)[1])
+        if bucket >= current:
+            continue
+
+        day = datetime.date.fromtimestamp(bucket * USAGE_BUCKET_SECONDS).isoformat()
+        for field, value in fold_usage_minute(key, day).items():
+            totals[field] += value
+
+    summary = {}
+    for field, value in totals.items():
+        identifier, name = field.rsplit(":", 1)
+        summary.setdefault(identifier, dict.fromkeys(USAGE_FIELDS, 0))[name] += value
+    for identifier, usage in summary.items():
+        average = usage["latency_ms"] / usage["latency_count"] if usage["latency_count"] else 0
+        logger.info(
+            f"API key {identifier}: {usage['requests']} requests, {usage['throttled']} throttled, "
+            f"{average:.1f}ms average latency"
+        )
+    return summary